@@ -0,0 +1,94 @@
+"""
+Shared HTTP client for fetching data from explorers and price sources, with
+pooled connections, retries with exponential backoff, and per-host rate
+limiting.
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class TokenBucket:
+	"""
+	Allows bursts of up to `capacity` requests, refilled at `rate` requests
+	per second.
+	"""
+
+	def __init__(self, rate, capacity=1):
+		self.rate = rate
+		self.capacity = capacity
+		self._tokens = capacity
+		self._updated = time.monotonic()
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		"""
+		Take a token, blocking until one is available.
+		"""
+		with self._lock:
+			now = time.monotonic()
+			self._tokens = min(
+				self.capacity, self._tokens + (now - self._updated) * self.rate)
+			self._updated = now
+			# Take the token now, and wait until it would have been refilled
+			self._tokens -= 1
+			wait = -self._tokens / self.rate if self._tokens < 0 else 0
+		if wait:
+			time.sleep(wait)
+
+
+class HTTPClient:
+	"""
+	Sends requests through a single session, so connections to each host are
+	pooled and reused. Failed connections and responses with retryable
+	status codes are retried up to `retries` times, waiting `backoff` seconds
+	times increasing powers of two in between (or as long as the server asks
+	to). Requests to hosts in `rate_limits` are limited by a token bucket
+	each, see `settings.HTTP_RATE_LIMITS`.
+	"""
+
+	RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+	def __init__(self, retries=None, backoff=None, timeout=None, rate_limits=None):
+		self.timeout = timeout or settings.HTTP_TIMEOUT
+		self.session = requests.Session()
+		adapter = HTTPAdapter(
+			pool_maxsize=settings.HTTP_POOL_SIZE,
+			max_retries=Retry(
+				total=settings.HTTP_RETRIES if retries is None else retries,
+				backoff_factor=settings.HTTP_BACKOFF if backoff is None else backoff,
+				status_forcelist=self.RETRY_STATUSES,
+			),
+		)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		if rate_limits is None:
+			rate_limits = settings.HTTP_RATE_LIMITS
+		self.buckets = {
+			host: TokenBucket(rate, capacity)
+			for host, (rate, capacity) in rate_limits.items()
+		}
+
+	def get(self, url, **kwargs):
+		"""
+		Send a GET request, and return the response, raising an exception
+		if it failed after all retries.
+		"""
+		bucket = self.buckets.get(urlsplit(url).hostname)
+		if bucket:
+			bucket.acquire()
+		response = self.session.get(url, timeout=self.timeout, **kwargs)
+		response.raise_for_status()
+		return response
+
+	def get_json(self, url, **kwargs):
+		return self.get(url, **kwargs).json()
+
+
+client = HTTPClient()
@@ -120,3 +120,98 @@ USE_THOUSAND_SEPARATOR = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Price data
+
+# Directory for columnar candle stores of pairs, see currencio.candlestore
+CANDLE_STORE_DIR = os.path.join(BASE_DIR, 'candles')
+
+# Granularities (in seconds) of the rollup pairs derived from finer pairs
+# after each import, see currencio.rollups
+ROLLUP_GRANULARITIES = [60 * 60, 60 * 60 * 24]
+
+# Maximum age (in seconds) of the in-memory indexes of currencies, pairs and
+# their coverage, before they're reloaded to pick up changes made by other
+# processes, see currencio.indexes
+IN_MEMORY_INDEX_TTL = 60
+
+# Number of prices looked up from movement data to cache per process, by pair
+# and period, see currencio.models.Pair.price_at
+PRICE_CACHE_SIZE = 100000
+
+# Number of paths between currencies to memoise per process, by currencies
+# and interval of time, see currencio.graph.CurrencyGraph
+PATH_CACHE_SIZE = 10000
+
+# Length (in seconds) of the windows of movement data loaded into memory at a
+# time for price lookups during conversions, and the maximum size (in bytes)
+# of all windows kept loaded, see currencio.oracle
+PRICE_ORACLE_WINDOW = 60 * 60 * 24
+PRICE_ORACLE_MAX_SIZE = 64 * 1024 * 1024
+
+# Strategy used to estimate prices from movement data, one of "mid",
+# "interpolated" or "median", see currencio.strategies
+PRICE_STRATEGY = 'mid'
+
+# Currency that amounts are reported in, and the resolution (in seconds) of
+# the cross-rates to it materialised from movement data, e.g. 60 * 60 for
+# hourly rates, see currencio.crossrates. Amounts are converted at the price at
+# the time instead if None, which is slower but exact.
+REPORTING_CURRENCY = 'fiat-aud'
+CROSS_RATE_RESOLUTION = None
+
+# Longest stretch without movement data that still counts as covered by a
+# pair, in periods of its granularity, so that a few missing candles aren't
+# treated as gaps, and longer ones (in seconds) by data source, so that e.g.
+# weekends when forex markets are closed aren't either, see currencio.coverage
+COVERAGE_MAX_GAP_PERIODS = 5
+COVERAGE_MAX_GAPS = {'FXDD': 60 * 60 * 72}
+
+# Base URL of the Coinbase API that candles are imported from, see
+# currencio.importers.fetch_coinbase_candles
+COINBASE_API_URL = 'https://api.pro.coinbase.com'
+
+
+# HTTP client
+
+# Number of times failed requests are retried, the base delay (in seconds)
+# between retries, doubled after each one, the timeout (in seconds) of each
+# request, and the number of connections kept open per host, see
+# cryptoscopio.http
+HTTP_RETRIES = 5
+HTTP_BACKOFF = 0.5
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 10
+
+# Rate limits of hosts, as (requests per second, maximum burst of requests)
+HTTP_RATE_LIMITS = {
+	'blockchain.info': (1, 5),
+	'api.pro.coinbase.com': (3, 6),
+}
+
+
+# Explorers
+
+# SQLite database that explorer responses are cached in, its maximum size (in
+# bytes), and the maximum age (in seconds) of responses that may still change,
+# such as the newest page of an address's transactions, see scopio.cache
+EXPLORER_CACHE_PATH = os.path.join(BASE_DIR, 'explorer_cache.sqlite3')
+EXPLORER_CACHE_MAX_SIZE = 256 * 1024 * 1024
+EXPLORER_CACHE_MAX_AGE = 60 * 5
+
+# Number of threads fetching transactions concurrently when parsing multiple
+# addresses at once, and the number of transactions of each address fetched
+# ahead of parsing, see scopio.explorers.Explorer.fetch_addresses
+EXPLORER_WORKERS = 8
+EXPLORER_BUFFER_SIZE = 1000
+
+# Number of pages of an address's transactions fetched ahead of the one being
+# parsed, see scopio.explorers.bitcoin.BitcoinExplorer.transactions_for_address
+EXPLORER_PREFETCH_PAGES = 4
+
+# Newline-delimited JSON dumps of Bitcoin transactions read by the
+# 'bitcoin-file' explorer, and the SQLite database indexing the transactions of
+# each address in them, see scopio.dumps and the index_transaction_dumps command
+EXPLORER_DUMP_PATHS = []
+EXPLORER_DUMP_INDEX_PATH = os.path.join(BASE_DIR, 'explorer_dumps.sqlite3')
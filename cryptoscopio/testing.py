@@ -0,0 +1,25 @@
+"""
+Helpers shared by the tests of the apps.
+"""
+
+from http.server import ThreadingHTTPServer
+import threading
+
+
+def start_stub_server(test_case, handler, **attributes):
+	"""
+	Start a local HTTP server handling requests with the provided handler
+	class in a background thread, for the duration of the test case, and
+	return it. Any keyword arguments are set as attributes of the server,
+	e.g. for handlers to record requests in, and its base URL is set as
+	`url`.
+	"""
+	server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+	for name, value in attributes.items():
+		setattr(server, name, value)
+	server.url = f'http://127.0.0.1:{server.server_address[1]}'
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	test_case.addCleanup(server.server_close)
+	test_case.addCleanup(server.shutdown)
+	return server
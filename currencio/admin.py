@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Currency, MovementData, Pair
+from .models import Coverage, CrossRate, Currency, MovementData, Pair
 
 
 @admin.register(Currency)
@@ -15,3 +15,5 @@ class MovementDataAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Pair)
+admin.site.register(CrossRate)
+admin.site.register(Coverage)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CurrencioConfig(AppConfig):
     name = 'currencio'
+
+    def ready(self):
+        # Connect signal receivers
+        from . import signals
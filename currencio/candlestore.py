@@ -0,0 +1,237 @@
+"""
+Columnar, append-only store of the movement data of a pair on local disk,
+as an alternative to querying MovementData rows.
+
+Each pair that has a store gets a link named after its primary key in
+`settings.CANDLE_STORE_DIR`, to a directory containing two files:
+
+	timestamp.i8	int64 seconds since epoch, sorted
+	ohlcv.i8	int64 open, high, low, close and volume per candle,
+			scaled by `SCALE`
+
+Both are memory-mapped when read, so lookups are a bisect over the
+timestamp column, without a database query or loading the store into memory.
+
+Stores are rebuilt in a new directory, which the link is then atomically
+replaced to point to, so that other processes never see a partly built
+store, and keep reading the old one until they next check for changes.
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+import numpy
+
+
+# Number of decimal places kept for prices and volumes
+SCALE = 10 ** 8
+
+TIMESTAMP_FILE = 'timestamp.i8'
+OHLCV_FILE = 'ohlcv.i8'
+
+# Number of MovementData rows to read from the database at a time
+CHUNK_SIZE = 50000
+
+
+def _scale(value):
+	if value is None:
+		return 0
+	return int((Decimal(value) * SCALE).to_integral_value())
+
+
+class CandleStore:
+	"""
+	Memory-mapped columns of candles for a single pair. Use `for_pair` to
+	get the store for a pair, if one has been built.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self._version = None
+		self._timestamps = numpy.empty(0, dtype='<i8')
+		self._ohlcv = numpy.empty((0, 5), dtype='<i8')
+
+	@classmethod
+	def path_for_pair(cls, pair):
+		return os.path.join(settings.CANDLE_STORE_DIR, str(pair.pk))
+
+	@classmethod
+	def for_pair(cls, pair):
+		"""
+		Return the store for the provided pair, or None if there is none.
+		Stores are kept open for the lifetime of the process.
+		"""
+		store = _stores.get(pair.pk)
+		if store is None:
+			path = cls.path_for_pair(pair)
+			if not os.path.isdir(path):
+				return None
+			store = _stores[pair.pk] = cls(path)
+		return store
+
+	def _refresh(self):
+		"""
+		(Re-)map the files if they have changed since last mapped, e.g.
+		because another process has appended to them, or rebuilt the store.
+		"""
+		try:
+			self._map()
+		except FileNotFoundError:
+			# The store was rebuilt while mapping it, and the directory the
+			# link pointed to removed, so it now points to the new one
+			self._map()
+
+	def _map(self):
+		# Resolve the link once, so that both files are from the same build
+		directory = os.path.realpath(self.path)
+		stat = os.stat(os.path.join(directory, TIMESTAMP_FILE))
+		version = (directory, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+		if version == self._version:
+			return
+		count = stat.st_size // 8
+		# Guard against the columns being mid-append by another process
+		count = min(count, os.path.getsize(os.path.join(directory, OHLCV_FILE)) // 40)
+		if count:
+			self._timestamps = numpy.memmap(os.path.join(directory, TIMESTAMP_FILE),
+				dtype='<i8', mode='r', shape=(count,))
+			self._ohlcv = numpy.memmap(os.path.join(directory, OHLCV_FILE),
+				dtype='<i8', mode='r', shape=(count, 5))
+		else:
+			# Empty files can't be memory-mapped
+			self._timestamps = numpy.empty(0, dtype='<i8')
+			self._ohlcv = numpy.empty((0, 5), dtype='<i8')
+		self._version = version
+
+	def __len__(self):
+		self._refresh()
+		return len(self._timestamps)
+
+	@property
+	def latest_timestamp(self):
+		self._refresh()
+		if not len(self._timestamps):
+			return None
+		return datetime.fromtimestamp(int(self._timestamps[-1]), tz=timezone.utc)
+
+	def append(self, records):
+		"""
+		Append an iterable of (timestamp, open, high, low, close, volume)
+		tuples, as returned by `values_list` on MovementData, to the store.
+		Records must be sorted by time and later than any already stored,
+		since the store is append-only; earlier records are discarded.
+		Returns the number of records appended.
+		"""
+		latest = self.latest_timestamp
+		latest = latest.timestamp() if latest else None
+		appended = 0
+		timestamps = []
+		ohlcv = []
+		for timestamp, *values in records:
+			timestamp = int(timestamp.timestamp())
+			if latest is not None and timestamp <= latest:
+				continue
+			latest = timestamp
+			timestamps += [timestamp]
+			ohlcv += [[_scale(value) for value in values]]
+			if len(timestamps) >= CHUNK_SIZE:
+				appended += self._write(timestamps, ohlcv)
+				timestamps, ohlcv = [], []
+		if timestamps:
+			appended += self._write(timestamps, ohlcv)
+		return appended
+
+	def _write(self, timestamps, ohlcv):
+		# Write the values first, so a concurrent reader never sees a
+		# timestamp without values
+		with open(os.path.join(self.path, OHLCV_FILE), 'ab') as f:
+			f.write(numpy.array(ohlcv, dtype='<i8').tobytes())
+		with open(os.path.join(self.path, TIMESTAMP_FILE), 'ab') as f:
+			f.write(numpy.array(timestamps, dtype='<i8').tobytes())
+		return len(timestamps)
+
+	def candles_around(self, timestamp, context=0):
+		"""
+		Return a list of the (timestamp, open, high, low, close) rows of the
+		latest candle at or before the provided datetime, and `context`
+		candles either side of it, with datetimes and exact Decimals as
+		`values_list` on MovementData would return them, or None if the store
+		has no candles that early.
+		"""
+		self._refresh()
+		index = numpy.searchsorted(self._timestamps, timestamp.timestamp(), side='right') - 1
+		if index < 0:
+			return None
+		start = max(index - context, 0)
+		end = index + context + 1
+		return [
+			(datetime.fromtimestamp(seconds, tz=timezone.utc),)
+			+ tuple(Decimal(value) / SCALE for value in ohlcv[:4])
+			for seconds, ohlcv in zip(
+				self._timestamps[start:end].tolist(), self._ohlcv[start:end].tolist())
+		]
+
+
+# Open stores, by pair primary key
+_stores = {}
+
+
+def _append_records(pair, store):
+	records = pair.records.order_by('timestamp')
+	latest = store.latest_timestamp
+	if latest:
+		records = records.filter(timestamp__gt=latest)
+	return store.append(records.values_list(
+		'timestamp', 'open', 'high', 'low', 'close', 'volume',
+	).iterator(chunk_size=CHUNK_SIZE))
+
+
+def build(pair):
+	"""
+	Build a store for the provided pair from scratch, from its MovementData,
+	replacing any existing one once it's complete. Returns the store.
+	"""
+	os.makedirs(settings.CANDLE_STORE_DIR, exist_ok=True)
+	path = CandleStore.path_for_pair(pair)
+	directory = tempfile.mkdtemp(prefix=f'{pair.pk}.', dir=settings.CANDLE_STORE_DIR)
+	for name in (TIMESTAMP_FILE, OHLCV_FILE):
+		open(os.path.join(directory, name), 'wb').close()
+	try:
+		_append_records(pair, CandleStore(directory))
+	except BaseException:
+		shutil.rmtree(directory, ignore_errors=True)
+		raise
+	previous = None
+	if os.path.islink(path):
+		previous = os.path.realpath(path)
+	elif os.path.isdir(path):
+		# Stores built before they were linked to can't be replaced in place
+		shutil.rmtree(path)
+	# Renaming a new link over the existing one replaces it atomically
+	link = f'{directory}.link'
+	os.symlink(os.path.basename(directory), link)
+	os.replace(link, path)
+	if previous:
+		# Processes still mapping the old files can keep reading them
+		shutil.rmtree(previous, ignore_errors=True)
+	store = _stores[pair.pk] = CandleStore(path)
+	return store
+
+
+def sync(pair):
+	"""
+	Append any MovementData later than the latest candle in the store for the
+	provided pair. If the pair has data that can't be appended (e.g. because
+	older data was imported), the store is rebuilt. Does nothing if the pair
+	has no store. Returns the number of candles added.
+	"""
+	store = CandleStore.for_pair(pair)
+	if store is None:
+		return 0
+	appended = _append_records(pair, store)
+	if len(store) != pair.records.count():
+		return len(build(pair))
+	return appended
@@ -0,0 +1,73 @@
+"""
+In-memory index of the intervals of time covered by the movement data of each
+pair (see `Coverage`), so path finding and price lookups can tell whether a
+pair has data for a given time without looking through its movement data.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
+import numpy
+
+from .indexes import InMemoryIndex
+from .models import Coverage
+
+
+class CoverageIndex(InMemoryIndex):
+	"""
+	Loads the coverage intervals of all pairs at once, and answers whether a
+	timestamp is covered by a pair by bisecting its sorted intervals.
+
+	Pairs without coverage intervals (e.g. in databases predating them) are
+	considered covered from their earliest data until one period past their
+	latest data.
+	"""
+
+	def _populate(self):
+		intervals = defaultdict(lambda: ([], []))
+		for pair_id, start, end in Coverage.objects.order_by(
+			'pair_id', 'start').values_list('pair_id', 'start', 'end'):
+			starts, ends = intervals[pair_id]
+			starts += [start.timestamp()]
+			ends += [end.timestamp()]
+		self._intervals = dict(intervals)
+
+	def intervals(self, pair):
+		"""
+		Return the sorted start and end times (in seconds since epoch) of the
+		intervals covered by the pair, as two lists.
+		"""
+		self._load()
+		if pair.pk in self._intervals:
+			return self._intervals[pair.pk]
+		if pair.earliest_data is None or pair.latest_data is None:
+			return [], []
+		return (
+			[pair.earliest_data.timestamp()],
+			[pair.latest_data.timestamp() + pair.granularity],
+		)
+
+	def covers(self, pair, timestamp):
+		"""
+		Return whether the pair has movement data covering the provided
+		datetime. Intervals are inclusive of their end.
+		"""
+		starts, ends = self.intervals(pair)
+		timestamp = timestamp.timestamp()
+		index = bisect_right(starts, timestamp) - 1
+		return index >= 0 and timestamp <= ends[index]
+
+	def covered(self, pair, timestamps):
+		"""
+		Return a boolean array of whether the pair has movement data covering
+		each of the provided times, in seconds since epoch.
+		"""
+		starts, ends = self.intervals(pair)
+		index = numpy.searchsorted(starts, timestamps, side='right') - 1
+		found = index >= 0
+		covered = numpy.zeros(len(timestamps), dtype=bool)
+		covered[found] = timestamps[found] <= numpy.array(ends)[index[found]]
+		return covered
+
+
+coverage = CoverageIndex()
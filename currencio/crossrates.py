@@ -0,0 +1,162 @@
+"""
+Cross-rates from every known currency to the reporting currency, optionally
+materialised at a fixed resolution (`settings.CROSS_RATE_RESOLUTION`), so that
+conversions for reporting are a single indexed lookup rather than a search for
+a path of pairs and a price lookup on each of them, at the cost of using the
+rate at the start of each period.
+
+Cross-rates are built from the existing pairs, and extended after movement
+data is imported.
+"""
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, transaction
+
+from .graph import graph
+from .models import CrossRate, Currency, Pair
+from .registry import registry
+from .utils import convert
+
+
+# Number of cross-rates to insert at a time
+CHUNK_SIZE = 10000
+
+
+def reporting_currency():
+	return registry.get(slug=settings.REPORTING_CURRENCY)
+
+
+def _bucket(timestamp, resolution):
+	"""
+	Return the start of the period of `resolution` seconds that the provided
+	datetime falls into.
+	"""
+	return datetime.fromtimestamp(
+		int(timestamp.timestamp()) // resolution * resolution, tz=timezone.utc)
+
+
+def _rate_at(source, target, timestamp):
+	"""
+	Return the rate from the source to the target currency at the provided
+	datetime, via the shortest path of the finest pairs, or None if there's
+	no such path.
+
+	Prices are looked up with `Pair.price_at`, which only reads the candles
+	at the timestamp, since periods are too far apart for `convert_many` or
+	the price oracle to share candles between them. Using the finest pairs
+	rather than rollups avoids basing the rate on prices from later in the
+	period.
+	"""
+	path = graph.find_path(source, target, timestamp)
+	if path is None:
+		return None
+	rate = Decimal(1)
+	for pair in path:
+		price = pair.price_at(timestamp)
+		if price is None:
+			return None
+		if source == pair.source:
+			rate *= price
+			source = pair.target
+		else:
+			rate /= price
+			source = pair.source
+	return rate
+
+
+def extend_cross_rates(currency, target=None, resolution=None, rebuild=False):
+	"""
+	Calculate the missing cross-rates from `currency` to the reporting
+	currency (or `target`, if provided), from the earliest data of the pairs
+	involving it to the latest data of any pair, and return the number of
+	cross-rates added. Does nothing if no resolution is provided or set in
+	`settings.CROSS_RATE_RESOLUTION`.
+
+	Rates are calculated at the start of each period (see `_rate_at`). Only
+	periods from the latest existing cross-rate onwards are calculated,
+	since that one may have been based on incomplete data, and is updated if
+	it has changed, unless `rebuild` is set, in which case all are.
+	"""
+	resolution = resolution or settings.CROSS_RATE_RESOLUTION
+	if not resolution:
+		return 0
+	target = target or reporting_currency()
+	if currency == target:
+		return 0
+	pairs = Pair.objects.filter(earliest_data__isnull=False)
+	start = pairs.filter(models.Q(source=currency) | models.Q(target=currency))\
+		.aggregate(models.Min('earliest_data'))['earliest_data__min']
+	end = pairs.aggregate(models.Max('latest_data'))['latest_data__max']
+	if start is None:
+		return 0
+	rates = CrossRate.objects.filter(
+		currency=currency, target=target, resolution=resolution)
+	added = 0
+	with transaction.atomic():
+		latest = None if rebuild else rates.order_by('-timestamp').first()
+		if latest is None:
+			rates.delete()
+		else:
+			start = latest.timestamp
+			rate = _rate_at(currency, target, latest.timestamp)
+			if rate is None:
+				latest.delete()
+			elif rate != latest.rate:
+				latest.rate = rate
+				latest.save()
+			start += timedelta(seconds=resolution)
+		bucket = _bucket(start, resolution)
+		step = timedelta(seconds=resolution)
+		while bucket <= end:
+			created = []
+			while bucket <= end and len(created) < CHUNK_SIZE:
+				rate = _rate_at(currency, target, bucket)
+				if rate is not None:
+					created += [CrossRate(
+						currency=currency,
+						target=target,
+						resolution=resolution,
+						timestamp=bucket,
+						rate=rate,
+					)]
+				bucket += step
+			CrossRate.objects.bulk_create(created)
+			added += len(created)
+	return added
+
+
+def extend_all_cross_rates(rebuild=False):
+	"""
+	Extend the cross-rates from every currency to the reporting currency,
+	yielding each currency with the number of cross-rates added.
+	"""
+	if not settings.CROSS_RATE_RESOLUTION:
+		return
+	target = reporting_currency()
+	for currency in Currency.objects.exclude(pk=target.pk):
+		yield currency, extend_cross_rates(currency, target, rebuild=rebuild)
+
+
+def to_reporting_currency(currency, amount, timestamp):
+	"""
+	Convert `amount` from `currency` to the reporting currency at the given
+	timestamp, using the cross-rate for the period it falls into if
+	cross-rates are enabled. Falls back to `convert` otherwise, or for
+	periods without a cross-rate, e.g. before they're built.
+	"""
+	if currency.pk == settings.REPORTING_CURRENCY:
+		return amount
+	if not settings.CROSS_RATE_RESOLUTION:
+		return convert(currency, reporting_currency(), amount, timestamp)
+	rate = CrossRate.objects.filter(
+		currency=currency,
+		target_id=settings.REPORTING_CURRENCY,
+		resolution=settings.CROSS_RATE_RESOLUTION,
+		timestamp=_bucket(timestamp, settings.CROSS_RATE_RESOLUTION),
+	).values_list('rate', flat=True).first()
+	if rate is None:
+		return convert(currency, reporting_currency(), amount, timestamp)
+	return amount * rate
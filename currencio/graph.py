@@ -0,0 +1,145 @@
+"""
+In-memory graph of currencies linked by trading pairs, used to find the
+path of pairs to convert between two currencies at a given time.
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+import heapq
+
+from django.conf import settings
+
+from .coverage import coverage
+from .indexes import InMemoryIndex
+from .models import Pair
+
+
+MAX_SEARCH_DEPTH = 5
+
+
+def _pick_pair(pairs, tolerance=None):
+	"""
+	Pick the pair with the lowest granularity from the provided pairs, or if
+	a `tolerance` in seconds is provided, the pair with the highest
+	granularity that doesn't exceed it. Returns None if no pair qualifies.
+	"""
+	if tolerance is None:
+		return min(pairs, key=lambda x: x.granularity)
+	pairs = [pair for pair in pairs if pair.granularity <= tolerance]
+	if not pairs:
+		return None
+	return max(pairs, key=lambda x: x.granularity)
+
+
+class CurrencyGraph(InMemoryIndex):
+	"""
+	Loads all pairs with the intervals covered by their movement data once
+	(see `currencio.coverage`), and finds paths between currencies with a
+	breadth-first search, memoising them.
+
+	The pairs available at a given time only change at the boundaries of
+	their intervals, so paths are memoised per interval between
+	consecutive boundaries, rather than per timestamp. Only the
+	`settings.PATH_CACHE_SIZE` most recently used paths are kept.
+	"""
+
+	def _populate(self):
+		pairs = []
+		boundaries = set()
+		for pair in Pair.objects.filter(
+			earliest_data__isnull=False,
+			latest_data__isnull=False,
+		).select_related('source', 'target'):
+			# A pair is considered available during the intervals covered by
+			# its movement data
+			starts, ends = coverage.intervals(pair)
+			pairs += [(pair, starts, ends)]
+			boundaries |= set(starts) | set(ends)
+		self._pairs = pairs
+		self._boundaries = sorted(boundaries)
+		self._paths = OrderedDict()
+
+	def _links(self, pairs, timestamp, tolerance):
+		"""
+		Return a mapping of currencies to a mapping of linked currencies to
+		the pair picked to link them, for the provided pairs (with their
+		covered intervals) available at `timestamp`.
+		"""
+		candidates = defaultdict(lambda: defaultdict(list))
+		for pair, starts, ends in pairs:
+			index = bisect_right(starts, timestamp) - 1
+			if index >= 0 and timestamp <= ends[index]:
+				candidates[pair.source][pair.target] += [pair]
+				candidates[pair.target][pair.source] += [pair]
+		links = defaultdict(dict)
+		for currency, linked in candidates.items():
+			for other, pairs in linked.items():
+				pair = _pick_pair(pairs, tolerance)
+				if pair:
+					links[currency][other] = pair
+		return links
+
+	def find_path(self, source, target, timestamp, tolerance=None):
+		"""
+		Return the list of pairs with the fewest hops from the source to the
+		target currency, where movement data is available for the given
+		timestamp, or None if there is none. Of paths with the same number of
+		hops, favours the one with the lowest cumulative granularity, or the
+		highest within `tolerance` seconds if provided. Does not search for
+		paths longer than `MAX_SEARCH_DEPTH` hops.
+		"""
+		self._load()
+		# Use the same snapshot of the index throughout, even if it's
+		# reloaded by another thread in the meantime
+		with self._lock:
+			pairs, boundaries, paths = self._pairs, self._boundaries, self._paths
+		timestamp = timestamp.timestamp()
+		# Covered intervals are inclusive of their end, so an interval is
+		# identified by both its index and whether it falls on a boundary
+		interval = bisect_right(boundaries, timestamp)
+		on_boundary = interval > 0 and boundaries[interval - 1] == timestamp
+		key = (source.pk, target.pk, tolerance, interval, on_boundary)
+		with self._lock:
+			if key in paths:
+				paths.move_to_end(key)
+				return paths[key]
+		# Search without holding the lock, so other lookups aren't held up
+		path = self._search(pairs, source, target, timestamp, tolerance)
+		with self._lock:
+			paths[key] = path
+			while len(paths) > settings.PATH_CACHE_SIZE:
+				paths.popitem(last=False)
+		return path
+
+	def _search(self, pairs, source, target, timestamp, tolerance):
+		links = self._links(pairs, timestamp, tolerance)
+		# Search ordered by number of hops, then cumulative granularity
+		# (negated to favour coarser pairs within a tolerance), which is
+		# breadth-first since every hop adds to the number of hops
+		sign = 1 if tolerance is None else -1
+		queue = [(0, 0, 0, source, [])]
+		visited = set()
+		counter = 0
+		while queue:
+			hops, cost, _, currency, path = heapq.heappop(queue)
+			if currency == target:
+				return path
+			if currency in visited or hops > MAX_SEARCH_DEPTH:
+				continue
+			visited.add(currency)
+			for other, pair in links[currency].items():
+				if other not in visited:
+					# Break ties in insertion order, never by comparing
+					# currencies
+					counter += 1
+					heapq.heappush(queue, (
+						hops + 1,
+						cost + sign * pair.granularity,
+						counter,
+						other,
+						path + [pair],
+					))
+		return None
+
+
+graph = CurrencyGraph()
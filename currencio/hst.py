@@ -0,0 +1,97 @@
+"""
+Reader for MetaTrader 4 history (HST) files, such as the one-minute data
+provided by FXDD.
+
+The format (version 400) consists of a 148-byte header followed by packed
+44-byte records, sorted by time:
+
+	int32	timestamp (seconds since epoch, UTC)
+	double	open
+	double	high
+	double	low
+	double	close
+	double	volume
+"""
+
+import os
+
+import numpy
+
+
+HEADER_SIZE = 148
+
+# The layout of a single candle, as stored in the file. Importers of candles
+# from other sources should produce batches of records of the same dtype.
+CANDLE_DTYPE = numpy.dtype([
+	('timestamp', '<i4'),
+	('open', '<f8'),
+	('high', '<f8'),
+	('low', '<f8'),
+	('close', '<f8'),
+	('volume', '<f8'),
+])
+
+
+class HSTFile:
+	"""
+	Memory-mapped view of the records in an HST file. Records are only read
+	from disk as they are accessed, so arbitrarily large files can be opened
+	without copying them into memory.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		# Ignore a trailing partial record, if any
+		count = max(os.path.getsize(path) - HEADER_SIZE, 0) // CANDLE_DTYPE.itemsize
+		if count:
+			self.records = numpy.memmap(path,
+				dtype=CANDLE_DTYPE,
+				mode='r',
+				offset=HEADER_SIZE,
+				shape=(count,),
+			)
+		else:
+			# Empty files can't be memory-mapped
+			self.records = numpy.empty(0, dtype=CANDLE_DTYPE)
+
+	def __len__(self):
+		return len(self.records)
+
+	def index_after(self, timestamp):
+		"""
+		Return the index of the first record with a timestamp later than the
+		provided datetime, or the number of records if there is none.
+
+		Relies on the records being sorted by time, and bisects the memory map
+		directly, so only a handful of pages of the file are ever read.
+		"""
+		timestamp = timestamp.timestamp()
+		low, high = 0, len(self.records)
+		while low < high:
+			middle = (low + high) // 2
+			if self.records[middle]['timestamp'] <= timestamp:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def batches(self, batch_size, from_date=None, to_date=None, start=0):
+		"""
+		Iterate over the records in the file, starting from the record at
+		index `start`, as arrays of up to `batch_size` records, discarding
+		those outside of the `from_date` and `to_date` datetimes (inclusive)
+		if provided.
+		"""
+		from_timestamp = from_date.timestamp() if from_date else None
+		to_timestamp = to_date.timestamp() if to_date else None
+		for start in range(start, len(self.records), batch_size):
+			batch = self.records[start:start + batch_size]
+			if from_timestamp is not None or to_timestamp is not None:
+				mask = numpy.ones(len(batch), dtype=bool)
+				if from_timestamp is not None:
+					mask &= batch['timestamp'] >= from_timestamp
+				if to_timestamp is not None:
+					mask &= batch['timestamp'] <= to_timestamp
+				batch = batch[mask]
+			if len(batch):
+				yield batch
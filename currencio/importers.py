@@ -0,0 +1,168 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+import numpy
+
+from cryptoscopio.http import client
+
+from . import candlestore, crossrates, rollups
+from .hst import CANDLE_DTYPE, HSTFile
+from .models import MovementData
+
+
+DEFAULT_BATCH_SIZE = 50000
+
+# Maximum number of candles returned by the Coinbase API per request
+COINBASE_MAX_CANDLES = 300
+
+
+def import_candles(pair, batches, progress=None):
+	"""
+	Create MovementData for `pair` from an iterable of candle record arrays
+	(of `currencio.hst.CANDLE_DTYPE`), without overwriting existing records.
+
+	Looks up which timestamps of each batch already exist for the pair with
+	a single query, and inserts the rest with `bulk_create`, one transaction
+	per batch. If provided, `progress` is called with the running counts of
+	records parsed and added after each batch.
+
+	Returns a tuple of the number of records parsed and added.
+	"""
+	records_parsed = records_added = 0
+	for batch in batches:
+		entries = batch.tolist()
+		if not entries:
+			continue
+		# Entries are sorted by time, so the window of this batch is
+		# bounded by its first and last entries
+		existing = set(MovementData.objects.filter(
+			pair=pair,
+			timestamp__gte=datetime.fromtimestamp(entries[0][0], tz=timezone.utc),
+			timestamp__lte=datetime.fromtimestamp(entries[-1][0], tz=timezone.utc),
+		).values_list('timestamp', flat=True))
+		new = []
+		for timestamp, open_, high, low, close, volume in entries:
+			timestamp = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+			if timestamp in existing:
+				continue
+			# Guard against duplicate entries within the batch itself
+			existing.add(timestamp)
+			new += [MovementData(
+				pair=pair,
+				timestamp=timestamp,
+				open=Decimal(open_),
+				high=Decimal(high),
+				low=Decimal(low),
+				close=Decimal(close),
+				volume=Decimal(volume),
+			)]
+		with transaction.atomic():
+			MovementData.objects.bulk_create(new)
+		records_parsed += len(entries)
+		records_added += len(new)
+		if progress:
+			progress(records_parsed, records_added)
+	return records_parsed, records_added
+
+
+def finish_import(pairs, report=None):
+	"""
+	Bring everything derived from the movement data of the provided pairs up
+	to date once imports into them are done: their timespans, their candle
+	stores if they have one, and their rollups, and then the cross-rates to
+	the reporting currency, since new data may complete paths from any
+	currency. If provided, `report` is called with a message for each
+	currency that cross-rates were added for.
+	"""
+	for pair in pairs:
+		pair.update_timespan()
+		candlestore.sync(pair)
+		rollups.refresh_rollups(pair)
+	for currency, added in crossrates.extend_all_cross_rates():
+		if added and report:
+			report(f'Added {added} cross-rates for {currency}.')
+
+
+def import_hst_file(pair, path, batch_size=DEFAULT_BATCH_SIZE,
+	from_date=None, to_date=None, incremental=False, progress=None):
+	"""
+	Import the candles from the HST file at `path` into `pair`, optionally
+	limited to a date range. If `incremental` is set, only records later
+	than the latest data for the pair are considered.
+
+	Doesn't update the timespan of the pair, which is left to the caller.
+	"""
+	hst_file = HSTFile(path)
+	# Records are sorted by time, so we can skip straight past the ones that
+	# were already imported
+	start = 0
+	if incremental and pair.latest_data:
+		start = hst_file.index_after(pair.latest_data)
+	return import_candles(pair,
+		hst_file.batches(batch_size, from_date, to_date, start=start),
+		progress=progress,
+	)
+
+
+def fetch_coinbase_candles(product, start, end, granularity=60, workers=4):
+	"""
+	Yield candle record arrays (of `currencio.hst.CANDLE_DTYPE`) of the
+	Coinbase product (e.g. "BTC-USD") from `start` to `end`, one per request
+	of up to `COINBASE_MAX_CANDLES` candles, in order. Up to `workers`
+	requests are made concurrently, subject to the rate limits of the HTTP
+	client.
+
+	Note that Coinbase's BTC-USD data starts from 2015-01-08 01:24 UTC, and
+	that periods without trades have no candles.
+	"""
+	span = granularity * COINBASE_MAX_CANDLES
+	windows = iter(range(
+		int(start.timestamp()) // granularity * granularity,
+		# Up to and including the candle at or before the end
+		int(end.timestamp()) // granularity * granularity + granularity,
+		span,
+	))
+	def fetch(window):
+		rows = client.get_json(
+			f'{settings.COINBASE_API_URL}/products/{product}/candles',
+			params={
+				'start': datetime.fromtimestamp(window, tz=timezone.utc).isoformat(),
+				# The end is inclusive
+				'end': datetime.fromtimestamp(
+					min(window + span - granularity, end.timestamp()),
+					tz=timezone.utc,
+				).isoformat(),
+				'granularity': granularity,
+			},
+		)
+		# Rows are (time, low, high, open, close, volume), newest first
+		return numpy.array([
+			(time, open_, high, low, close, volume)
+			for time, low, high, open_, close, volume in reversed(rows)
+		], dtype=CANDLE_DTYPE)
+	with ThreadPoolExecutor(workers) as executor:
+		# Keep a bounded number of requests in flight, and yield them in order
+		pending = deque(
+			executor.submit(fetch, window) for window in islice(windows, workers * 2))
+		while pending:
+			yield pending.popleft().result()
+			for window in islice(windows, 1):
+				pending.append(executor.submit(fetch, window))
+
+
+def import_coinbase_candles(pair, product, start, end, workers=4, progress=None):
+	"""
+	Import the candles of the Coinbase product (e.g. "BTC-USD") from `start`
+	to `end` into `pair`, at its granularity.
+
+	Doesn't update the timespan of the pair, which is left to the caller.
+	"""
+	return import_candles(pair,
+		fetch_coinbase_candles(product, start, end, pair.granularity, workers),
+		progress=progress,
+	)
@@ -0,0 +1,38 @@
+"""
+Base for in-memory indexes of rows loaded from the database at once, shared
+by all the threads of a process, so that frequent lookups don't query the
+database each time.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+
+class InMemoryIndex:
+	"""
+	Loads the index with `_populate` when first used, and again when
+	invalidated (see `currencio.signals`), or once it's older than
+	`settings.IN_MEMORY_INDEX_TTL` seconds, to pick up changes made by other
+	processes. Lookups call `_load` first.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._loaded = None
+
+	def invalidate(self):
+		with self._lock:
+			self._loaded = None
+
+	def _load(self):
+		with self._lock:
+			if self._loaded is not None \
+			and time.monotonic() - self._loaded < settings.IN_MEMORY_INDEX_TTL:
+				return
+			self._populate()
+			self._loaded = time.monotonic()
+
+	def _populate(self):
+		raise NotImplementedError
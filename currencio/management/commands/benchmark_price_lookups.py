@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+import numpy
+
+from ...models import Currency, MovementData, Pair, _cached_candles
+from ...oracle import PriceOracle
+from ...strategies import candle_array, strategies
+
+
+class Command(BaseCommand):
+	help = 'Measure the latency of price lookups on a pair, either an ' \
+		'existing one or a synthetic one with the given number of rows, ' \
+		'which is rolled back afterwards.'
+
+	def add_arguments(self, parser):
+		group = parser.add_mutually_exclusive_group(required=True)
+		group.add_argument('--pair', type=int,
+			help='Primary key of the pair to look up prices on')
+		group.add_argument('--synthetic', type=int, metavar='ROWS',
+			help='Number of one-minute rows to generate for a synthetic pair')
+		parser.add_argument('--lookups', type=int, default=10000,
+			help='Number of lookups to time per run')
+		parser.add_argument('--strategy-lookups', type=int, default=1000000,
+			help='Number of lookups to time per price strategy, over all of '
+			'the movement data of the pair loaded into memory')
+
+	def handle(self, *args, **options):
+		if options['lookups'] < 1:
+			raise CommandError('Number of lookups must be a positive number')
+		with transaction.atomic():
+			if options['synthetic']:
+				pair = self.create_synthetic_pair(options['synthetic'])
+			else:
+				try:
+					pair = Pair.objects.get(pk=options['pair'])
+				except Pair.DoesNotExist:
+					raise CommandError(f'No pair with primary key {options["pair"]}')
+			if not pair.earliest_data:
+				raise CommandError(f'Pair {pair} has no movement data')
+			self.stdout.write(f'Benchmarking {pair} with {pair.records.count()} rows.')
+			span = (pair.latest_data - pair.earliest_data).total_seconds()
+			timestamps = [
+				pair.earliest_data + timedelta(seconds=random.uniform(0, span))
+				for _ in range(options['lookups'])
+			]
+			# Uncached lookups at random points, which mostly hit the database
+			_cached_candles.cache_clear()
+			self.report('Cold lookups', pair, timestamps)
+			# The same lookups again, now served from the cache
+			self.report('Cached lookups', pair, timestamps)
+			# Batched lookups over a day, the way convert_many does them
+			_cached_candles.cache_clear()
+			start = timestamps[0]
+			day = sorted(
+				start + timedelta(seconds=random.uniform(0, 60 * 60 * 24))
+				for _ in range(options['lookups'])
+			)
+			started = time.perf_counter()
+			pair.prices_at(day)
+			elapsed = time.perf_counter() - started
+			self.stdout.write(
+				f'Batched lookups over a day: {elapsed / len(day) * 10 ** 6:.1f} µs per lookup')
+			# Lookups over a day through the price oracle, in order
+			_cached_candles.cache_clear()
+			oracle = PriceOracle()
+			started = time.perf_counter()
+			for timestamp in day:
+				oracle.price_at(pair, timestamp)
+			elapsed = time.perf_counter() - started
+			stats = oracle.stats()
+			self.stdout.write(
+				f'Oracle lookups over a day: {elapsed / len(day) * 10 ** 6:.1f} µs '
+				f'per lookup ({stats["hits"]} hits, {stats["misses"]} misses, '
+				f'{stats["size"]} bytes loaded)'
+			)
+			self.compare_strategies(pair, options['strategy_lookups'])
+			if options['synthetic']:
+				transaction.set_rollback(True)
+
+	def compare_strategies(self, pair, lookups):
+		"""
+		Time each price strategy over a batch of random lookups, and compare
+		the prices to those of the "mid" strategy.
+		"""
+		candles = candle_array(pair.records.order_by('timestamp').values_list(
+			'timestamp', 'open', 'high', 'low', 'close').iterator())
+		timestamps = numpy.random.uniform(
+			candles['timestamp'][0], candles['timestamp'][-1], lookups)
+		baseline = strategies['mid'](candles, pair.granularity, timestamps)
+		for name, strategy in strategies.items():
+			started = time.perf_counter()
+			prices = strategy(candles, pair.granularity, timestamps)
+			elapsed = time.perf_counter() - started
+			deviation = numpy.mean(numpy.abs(prices - baseline) / baseline)
+			self.stdout.write(
+				f'Strategy "{name}": {lookups / (elapsed or 1):.0f} lookups/sec, '
+				f'mean deviation from "mid" of {deviation * 100:.4f}%'
+			)
+
+	def report(self, name, pair, timestamps):
+		started = time.perf_counter()
+		for timestamp in timestamps:
+			pair.price_at(timestamp)
+		elapsed = time.perf_counter() - started
+		self.stdout.write(
+			f'{name}: {elapsed / len(timestamps) * 10 ** 6:.1f} µs per lookup')
+
+	def create_synthetic_pair(self, rows):
+		source = Currency.objects.create(
+			slug='benchmark-source', ticker='BS', name='', fiat=True)
+		target = Currency.objects.create(
+			slug='benchmark-target', ticker='BT', name='', fiat=True)
+		pair = Pair.objects.create(
+			source=source, target=target, granularity=60, data_source='benchmark')
+		start = datetime(2010, 1, 1, tzinfo=timezone.utc)
+		price = 1.0
+		batch = []
+		for index in range(rows):
+			open_, price = price, price * (1 + random.gauss(0, 0.0005))
+			batch += [MovementData(
+				pair=pair,
+				timestamp=start + timedelta(minutes=index),
+				open=Decimal(open_),
+				high=Decimal(max(open_, price) * 1.0002),
+				low=Decimal(min(open_, price) * 0.9998),
+				close=Decimal(price),
+				volume=Decimal(1),
+			)]
+			if len(batch) >= 50000:
+				MovementData.objects.bulk_create(batch)
+				batch = []
+				self.stdout.write(f'{index + 1} rows generated...')
+		MovementData.objects.bulk_create(batch)
+		pair.update_timespan()
+		return pair
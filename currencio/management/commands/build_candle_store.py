@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import candlestore
+from ...models import Pair
+
+
+class Command(BaseCommand):
+	help = 'Build columnar candle stores for pairs from their movement data, ' \
+		'replacing any existing stores. Lookups of prices for those pairs ' \
+		'are then served from the store instead of the database.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('pairs', nargs='*', type=int,
+			help='Primary keys of the pairs to build stores for (default: all)')
+
+	def handle(self, *args, **options):
+		pairs = Pair.objects.all()
+		if options['pairs']:
+			pairs = pairs.filter(pk__in=options['pairs'])
+			missing = set(options['pairs']) - set(pairs.values_list('pk', flat=True))
+			if missing:
+				raise CommandError(f'No pairs with primary keys {sorted(missing)}')
+		for pair in pairs:
+			store = candlestore.build(pair)
+			self.stdout.write(f'Built store for {pair} with {len(store)} candles.')
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import crossrates
+
+
+class Command(BaseCommand):
+	help = 'Calculate the missing cross-rates from every currency to the ' \
+		'reporting currency, at the resolution in CROSS_RATE_RESOLUTION.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--rebuild', action='store_true',
+			help='Recalculate all existing cross-rates as well')
+
+	def handle(self, *args, **options):
+		if not settings.CROSS_RATE_RESOLUTION:
+			raise CommandError('Cross-rates are disabled, set CROSS_RATE_RESOLUTION')
+		for currency, added in crossrates.extend_all_cross_rates(options['rebuild']):
+			if added:
+				self.stdout.write(f'Added {added} cross-rates for {currency}.')
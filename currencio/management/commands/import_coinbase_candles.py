@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importers import finish_import, import_coinbase_candles
+from ...models import Currency, Pair
+
+
+class Command(BaseCommand):
+	help = 'Load movement data for a product (e.g. BTC-USD) over a date range ' \
+		'from the Coinbase API.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('product', nargs='?', default='BTC-USD',
+			help='Coinbase product, i.e. pair of currency tickers (default: BTC-USD)')
+		parser.add_argument('--from-date',
+			help='Date to load data from (e.g. 2015-01-08), required unless incremental')
+		parser.add_argument('--to-date',
+			help='Date to load data until (e.g. 2018-06-30), now if omitted')
+		parser.add_argument('--granularity', type=int, default=60,
+			choices=[60, 300, 900, 3600, 21600, 86400],
+			help='Granularity of the candles in seconds')
+		parser.add_argument('--workers', type=int, default=4,
+			help='Number of requests to make concurrently')
+		parser.add_argument('--incremental', action='store_true',
+			help='Only load data later than the latest data for the pair')
+
+	def handle(self, *args, **options):
+		try:
+			source_ticker, target_ticker = options['product'].upper().split('-')
+		except ValueError:
+			raise CommandError(f'Could not parse product "{options["product"]}"')
+		currencies = []
+		for ticker in (source_ticker, target_ticker):
+			try:
+				currencies += [Currency.objects.get(ticker=ticker)]
+			except Currency.DoesNotExist:
+				raise CommandError(f'Currency "{ticker}" has no database record')
+			except Currency.MultipleObjectsReturned:
+				raise CommandError(f'Currency "{ticker}" is ambiguous')
+		dates = {}
+		for name in ('from_date', 'to_date'):
+			dates[name] = None
+			if options[name]:
+				try:
+					dates[name] = datetime.strptime(options[name], '%Y-%m-%d')\
+						.replace(tzinfo=timezone.utc)
+				except ValueError:
+					raise CommandError(f'Could not parse date "{options[name]}" into date')
+		if options['workers'] < 1:
+			raise CommandError('Number of workers must be a positive number')
+		source, target = currencies
+		# Rollups share the source, target and data source of the pair they
+		# roll up, and may have the requested granularity
+		pair, _ = Pair.objects.get_or_create(
+			source=source,
+			target=target,
+			granularity=options['granularity'],
+			data_source='Coinbase',
+			rollup_of__isnull=True,
+		)
+		start = dates['from_date']
+		if options['incremental'] and pair.latest_data:
+			start = pair.latest_data
+		if not start:
+			raise CommandError('A from date is required for pairs without data')
+		end = dates['to_date'] or datetime.now(timezone.utc)
+		self.stdout.write(f'Loading {options["product"]} from {start} to {end}.')
+		started = time.monotonic()
+		reported = [0]
+
+		def progress(records_parsed, records_added):
+			# Each request only returns a few hundred records, so report
+			# progress less often than that
+			if records_parsed - reported[0] < 50000:
+				return
+			reported[0] = records_parsed
+			elapsed = time.monotonic() - started
+			self.stdout.write(
+				f'{records_parsed} records parsed, {records_added} new records '
+				f'added ({records_parsed / (elapsed or 1):.0f} records/sec)...'
+			)
+
+		records_parsed, records_added = import_coinbase_candles(
+			pair, options['product'].upper(), start, end,
+			workers=options['workers'], progress=progress,
+		)
+		finish_import([pair], report=self.stdout.write)
+		self.stdout.write(f'Done. {records_parsed} records parsed, {records_added} new records added.')
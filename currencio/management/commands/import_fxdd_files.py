@@ -0,0 +1,192 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime
+import glob
+import multiprocessing
+import os
+import queue
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...importers import DEFAULT_BATCH_SIZE, finish_import, import_hst_file
+from ...models import Currency, Pair
+
+
+# Queue for workers to report progress through, set up by `_init_worker`
+_progress = None
+
+def _init_worker(progress):
+	global _progress
+	_progress = progress
+	# Needed when worker processes are spawned rather than forked
+	django.setup()
+	# Never share a connection inherited from the parent process
+	connections.close_all()
+
+def _import_pair(pair_id, paths, options):
+	"""
+	Import a list of HST files into the pair with the given id, in a worker
+	process. Each pair is only ever handled by a single worker, so workers
+	never write to the same rows.
+	"""
+	pair = Pair.objects.get(pk=pair_id)
+	results = []
+	for path in paths:
+		started = time.monotonic()
+		records_parsed, records_added = import_hst_file(pair, path,
+			batch_size=options['batch_size'],
+			from_date=options['from_date'],
+			to_date=options['to_date'],
+			incremental=options['incremental'],
+			progress=lambda parsed, added: _progress.put((path, parsed, added)),
+		)
+		results += [(path, records_parsed, records_added, time.monotonic() - started)]
+	connections.close_all()
+	return results
+
+
+class Command(BaseCommand):
+	help = 'Load movement data from multiple FXDD historic data HST files ' \
+		'concurrently, using one worker process per pair. Files are either ' \
+		'listed in a manifest, or matched by glob patterns and named after ' \
+		'the pair (e.g. AUDUSD.hst).'
+
+	def add_arguments(self, parser):
+		parser.add_argument('patterns', nargs='*',
+			help='Glob patterns of HST files named after the pair (e.g. data/*.hst)')
+		parser.add_argument('--manifest',
+			help='Path to a file listing a source currency, target currency and '
+			'HST file path per line, separated by whitespace')
+		parser.add_argument('--processes', type=int, default=os.cpu_count(),
+			help='Maximum number of worker processes')
+		parser.add_argument('--from-date', help='Date to parse data from (e.g. 2009-01-14)')
+		parser.add_argument('--to-date', help='Date to parse data from (e.g. 2018-06-31)')
+		parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+			help='Number of records to read and insert per batch')
+		parser.add_argument('--incremental', action='store_true',
+			help='Only parse records later than the latest data for each pair')
+
+	def get_entries(self, options):
+		"""
+		Return a list of (source, target, path) tuples from the manifest and
+		glob patterns provided.
+		"""
+		entries = []
+		if options['manifest']:
+			try:
+				with open(options['manifest']) as f:
+					for number, line in enumerate(f, 1):
+						# Allow blank lines and comments
+						line = line.split('#')[0].strip()
+						if not line:
+							continue
+						try:
+							source, target, path = line.split(None, 2)
+						except ValueError:
+							raise CommandError(f'Could not parse manifest line {number}: "{line}"')
+						entries += [(source, target, path)]
+			except OSError as e:
+				raise CommandError(f'Could not read manifest: {e}')
+		for pattern in options['patterns']:
+			paths = sorted(glob.glob(pattern))
+			if not paths:
+				raise CommandError(f'No files match "{pattern}"')
+			for path in paths:
+				name = os.path.splitext(os.path.basename(path))[0]
+				if len(name) < 6:
+					raise CommandError(f'Could not derive pair from file name "{path}"')
+				entries += [(name[:3], name[3:6], path)]
+		if not entries:
+			raise CommandError('No files to import, provide a manifest or glob patterns')
+		return entries
+
+	def handle(self, *args, **options):
+		for option in ('from_date', 'to_date'):
+			if options[option]:
+				try:
+					options[option] = datetime.strptime(options[option], '%Y-%m-%d')
+				except ValueError:
+					raise CommandError(f'Could not parse date "{options[option]}"')
+		if options['batch_size'] < 1:
+			raise CommandError('Batch size must be a positive number')
+		if options['processes'] < 1:
+			raise CommandError('Number of processes must be a positive number')
+		# Group files by pair, so that each pair is handled by a single worker
+		jobs = defaultdict(list)
+		for source, target, path in self.get_entries(options):
+			if not os.path.isfile(path):
+				raise CommandError(f'File "{path}" does not exist')
+			try:
+				source = Currency.objects.get(ticker=source.upper(), fiat=True)
+			except Currency.DoesNotExist:
+				raise CommandError(f'Currency "{source}" has no database record')
+			try:
+				target = Currency.objects.get(ticker=target.upper(), fiat=True)
+			except Currency.DoesNotExist:
+				raise CommandError(f'Currency "{target}" has no database record')
+			# Create pairs up front, so workers never race to create them
+			pair, _ = Pair.objects.get_or_create(
+				source=source,
+				target=target,
+				granularity=60,
+				data_source='FXDD',
+			)
+			jobs[pair] += [path]
+		# Connections must not be shared with forked worker processes
+		connections.close_all()
+		progress = multiprocessing.Queue()
+		total_parsed = total_added = 0
+		failed = []
+		started = time.monotonic()
+		with ProcessPoolExecutor(
+			max_workers=min(options['processes'], len(jobs)),
+			initializer=_init_worker,
+			initargs=(progress,),
+		) as executor:
+			futures = {
+				executor.submit(_import_pair, pair.pk, paths, {
+					key: options[key] for key in
+					('batch_size', 'from_date', 'to_date', 'incremental')
+				}): pair for pair, paths in jobs.items()
+			}
+			pending = set(futures)
+			while pending:
+				done, pending = wait(pending, timeout=1)
+				self.report_progress(progress)
+				for future in done:
+					pair = futures[future]
+					try:
+						results = future.result()
+					except Exception as e:
+						failed += [pair]
+						self.stderr.write(f'Failed to import {pair}: {e}')
+						continue
+					for path, records_parsed, records_added, elapsed in results:
+						total_parsed += records_parsed
+						total_added += records_added
+						self.stdout.write(
+							f'Finished {path}: {records_parsed} records parsed, '
+							f'{records_added} new records added '
+							f'({records_parsed / (elapsed or 1):.0f} records/sec).'
+						)
+		self.report_progress(progress)
+		elapsed = time.monotonic() - started
+		# Update what's derived from the data once per pair, now that all
+		# files are in
+		finish_import(jobs, report=self.stdout.write)
+		self.stdout.write(f'{total_parsed / (elapsed or 1):.0f} records/sec overall.')
+		self.stdout.write(f'Done. {total_parsed} records parsed, {total_added} new records added.')
+		if failed:
+			raise CommandError(f'Failed to import {len(failed)} of {len(jobs)} pairs')
+
+	def report_progress(self, progress):
+		while True:
+			try:
+				path, records_parsed, records_added = progress.get_nowait()
+			except queue.Empty:
+				break
+			self.stdout.write(
+				f'{path}: {records_parsed} records parsed, {records_added} added...')
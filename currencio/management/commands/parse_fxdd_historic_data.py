@@ -1,9 +1,11 @@
 from datetime import datetime, timezone
 from decimal import Decimal
-import struct
+import time
 
 from django.core.management.base import BaseCommand, CommandError
 
+from ...hst import HSTFile
+from ...importers import DEFAULT_BATCH_SIZE, finish_import, import_candles
 from ...models import Currency, Pair, MovementData
 
 
@@ -17,6 +19,12 @@ class Command(BaseCommand):
 		parser.add_argument('hst_file', help='Path to HST file')
 		parser.add_argument('--from-date', help='Date to parse data from (e.g. 2009-01-14)')
 		parser.add_argument('--to-date', help='Date to parse data from (e.g. 2018-06-31)')
+		parser.add_argument('--bulk', action='store_true',
+			help='Read the file in blocks and insert new records in batches')
+		parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+			help='Number of records to read (and insert in bulk mode) per batch')
+		parser.add_argument('--incremental', action='store_true',
+			help='Only parse records later than the latest data for the pair')
 
 	def handle(self, *args, **options):
 		try:
@@ -29,56 +37,86 @@ class Command(BaseCommand):
 			raise CommandError(f'Currency "{options["target"]}" has no database record')
 
 		from_date = None
-		if 'from_date' in options:
+		if options['from_date']:
 			try:
 				from_date = datetime.strptime(options['from_date'], '%Y-%m-%d')
 			except ValueError:
 				raise CommandError(f'Could not parse from date "{options["from_date"]}" into date')
 		to_date = None
-		if 'to_date' in options:
+		if options['to_date']:
 			try:
 				to_date = datetime.strptime(options['to_date'], '%Y-%m-%d')
 			except ValueError:
 				raise CommandError(f'Could not parse from date "{options["to_date"]}" into date')
-		with open(options['hst_file'], 'rb') as f:
-			# Skip header
-			f.read(148)
-			# Now that we've established that the file exists, create the Pair object
-			pair, _ = Pair.objects.get_or_create(
-				source=source,
-				target=target,
-				granularity=60,
-				data_source='FXDD',
+		if options['batch_size'] < 1:
+			raise CommandError('Batch size must be a positive number')
+		try:
+			hst_file = HSTFile(options['hst_file'])
+		except OSError as e:
+			raise CommandError(f'Could not open HST file: {e}')
+		# Now that we've established that the file exists, create the Pair object
+		pair, _ = Pair.objects.get_or_create(
+			source=source,
+			target=target,
+			granularity=60,
+			data_source='FXDD',
+		)
+		# Records are sorted by time, so we can skip straight past the ones
+		# that were already imported
+		start = 0
+		if options['incremental'] and pair.latest_data:
+			start = hst_file.index_after(pair.latest_data)
+			self.stdout.write(f'Skipping {start} records up to {pair.latest_data}.')
+		# Records outside of specified range are discarded by the reader
+		batches = hst_file.batches(
+			options['batch_size'], from_date, to_date, start=start)
+		started = time.monotonic()
+		if options['bulk']:
+			records_parsed, records_added = self.load_bulk(batches, pair)
+		else:
+			records_parsed, records_added = self.load(batches, pair)
+		elapsed = time.monotonic() - started
+		finish_import([pair], report=self.stdout.write)
+		self.stdout.write(f'{records_parsed / (elapsed or 1):.0f} records/sec.')
+		self.stdout.write(f'Done. {records_parsed} records parsed, {records_added} new records added.')
+
+	def load(self, batches, pair):
+		"""
+		Parse the entries one at a time, creating records for the ones that
+		don't exist yet.
+		"""
+		records_parsed = records_added = 0
+		for timestamp, open_, high, low, close, volume in (
+			entry for batch in batches for entry in batch.tolist()
+		):
+			# Create records without overwriting existing ones
+			record, created = MovementData.objects.get_or_create(
+				pair=pair,
+				timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc),
+				defaults={
+					'open': Decimal(open_),
+					'high': Decimal(high),
+					'low': Decimal(low),
+					'close': Decimal(close),
+					'volume': Decimal(volume),
+				}
+			)
+			if created:
+				records_added += 1
+			records_parsed += 1
+			if not records_parsed % 1000000:
+				self.stdout.write(f'{records_parsed} records parsed...')
+		return records_parsed, records_added
+
+	def load_bulk(self, batches, pair):
+		"""
+		Insert the new entries in batches, reporting throughput as we go.
+		"""
+		started = time.monotonic()
+		def progress(records_parsed, records_added):
+			elapsed = time.monotonic() - started
+			self.stdout.write(
+				f'{records_parsed} records parsed, {records_added} added '
+				f'({records_parsed / (elapsed or 1):.0f} records/sec)...'
 			)
-			# Read and parse the entries
-			records_parsed = records_added = 0
-			while True:
-				buffer = f.read(44)
-				if not buffer:
-					break
-				timestamp, open_, high, low, close, volume = struct.unpack("<iddddd", buffer)
-				# Discard records outside of specified range
-				if from_date and timestamp < from_date.timestamp():
-					continue
-				if to_date and timestamp > to_date.timestamp():
-					continue
-				# Create records without overwriting existing ones
-				record, created = MovementData.objects.get_or_create(
-					pair=pair,
-					timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc),
-					defaults={
-						'open': Decimal(open_),
-						'high': Decimal(high),
-						'low': Decimal(low),
-						'close': Decimal(close),
-						'volume': Decimal(volume),
-					}
-				)
-				if created:
-					records_added += 1
-				records_parsed += 1
-				if not records_parsed % 1000000:
-					self.stdout.write(f'{records_parsed} records parsed...')
-			# Update record timespan on pair
-			pair.update_timespan()
-			self.stdout.write(f'Done. {records_parsed} records parsed, {records_added} new records added.')
+		return import_candles(pair, batches, progress=progress)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ... import rollups
+from ...models import Pair
+
+
+class Command(BaseCommand):
+	help = 'Create or update the rollup pairs aggregated from the movement ' \
+		'data of each pair, at the granularities in ROLLUP_GRANULARITIES.'
+
+	def handle(self, *args, **options):
+		for pair in Pair.objects.filter(rollup_of__isnull=True):
+			for rollup in rollups.refresh_rollups(pair):
+				self.stdout.write(
+					f'Refreshed {rollup} with {rollup.records.count()} records.')
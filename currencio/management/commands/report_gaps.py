@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ...models import Pair
+
+
+class Command(BaseCommand):
+	help = 'Report the gaps in the movement data of each pair, i.e. the ' \
+		'stretches between the intervals covered by it, and their total ' \
+		'duration. Gaps short enough to still count as covered (see ' \
+		'COVERAGE_MAX_GAP_PERIODS and COVERAGE_MAX_GAPS) are not reported.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('pairs', nargs='*', type=int,
+			help='Primary keys of the pairs to report on, all if omitted')
+		parser.add_argument('--update', action='store_true',
+			help='Update the coverage of the pairs from their movement data first')
+
+	def handle(self, *args, **options):
+		pairs = Pair.objects.filter(earliest_data__isnull=False)
+		if options['pairs']:
+			pairs = pairs.filter(pk__in=options['pairs'])
+		for pair in pairs:
+			if options['update']:
+				pair.update_timespan()
+			intervals = list(pair.coverage.values_list('start', 'end'))
+			gaps = [
+				(end, start) for (_, end), (start, _) in zip(intervals, intervals[1:])
+			]
+			total = sum((start - end for end, start in gaps), timedelta())
+			self.stdout.write(
+				f'{pair}: {len(gaps)} gaps totalling {total}, from '
+				f'{pair.earliest_data} to {pair.latest_data}.'
+			)
+			if options['verbosity'] > 1:
+				for end, start in gaps:
+					self.stdout.write(f'    {end} to {start} ({start - end})')
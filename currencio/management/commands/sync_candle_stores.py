@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ... import candlestore
+from ...models import Pair
+
+
+class Command(BaseCommand):
+	help = 'Append movement data imported since the candle stores of pairs ' \
+		'were last built or synced. Pairs without a store are skipped.'
+
+	def handle(self, *args, **options):
+		for pair in Pair.objects.all():
+			if candlestore.CandleStore.for_pair(pair) is None:
+				continue
+			added = candlestore.sync(pair)
+			self.stdout.write(f'Added {added} candles to store for {pair}.')
@@ -1,7 +1,14 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import decimal
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.utils.formats import get_format, number_format
+import numpy
+
+from .candlestore import CandleStore
+from .strategies import candle_array, exact_price, get_strategy, to_decimals
 
 
 class Currency(models.Model):
@@ -135,6 +142,13 @@ class Pair(models.Model):
 	latest_data = models.DateTimeField(null=True, blank=True)
 	granularity = models.IntegerField(help_text='in seconds')
 	data_source = models.CharField(max_length=256, blank=True)
+	# Set on pairs whose data is aggregated from the data of a finer pair
+	rollup_of = models.ForeignKey('self',
+		related_name='rollups',
+		on_delete=models.CASCADE,
+		null=True,
+		blank=True,
+	)
 
 	def __str__(self):
 		return ''.join((
@@ -167,19 +181,175 @@ class Pair(models.Model):
 			.aggregate(models.Min('timestamp'))['timestamp__min']
 		self.latest_data = MovementData.objects.filter(pair=self)\
 			.aggregate(models.Max('timestamp'))['timestamp__max']
+		self.update_coverage()
 		self.save()
 
+	@property
+	def max_gap(self):
+		"""
+		The longest stretch (in seconds) without movement data that still
+		counts as covered by this pair: `settings.COVERAGE_MAX_GAP_PERIODS`
+		periods of its granularity, or longer if its data source is listed
+		in `settings.COVERAGE_MAX_GAPS`, e.g. for markets that close.
+		"""
+		return max(
+			self.granularity * settings.COVERAGE_MAX_GAP_PERIODS,
+			settings.COVERAGE_MAX_GAPS.get(self.data_source, 0),
+		)
+
+	def update_coverage(self):
+		"""
+		Update the intervals of time covered by this pair's movement data
+		(see `Coverage`). Only the latest interval is recalculated, since
+		that's where data is normally added, unless the number of records
+		before it has changed, in which case all are.
+		"""
+		intervals = self.coverage.all()
+		records = self.records.order_by('timestamp')
+		with transaction.atomic():
+			latest = intervals.order_by('-start').first()
+			if latest is not None and records.filter(timestamp__lt=latest.start).count() \
+			== (intervals.exclude(pk=latest.pk).aggregate(models.Sum('count'))['count__sum'] or 0):
+				records = records.filter(timestamp__gte=latest.start)
+				latest.delete()
+			else:
+				intervals.delete()
+			Coverage.objects.bulk_create(
+				Coverage(pair=self, start=start, end=end, count=count)
+				for start, end, count in _coverage_intervals(
+					records.values_list('timestamp', flat=True).iterator(chunk_size=50000),
+					self.granularity,
+					self.max_gap,
+				)
+			)
+
+	def _bucket(self, timestamp):
+		"""
+		Return the start of the period of this pair's granularity that the
+		provided datetime falls into.
+		"""
+		return datetime.fromtimestamp(
+			int(timestamp.timestamp()) // self.granularity * self.granularity,
+			tz=timezone.utc,
+		)
+
 	def price_at(self, timestamp):
 		"""
 		Return the price of the target currency in the source currency at
-		provided `timestamp`.
+		provided `timestamp`, estimated from the latest candle at or before
+		it (and its neighbours, depending on the strategy chosen by
+		`settings.PRICE_STRATEGY`), or None if there is no such candle, or
+		the pair's movement data doesn't cover the timestamp (see `Coverage`).
+
+		Candles are assumed to be aligned to the granularity of the pair, so
+		lookups within the same period share the same candles, which are
+		cached per process (see `_cached_candles`) once they're all before
+		the pair's latest data, so that later imports can't change them.
+		The price is calculated from the candles' Decimal prices exactly
+		(see `currencio.strategies.exact_price`).
 
-		TODO: make this use smoothing or other outlier detection
-		TODO: handle missing candles
 		TODO: accept argument as to which way to err
 		"""
-		record = self.records.filter(timestamp__lte=timestamp).order_by('timestamp')[0]
-		return (record.high + record.low) / decimal.Decimal(2)
+		from .coverage import coverage
+		if not coverage.covers(self, timestamp):
+			return None
+		strategy = get_strategy()
+		# Use the candle store for this pair if one has been built
+		store = CandleStore.for_pair(self)
+		rows = None
+		if store is not None:
+			rows = store.candles_around(timestamp, strategy.context)
+		if not rows:
+			bucket = self._bucket(timestamp)
+			complete = self.latest_data is not None and bucket \
+				+ timedelta(seconds=self.granularity * strategy.context) <= self.latest_data
+			rows = (_cached_candles if complete else _candles_around)(
+				self.pk, bucket, strategy.context)
+		return exact_price(strategy, rows, self.granularity, timestamp)
+
+	def prices_at(self, timestamps):
+		"""
+		Return a list of prices of the target currency in the source currency
+		at each of the provided `timestamps`, as `price_at` would, but using
+		a single query for the movement data covering all of them.
+
+		Prices are calculated for all timestamps at once in floating point,
+		so they may differ from those of `price_at` in the last digits.
+		"""
+		from .coverage import coverage
+		if not timestamps:
+			return []
+		# The candle store answers lookups without queries anyway
+		if CandleStore.for_pair(self) is not None:
+			return [self.price_at(timestamp) for timestamp in timestamps]
+		strategy = get_strategy()
+		buckets = [self._bucket(timestamp) for timestamp in timestamps]
+		# Fetch all candles that could cover any of the timestamps, and the
+		# neighbouring candles the strategy needs
+		margin = timedelta(seconds=self.granularity * strategy.context)
+		candles = candle_array(self.records.filter(
+			timestamp__gt=min(buckets) - timedelta(seconds=self.granularity) - margin,
+			timestamp__lte=max(buckets) + margin,
+		).order_by('timestamp').values_list('timestamp', 'open', 'high', 'low', 'close'))
+		lookups = numpy.array([timestamp.timestamp() for timestamp in timestamps])
+		prices = strategy(candles, self.granularity, lookups)
+		covered = coverage.covered(self, lookups)
+		return [
+			None if not covered else
+			# Data is missing for the period, so leave it to `price_at`
+			self.price_at(timestamp) if price is None else price
+			for timestamp, price, covered in zip(
+				timestamps, to_decimals(prices), covered.tolist())
+		]
+
+
+def _coverage_intervals(timestamps, granularity, max_gap):
+	"""
+	Group an iterable of candle datetimes sorted by time into intervals of
+	covered time, yielding (start, end, count) tuples, where each interval
+	ends one period after its last candle. Stretches of up to `max_gap`
+	seconds without candles don't end an interval.
+	"""
+	start = end = None
+	count = 0
+	period = timedelta(seconds=granularity)
+	max_gap = timedelta(seconds=max_gap)
+	for timestamp in timestamps:
+		if end is not None and timestamp > end + max_gap:
+			yield start, end, count
+			start = None
+		if start is None:
+			start = timestamp
+			count = 0
+		end = timestamp + period
+		count += 1
+	if start is not None:
+		yield start, end, count
+
+
+def _candles_around(pair_id, timestamp, context=0):
+	"""
+	Return a tuple of the (timestamp, open, high, low, close) rows of the
+	latest candle at or before `timestamp` for the pair with the provided
+	primary key, and `context` candles either side of it, sorted by time.
+
+	Looks up rows by descending and ascending timestamp on the (pair,
+	timestamp) index.
+	"""
+	records = MovementData.objects.filter(pair_id=pair_id)
+	fields = ('timestamp', 'open', 'high', 'low', 'close')
+	rows = list(records.filter(timestamp__lte=timestamp)
+		.order_by('-timestamp').values_list(*fields)[:context + 1])[::-1]
+	if context:
+		rows += list(records.filter(timestamp__gt=timestamp)
+			.order_by('timestamp').values_list(*fields)[:context])
+	return tuple(rows)
+
+
+# Only used for candles before the latest data of the pair, which don't change
+# as newer data is imported, but cleared whenever a pair is saved anyway (see
+# `currencio.signals`), which happens when its movement data is updated
+_cached_candles = lru_cache(maxsize=settings.PRICE_CACHE_SIZE)(_candles_around)
 
 
 class MovementData(models.Model):
@@ -187,17 +357,74 @@ class MovementData(models.Model):
 		related_name='records',
 		on_delete=models.CASCADE,
 	)
-	timestamp = models.DateTimeField(unique=True)
+	timestamp = models.DateTimeField()
 	open = models.DecimalField(max_digits=160, decimal_places=32)
 	high = models.DecimalField(max_digits=160, decimal_places=32)
 	low = models.DecimalField(max_digits=160, decimal_places=32)
 	close = models.DecimalField(max_digits=160, decimal_places=32)
 	volume = models.DecimalField(max_digits=160, decimal_places=32, null=True)
+	# Number of candles of the finer pair aggregated into this one, on
+	# rollup pairs (see `currencio.rollups`)
+	count = models.PositiveIntegerField(null=True, blank=True)
 
 	class Meta:
 		ordering = ['-timestamp',]
+		# Also provides the (pair, timestamp) index used for price lookups
+		unique_together = ['pair', 'timestamp']
 		verbose_name_plural = 'movement data'
 
 	def __str__(self):
 		return f'{self.pair} @ {self.timestamp}'
 
+
+
+class Coverage(models.Model):
+	"""
+	An interval of time covered by the movement data of a pair, from its
+	first candle until one period after its last, without gaps longer than
+	`Pair.max_gap` seconds. Kept up to date by
+	`Pair.update_timespan`.
+	"""
+	pair = models.ForeignKey('Pair',
+		related_name='coverage',
+		on_delete=models.CASCADE,
+	)
+	start = models.DateTimeField()
+	end = models.DateTimeField()
+	count = models.IntegerField(help_text='number of candles')
+
+	class Meta:
+		ordering = ['start',]
+		# Also provides the (pair, start) index
+		unique_together = ['pair', 'start']
+		verbose_name_plural = 'coverage'
+
+	def __str__(self):
+		return f'{self.pair} from {self.start} to {self.end}'
+
+
+class CrossRate(models.Model):
+	"""
+	The rate from a currency to another (normally the reporting currency) at
+	the start of a period of `resolution` seconds, materialised from the
+	pairs linking them, see `currencio.crossrates`.
+	"""
+	currency = models.ForeignKey('Currency',
+		related_name='cross_rates',
+		on_delete=models.CASCADE,
+	)
+	target = models.ForeignKey('Currency',
+		related_name='+',
+		on_delete=models.CASCADE,
+	)
+	resolution = models.IntegerField(help_text='in seconds')
+	timestamp = models.DateTimeField()
+	rate = models.DecimalField(max_digits=160, decimal_places=32)
+
+	class Meta:
+		ordering = ['-timestamp',]
+		# Also provides the index used for lookups
+		unique_together = ['currency', 'target', 'resolution', 'timestamp']
+
+	def __str__(self):
+		return f'{self.currency.get_short_name()}/{self.target.get_short_name()} @ {self.timestamp}'
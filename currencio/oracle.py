@@ -0,0 +1,132 @@
+"""
+Price oracle answering lookups for pairs from windows of movement data
+preloaded into memory, for workloads that look up many prices close
+together in time, such as parsing a burst of trades.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import sys
+import threading
+
+from django.conf import settings
+
+from .candlestore import CandleStore
+from .coverage import coverage
+from .strategies import exact_price, get_strategy
+
+
+class PriceOracle:
+	"""
+	On the first lookup for a pair in a given window of time, loads all of
+	the pair's candles in that window with a single query, and answers later
+	lookups in the window from them, using the strategy chosen by
+	`settings.PRICE_STRATEGY` (see `currencio.strategies.exact_price`).
+
+	Windows are `settings.PRICE_ORACLE_WINDOW` seconds long, aligned to
+	multiples of it. Only windows ending before the pair's latest data are
+	kept, since the candles in later ones may still be imported (possibly by
+	another process). The least recently used windows are evicted once the
+	approximate size of all kept windows exceeds
+	`settings.PRICE_ORACLE_MAX_SIZE` bytes.
+
+	Keeps count of lookups answered from loaded windows (`hits`) and of
+	lookups that needed a window to be loaded (`misses`).
+	"""
+
+	def __init__(self, window=None, max_size=None):
+		self.window = window or settings.PRICE_ORACLE_WINDOW
+		self.max_size = max_size or settings.PRICE_ORACLE_MAX_SIZE
+		self._lock = threading.Lock()
+		self._windows = OrderedDict()
+		self.size = 0
+		self.hits = self.misses = 0
+
+	def clear(self):
+		with self._lock:
+			self._windows.clear()
+			self.size = 0
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'hit_rate': self.hits / lookups if lookups else None,
+			'windows': len(self._windows),
+			'size': self.size,
+		}
+
+	def _load(self, pair, start, context):
+		"""
+		Return a list of the timestamps, and a tuple of the (timestamp, open,
+		high, low, close) rows, of the pair's candles in the window starting
+		at `start` (in seconds since epoch), and `context` candles either
+		side of it.
+		"""
+		margin = timedelta(seconds=pair.granularity * context)
+		start = datetime.fromtimestamp(start, tz=timezone.utc)
+		rows = tuple(pair.records.filter(
+			timestamp__gte=start - margin,
+			timestamp__lt=start + timedelta(seconds=self.window) + margin,
+		).order_by('timestamp').values_list('timestamp', 'open', 'high', 'low', 'close'))
+		return [row[0] for row in rows], rows
+
+	def price_at(self, pair, timestamp):
+		"""
+		Return the price of the pair's target currency in its source currency
+		at `timestamp`, the same as `Pair.price_at` would.
+		"""
+		# The candle store answers lookups from memory anyway
+		if CandleStore.for_pair(pair) is not None:
+			return pair.price_at(timestamp)
+		if not coverage.covers(pair, timestamp):
+			return None
+		strategy = get_strategy()
+		bucket = pair._bucket(timestamp)
+		start = int(bucket.timestamp()) // self.window * self.window
+		key = (pair.pk, start, strategy.context)
+		with self._lock:
+			candles = self._windows.get(key)
+			if candles is not None:
+				self.hits += 1
+				self._windows.move_to_end(key)
+		if candles is None:
+			self.misses += 1
+			candles = self._load(pair, start, strategy.context)
+			end = datetime.fromtimestamp(start + self.window, tz=timezone.utc) \
+				+ timedelta(seconds=pair.granularity * strategy.context)
+			if pair.latest_data is None or end > pair.latest_data:
+				# Answer from the window without keeping it
+				return self._price(pair, candles, bucket, timestamp, strategy)
+			with self._lock:
+				if key not in self._windows:
+					self._windows[key] = candles
+					self.size += _size(candles)
+				# Evict the least recently used windows, but always keep
+				# the one just loaded
+				while self.size > self.max_size and len(self._windows) > 1:
+					_, evicted = self._windows.popitem(last=False)
+					self.size -= _size(evicted)
+		return self._price(pair, candles, bucket, timestamp, strategy)
+
+	def _price(self, pair, candles, bucket, timestamp, strategy):
+		timestamps, rows = candles
+		if not rows or timestamps[0] > bucket:
+			# The latest candle is before this window, if there is one
+			return pair.price_at(timestamp)
+		return exact_price(strategy, rows, pair.granularity, timestamp, timestamps)
+
+
+def _size(candles):
+	# Approximate number of bytes taken by a window's rows and timestamps,
+	# assuming the prices of every row take about as much as the first's
+	timestamps, rows = candles
+	if not rows:
+		return 0
+	row = rows[0]
+	return sys.getsizeof(timestamps) + sys.getsizeof(rows) + len(rows) * (
+		sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row))
+
+
+oracle = PriceOracle()
@@ -0,0 +1,58 @@
+"""
+In-memory registry of all currencies, so that looking up currencies by slug
+or ticker (e.g. for every row of a file being parsed) doesn't query the
+database each time.
+"""
+
+from collections import defaultdict
+
+from .indexes import InMemoryIndex
+from .models import Currency
+
+
+class CurrencyRegistry(InMemoryIndex):
+	"""
+	Loads all currencies at once, indexed by slug and by ticker and whether
+	they're fiat, and looks them up with the same semantics as
+	`Currency.objects.get`. The same instances are returned to all callers,
+	so they shouldn't be modified.
+	"""
+
+	def _populate(self):
+		self._by_slug = {}
+		self._by_ticker = defaultdict(list)
+		for currency in Currency.objects.all():
+			self._by_slug[currency.slug] = currency
+			self._by_ticker[currency.ticker, currency.fiat] += [currency]
+
+	def all(self):
+		self._load()
+		return list(self._by_slug.values())
+
+	def get(self, slug=None, ticker=None, fiat=None):
+		"""
+		Return the currency with the provided slug, or otherwise the one with
+		the provided ticker, either fiat or not if `fiat` is provided.
+
+		Raises `Currency.DoesNotExist` if there's no such currency, or
+		`Currency.MultipleObjectsReturned` if there's more than one.
+		"""
+		self._load()
+		if slug is not None:
+			if slug not in self._by_slug:
+				raise Currency.DoesNotExist(f'No currency with slug "{slug}"')
+			return self._by_slug[slug]
+		matches = [
+			currency
+			for is_fiat in ((fiat,) if fiat is not None else (False, True))
+			for currency in self._by_ticker.get((ticker, is_fiat), [])
+		]
+		if not matches:
+			raise Currency.DoesNotExist(f'No currency with ticker "{ticker}"')
+		if len(matches) > 1:
+			raise Currency.MultipleObjectsReturned(
+				f'More than one currency with ticker "{ticker}"')
+		return matches[0]
+
+
+registry = CurrencyRegistry()
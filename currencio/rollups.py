@@ -0,0 +1,151 @@
+"""
+Coarser-grained pairs derived from the movement data of a finer pair, e.g.
+hourly and daily candles aggregated from one-minute candles.
+
+Rollups are ordinary Pairs with `rollup_of` set, so they take part in path
+finding like any other pair, and lookups that can tolerate a coarser
+resolution can use them to touch far fewer rows.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import transaction
+
+from . import candlestore
+from .models import MovementData, Pair
+
+
+# Number of MovementData rows to read from the database at a time
+CHUNK_SIZE = 50000
+
+
+def _aggregate(records, granularity):
+	"""
+	Aggregate an iterable of (timestamp, open, high, low, close, volume)
+	tuples sorted by time into candles of `granularity` seconds, yielding
+	tuples of the same shape with the number of candles aggregated added,
+	timestamped at the start of each candle.
+	"""
+	candle = None
+	for timestamp, open_, high, low, close, volume in records:
+		start = int(timestamp.timestamp()) // granularity * granularity
+		if candle and candle[0] == start:
+			candle[2] = max(candle[2], high)
+			candle[3] = min(candle[3], low)
+			candle[4] = close
+			if volume is not None:
+				candle[5] = volume if candle[5] is None else candle[5] + volume
+			candle[6] += 1
+			continue
+		if candle:
+			yield tuple(candle)
+		candle = [start, open_, high, low, close, volume, 1]
+	if candle:
+		yield tuple(candle)
+
+
+def _changed_since(rollup):
+	"""
+	Return the time from which the candles of a rollup pair need to be
+	recalculated, or None if all of them do.
+
+	That's normally the start of the latest candle, since it may have been
+	incomplete. If the number of candles of the source pair before it
+	doesn't match the number aggregated into the earlier candles, data was
+	added elsewhere (e.g. filling a gap), and the earliest candle that
+	doesn't match is found by bisecting the candles, with a count query
+	for each step. Since data is added rather than removed, the counts
+	match up to that candle, and no longer do after it.
+	"""
+	if not rollup.latest_data:
+		return None
+	source = rollup.rollup_of
+	candles = list(rollup.records.filter(timestamp__lt=rollup.latest_data)
+		.order_by('timestamp').values_list('timestamp', 'count'))
+	if any(count is None for _, count in candles):
+		# Aggregated before candles were counted
+		return None
+	totals = list(accumulate(count for _, count in candles))
+	if source.records.filter(timestamp__lt=rollup.latest_data).count() \
+	== (totals[-1] if totals else 0):
+		return rollup.latest_data
+	period = timedelta(seconds=rollup.granularity)
+	low, high = 0, len(candles)
+	while low < high:
+		middle = (low + high) // 2
+		if source.records.filter(timestamp__lt=candles[middle][0] + period).count() \
+		== totals[middle]:
+			low = middle + 1
+		else:
+			high = middle
+	# Any candles missing from the gap after the last matching one are
+	# recalculated too
+	if not low:
+		return None
+	return candles[low - 1][0] + period
+
+
+def refresh_rollup(rollup):
+	"""
+	Bring the data of a rollup pair up to date with the pair it's derived
+	from, recalculating the candles whose source data may have changed
+	(see `_changed_since`).
+	"""
+	source = rollup.rollup_of
+	records = source.records.order_by('timestamp')
+	with transaction.atomic():
+		since = _changed_since(rollup)
+		if since:
+			records = records.filter(timestamp__gte=since)
+			rollup.records.filter(timestamp__gte=since).delete()
+		else:
+			rollup.records.all().delete()
+		batch = []
+		for timestamp, open_, high, low, close, volume, count in _aggregate(
+			records.values_list(
+				'timestamp', 'open', 'high', 'low', 'close', 'volume',
+			).iterator(chunk_size=CHUNK_SIZE),
+			rollup.granularity,
+		):
+			batch += [MovementData(
+				pair=rollup,
+				timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc),
+				open=open_,
+				high=high,
+				low=low,
+				close=close,
+				volume=volume,
+				count=count,
+			)]
+			if len(batch) >= CHUNK_SIZE:
+				MovementData.objects.bulk_create(batch)
+				batch = []
+		MovementData.objects.bulk_create(batch)
+		rollup.update_timespan()
+	candlestore.sync(rollup)
+
+
+def refresh_rollups(pair):
+	"""
+	Create or update the rollups of the provided pair for each granularity
+	in `settings.ROLLUP_GRANULARITIES` that is a multiple of its own.
+	Rollups of rollups aren't created. Returns the list of rollup pairs.
+	"""
+	if pair.rollup_of_id:
+		return []
+	rollups = []
+	for granularity in settings.ROLLUP_GRANULARITIES:
+		if granularity <= pair.granularity or granularity % pair.granularity:
+			continue
+		rollup, _ = Pair.objects.get_or_create(
+			source=pair.source,
+			target=pair.target,
+			granularity=granularity,
+			data_source=pair.data_source,
+			rollup_of=pair,
+		)
+		refresh_rollup(rollup)
+		rollups += [rollup]
+	return rollups
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .coverage import coverage
+from .graph import graph
+from .models import Currency, Pair, _cached_candles
+from .oracle import oracle
+from .registry import registry
+
+
+@receiver(post_save, sender=Pair)
+@receiver(post_delete, sender=Pair)
+def invalidate_graph(sender, **kwargs):
+	# Changes to the availability windows of pairs (e.g. by
+	# `Pair.update_timespan`) change which paths are available
+	coverage.invalidate()
+	graph.invalidate()
+
+
+@receiver(post_save, sender=Pair)
+@receiver(post_delete, sender=Pair)
+def clear_price_cache(sender, **kwargs):
+	# Prices may have been cached for periods the pair has since gained
+	# movement data for
+	_cached_candles.cache_clear()
+	oracle.clear()
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+def invalidate_registry(sender, **kwargs):
+	registry.invalidate()
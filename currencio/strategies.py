@@ -0,0 +1,195 @@
+"""
+Strategies for estimating the price at given times from candles.
+
+Each strategy takes a structured array of candles sorted by time (see
+`candle_array`), the granularity of the candles in seconds, and an array of
+lookup times in seconds since epoch, and returns an array of prices, with
+NaN where no candle at or before the lookup time is available. Strategies
+are vectorised, so prices for a whole batch of lookups are calculated at
+once, in floating point.
+
+Single lookups instead go through each strategy's `exact` counterpart (see
+`exact_price`), which calculates the same price from the Decimal rows of a
+few candles, so that they don't lose precision to floats.
+
+The strategy used throughout is chosen by `settings.PRICE_STRATEGY`.
+"""
+
+import bisect
+from datetime import timedelta
+import decimal
+import statistics
+
+from django.conf import settings
+import numpy
+
+
+CANDLE_ARRAY_DTYPE = numpy.dtype([
+	('timestamp', '<f8'),
+	('open', '<f8'),
+	('high', '<f8'),
+	('low', '<f8'),
+	('close', '<f8'),
+])
+
+# Number of candles the rolling median is taken over, and the number of
+# median absolute deviations beyond which a candle is considered an outlier
+MEDIAN_WINDOW = 5
+OUTLIER_THRESHOLD = 3
+
+
+strategies = {}
+
+# A decorator registering a function as a strategy with given name. Strategies
+# that look at neighbouring candles declare how many they need on either side
+# as `context`, so callers can fetch enough candles.
+def register_strategy(name, context=0):
+	def wrapped(function):
+		function.context = context
+		strategies[name] = function
+		return function
+	return wrapped
+
+
+# A decorator registering a function as the exact counterpart of the strategy
+# with given name. It takes a sequence of (timestamp, open, high, low, close)
+# rows as `candle_array` does, sorted by time, the index of the latest row at
+# or before the lookup, the granularity and the lookup datetime, and returns
+# a Decimal price.
+def register_exact(name):
+	def wrapped(function):
+		strategies[name].exact = function
+		return function
+	return wrapped
+
+
+def get_strategy(name=None):
+	return strategies[name or settings.PRICE_STRATEGY]
+
+
+def exact_price(strategy, rows, granularity, timestamp, timestamps=None):
+	"""
+	Return the price at the provided datetime estimated by `strategy` with
+	Decimal arithmetic from a sequence of rows as `candle_array` takes,
+	sorted by time, or None if none are at or before it. The timestamps of
+	the rows can be passed in as `timestamps` if they're already at hand.
+	"""
+	if timestamps is None:
+		timestamps = [row[0] for row in rows]
+	index = bisect.bisect_right(timestamps, timestamp) - 1
+	if index < 0:
+		return None
+	return strategy.exact(rows, index, granularity, timestamp)
+
+
+def candle_array(rows):
+	"""
+	Return a candle array from an iterable of (timestamp, open, high, low,
+	close) tuples, with datetimes and Decimals, as returned by `values_list`
+	on MovementData.
+	"""
+	return numpy.array([
+		(timestamp.timestamp(), open_, high, low, close)
+		for timestamp, open_, high, low, close in rows
+	], dtype=CANDLE_ARRAY_DTYPE)
+
+
+def to_decimals(prices):
+	"""
+	Convert an array of prices into a list of Decimals, or None for NaN.
+	"""
+	return [
+		None if numpy.isnan(price) else decimal.Decimal(repr(price))
+		for price in prices.tolist()
+	]
+
+
+def _index(candles, lookups):
+	# Index of the latest candle at or before each lookup, or -1 if none
+	return numpy.searchsorted(candles['timestamp'], lookups, side='right') - 1
+
+
+@register_strategy('mid')
+def mid(candles, granularity, lookups):
+	"""
+	The midpoint between the high and low of the latest candle.
+	"""
+	index = _index(candles, lookups)
+	found = index >= 0
+	prices = numpy.full(len(index), numpy.nan)
+	candle = candles[index[found]]
+	prices[found] = (candle['high'] + candle['low']) / 2
+	return prices
+
+
+@register_exact('mid')
+def exact_mid(rows, index, granularity, timestamp):
+	_, _, high, low, _ = rows[index]
+	return (high + low) / 2
+
+
+@register_strategy('interpolated')
+def interpolated(candles, granularity, lookups):
+	"""
+	Linear interpolation from the open to the close of the latest candle,
+	by how far into the candle's period the lookup falls. Lookups past the
+	end of the candle (e.g. in gaps) get its close.
+	"""
+	index = _index(candles, lookups)
+	found = index >= 0
+	prices = numpy.full(len(index), numpy.nan)
+	candle = candles[index[found]]
+	progress = numpy.clip(
+		(lookups[found] - candle['timestamp']) / granularity, 0, 1)
+	prices[found] = candle['open'] + progress * (candle['close'] - candle['open'])
+	return prices
+
+
+@register_exact('interpolated')
+def exact_interpolated(rows, index, granularity, timestamp):
+	start, open_, _, _, close = rows[index]
+	progress = decimal.Decimal((timestamp - start) // timedelta(microseconds=1)) \
+		/ (granularity * 10 ** 6)
+	return open_ + min(progress, 1) * (close - open_)
+
+
+@register_strategy('median', context=MEDIAN_WINDOW // 2)
+def median(candles, granularity, lookups):
+	"""
+	The midpoint of the latest candle, unless it's an outlier compared to the
+	rolling median of the midpoints of the candles around it, in which case
+	that median is used instead. Outliers are midpoints more than
+	`OUTLIER_THRESHOLD` median absolute deviations away from the median.
+	"""
+	index = _index(candles, lookups)
+	found = index >= 0
+	prices = numpy.full(len(index), numpy.nan)
+	# Indices of the candles around each latest candle, repeating the first
+	# and last candles where there aren't enough
+	offset = MEDIAN_WINDOW // 2
+	windows = numpy.clip(
+		index[found][:, None] + numpy.arange(-offset, offset + 1),
+		0, len(candles) - 1,
+	)
+	windows = (candles['high'][windows] + candles['low'][windows]) / 2
+	mids = windows[:, offset]
+	medians = numpy.median(windows, axis=1)
+	deviations = numpy.median(numpy.abs(windows - medians[:, None]), axis=1)
+	outliers = numpy.abs(mids - medians) > OUTLIER_THRESHOLD * deviations
+	prices[found] = numpy.where(outliers, medians, mids)
+	return prices
+
+
+@register_exact('median')
+def exact_median(rows, index, granularity, timestamp):
+	offset = MEDIAN_WINDOW // 2
+	window = [
+		(rows[i][2] + rows[i][3]) / 2 for i in (
+			min(max(i, 0), len(rows) - 1)
+			for i in range(index - offset, index + offset + 1)
+		)
+	]
+	mid = window[offset]
+	median_ = statistics.median(window)
+	deviation = statistics.median(abs(value - median_) for value in window)
+	return median_ if abs(mid - median_) > OUTLIER_THRESHOLD * deviation else mid
@@ -1,3 +1,843 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler
+from io import StringIO
+import json
+import os
+import queue
+import tempfile
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import (
+	SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+import numpy
+
+from cryptoscopio.testing import start_stub_server
+
+from . import candlestore
+from .crossrates import extend_cross_rates, to_reporting_currency
+from .graph import graph
+from .hst import CANDLE_DTYPE, HEADER_SIZE, HSTFile
+from .importers import fetch_coinbase_candles, import_candles
+from .management.commands import import_fxdd_files
+from .models import Coverage, CrossRate, Currency, MovementData, Pair
+from .oracle import PriceOracle
+from .registry import registry
+from .rollups import refresh_rollups
+from .strategies import CANDLE_ARRAY_DTYPE, exact_price, strategies
+from .utils import convert, convert_many
+
+
+class ConvertTestCase(TestCase):
+	"""
+	Tests for finding conversion paths between currencies and converting
+	amounts along them.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		self.btc = Currency.objects.get(slug='bitcoin')
+		self.aud = Currency.objects.get(slug='fiat-aud')
+		self.usd = Currency.objects.get(slug='fiat-usd')
+		self.start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		graph.invalidate()
+
+	def create_pair(self, source, target, price, granularity=60, count=10):
+		pair = Pair.objects.create(
+			source=source, target=target, granularity=granularity)
+		for index in range(count):
+			MovementData.objects.create(
+				pair=pair,
+				timestamp=self.start + timedelta(seconds=index * granularity),
+				open=price, high=price, low=price, close=price, volume=1,
+			)
+		pair.update_timespan()
+		return pair
+
+	def test_price_at(self):
+		pair = self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		MovementData.objects.filter(pair=pair, timestamp=self.start).update(
+			high=Decimal('0.9'), low=Decimal('0.7'))
+		MovementData.objects.filter(
+			pair=pair, timestamp=self.start + timedelta(minutes=5)
+		).update(high=Decimal('0.6'), low=Decimal('0.6'))
+		pair.save()
+		# Uses the latest candle at or before the timestamp
+		self.assertEqual(
+			pair.price_at(self.start + timedelta(minutes=5, seconds=30)),
+			Decimal('0.6'),
+		)
+		# Subsequent lookups in the same minute are cached
+		with self.assertNumQueries(0):
+			pair.price_at(self.start + timedelta(minutes=5, seconds=59))
+		# Unless they're past the latest data, which may still be imported
+		with self.assertNumQueries(2):
+			pair.price_at(self.start + timedelta(minutes=10))
+			pair.price_at(self.start + timedelta(minutes=10))
+		self.assertEqual(
+			pair.price_at(self.start + timedelta(minutes=6)), Decimal('0.8'))
+		self.assertIsNone(pair.price_at(self.start - timedelta(seconds=1)))
+
+	def test_exact_prices(self):
+		pair = self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		MovementData.objects.filter(pair=pair, timestamp=self.start).update(
+			high=Decimal('0.2'), low=Decimal('0.1'))
+		pair.save()
+		# Single lookups keep to Decimal arithmetic, which floats can't match
+		self.assertEqual(pair.price_at(self.start), Decimal('0.15'))
+		self.assertEqual(PriceOracle().price_at(pair, self.start), Decimal('0.15'))
+		# Batches are calculated in floating point
+		price, = pair.prices_at([self.start])
+		self.assertAlmostEqual(price, Decimal('0.15'), places=15)
+
+	def test_no_path(self):
+		self.assertIsNone(convert(self.btc, self.aud, Decimal(1), self.start))
+
+	def test_multiple_hops(self):
+		self.create_pair(self.btc, self.usd, Decimal(4000))
+		self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		self.assertEqual(
+			convert(self.btc, self.aud, Decimal(2), self.start + timedelta(minutes=5)),
+			Decimal(10000),
+		)
+		# No data is available past the end of the pairs' data
+		self.assertIsNone(
+			convert(self.btc, self.aud, Decimal(2), self.start + timedelta(hours=1)))
+
+	def test_prefers_fewest_hops(self):
+		self.create_pair(self.btc, self.usd, Decimal(4000))
+		self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		direct = self.create_pair(self.btc, self.aud, Decimal(6000))
+		self.assertEqual(
+			graph.find_path(self.btc, self.aud, self.start), [direct])
+
+	@override_settings(PATH_CACHE_SIZE=2)
+	def test_path_memo(self):
+		direct = self.create_pair(self.btc, self.aud, Decimal(6000))
+		self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		graph.find_path(self.btc, self.aud, self.start)
+		graph.find_path(self.aud, self.usd, self.start)
+		# Lookups answered from the memo make their paths most recently used
+		with self.assertNumQueries(0):
+			self.assertEqual(graph.find_path(self.btc, self.aud, self.start), [direct])
+		graph.find_path(self.btc, self.usd, self.start)
+		# Only the most recently used paths are kept
+		self.assertEqual([key[:2] for key in graph._paths], [
+			(self.btc.pk, self.aud.pk), (self.btc.pk, self.usd.pk)])
+
+	def test_tolerance(self):
+		fine = self.create_pair(self.aud, self.usd, Decimal('0.8'), count=60 * 24)
+		coarse = self.create_pair(
+			self.aud, self.usd, Decimal('0.7'), granularity=60 * 60, count=24)
+		timestamp = self.start + timedelta(hours=2)
+		self.assertEqual(graph.find_path(self.aud, self.usd, timestamp), [fine])
+		self.assertEqual(
+			graph.find_path(self.aud, self.usd, timestamp, tolerance=60 * 60),
+			[coarse],
+		)
+		self.assertEqual(
+			convert(self.usd, self.aud, Decimal(7), timestamp, tolerance=60 * 60),
+			Decimal(10),
+		)
+		self.assertIsNone(
+			graph.find_path(self.aud, self.usd, timestamp, tolerance=30))
+
+	def test_convert_many(self):
+		self.create_pair(self.btc, self.usd, Decimal(4000))
+		self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		conversions = [
+			(self.btc, self.aud, Decimal(2), self.start + timedelta(minutes=5)),
+			(self.btc, self.aud, Decimal(1), self.start + timedelta(hours=1)),
+			(self.aud, self.aud, Decimal(3), self.start),
+			(self.usd, self.aud, Decimal(8), self.start + timedelta(minutes=9)),
+		]
+		# Loading the graph and coverage, and one range query per pair
+		with self.assertNumQueries(4):
+			results = convert_many(conversions)
+		self.assertEqual(results, [
+			convert(*conversion) for conversion in conversions])
+		self.assertEqual(results, [Decimal(10000), None, Decimal(3), Decimal(10)])
+
+	def test_price_oracle(self):
+		pair = self.create_pair(self.aud, self.usd, Decimal('0.8'), count=60 * 2)
+		oracle = PriceOracle(window=60 * 30)
+		# The first lookup loads the coverage and the window, later ones are
+		# answered from them
+		with self.assertNumQueries(2):
+			for minutes in range(10):
+				self.assertEqual(
+					oracle.price_at(pair, self.start + timedelta(minutes=minutes)),
+					Decimal('0.8'),
+				)
+		self.assertEqual((oracle.hits, oracle.misses), (9, 1))
+		# Windows are evicted once they no longer fit
+		oracle.max_size = 1
+		oracle.price_at(pair, self.start + timedelta(minutes=30))
+		self.assertEqual(oracle.stats()['windows'], 1)
+		# Windows reaching past the latest data aren't kept, so that data
+		# imported later is picked up
+		latest = self.start + timedelta(minutes=60 * 2 - 1)
+		with self.assertNumQueries(2):
+			oracle.price_at(pair, latest)
+			oracle.price_at(pair, latest)
+		self.assertEqual(oracle.stats()['windows'], 1)
+		self.assertIsNone(pair.price_at(latest + timedelta(minutes=2)))
+		MovementData.objects.create(
+			pair=pair, timestamp=latest + timedelta(minutes=2),
+			open=1, high=1, low=1, close=1, volume=1,
+		)
+		pair.update_timespan()
+		self.assertEqual(
+			oracle.price_at(pair, latest + timedelta(minutes=2)), Decimal(1))
+
+	@override_settings(REPORTING_CURRENCY='fiat-aud', CROSS_RATE_RESOLUTION=60 * 60)
+	def test_cross_rates(self):
+		self.create_pair(self.btc, self.usd, Decimal(4000), granularity=60 * 60, count=3)
+		aud = self.create_pair(
+			self.aud, self.usd, Decimal('0.8'), granularity=60 * 60, count=3)
+		self.assertEqual(extend_cross_rates(self.btc), 3)
+		self.assertEqual(extend_cross_rates(self.usd), 3)
+		# Conversions to the reporting currency are a single lookup
+		timestamp = self.start + timedelta(hours=1, minutes=30)
+		with self.assertNumQueries(1):
+			self.assertEqual(
+				to_reporting_currency(self.btc, Decimal(2), timestamp), Decimal(10000))
+		with self.assertNumQueries(0):
+			self.assertEqual(
+				to_reporting_currency(self.aud, Decimal(2), timestamp), Decimal(2))
+		# Extending recalculates the latest cross-rate onwards
+		MovementData.objects.create(
+			pair=aud, timestamp=self.start + timedelta(hours=3),
+			open=1, high=1, low=1, close=1, volume=1,
+		)
+		MovementData.objects.filter(
+			pair=aud, timestamp=self.start + timedelta(hours=2)
+		).update(high=1, low=1)
+		aud.update_timespan()
+		self.assertEqual(extend_cross_rates(self.usd), 1)
+		self.assertEqual(extend_cross_rates(self.usd), 0)
+		rates = CrossRate.objects.filter(currency=self.usd).order_by('timestamp')
+		self.assertEqual(
+			list(rates.values_list('rate', flat=True)), [Decimal('1.25')] * 2 + [1, 1])
+
+	@override_settings(REPORTING_CURRENCY='fiat-aud', CROSS_RATE_RESOLUTION=None)
+	def test_cross_rates_at_start_of_period(self):
+		pair = self.create_pair(self.aud, self.usd, Decimal('0.8'), count=60)
+		MovementData.objects.filter(
+			pair=pair, timestamp__gte=self.start + timedelta(minutes=30),
+		).update(high=Decimal('0.5'), low=Decimal('0.5'))
+		refresh_rollups(pair)
+		# Cross-rates are disabled by default, so conversions are exact
+		self.assertEqual(extend_cross_rates(self.usd), 0)
+		self.assertEqual(
+			to_reporting_currency(
+				self.usd, Decimal(1), self.start + timedelta(minutes=40)),
+			Decimal(2),
+		)
+		# The rate for the hour is the one at its start, not from the hourly
+		# rollup, which includes prices from later in the hour
+		self.assertEqual(
+			extend_cross_rates(self.usd, resolution=60 * 60), 1)
+		self.assertEqual(CrossRate.objects.get().rate, Decimal('1.25'))
+
+	@override_settings(COVERAGE_MAX_GAP_PERIODS=5)
+	def test_coverage(self):
+		pair = self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		self.create_pair(self.btc, self.usd, Decimal(4000), count=60 * 2)
+		for minutes in [16, 20, 60]:
+			MovementData.objects.create(
+				pair=pair, timestamp=self.start + timedelta(minutes=minutes),
+				open=1, high=1, low=1, close=1, volume=1,
+			)
+		pair.update_timespan()
+		self.assertEqual(list(pair.coverage.values_list('start', 'end', 'count')), [
+			(self.start, self.start + timedelta(minutes=10), 10),
+			(self.start + timedelta(minutes=16), self.start + timedelta(minutes=21), 2),
+			(self.start + timedelta(minutes=60), self.start + timedelta(minutes=61), 1),
+		])
+		# Lookups in gaps find neither prices nor paths
+		gap = self.start + timedelta(minutes=30)
+		self.assertIsNone(pair.price_at(gap))
+		self.assertEqual(pair.prices_at([gap, self.start]), [None, Decimal('0.8')])
+		self.assertIsNone(graph.find_path(self.btc, self.aud, gap))
+		self.assertIsNone(convert(self.btc, self.aud, Decimal(1), gap))
+		self.assertEqual(
+			convert(self.btc, self.aud, Decimal(1), self.start + timedelta(minutes=60)),
+			Decimal(4000),
+		)
+		# Filling a gap updates all of the intervals
+		MovementData.objects.create(
+			pair=pair, timestamp=self.start + timedelta(minutes=12),
+			open=1, high=1, low=1, close=1, volume=1,
+		)
+		pair.update_timespan()
+		self.assertEqual(Coverage.objects.filter(pair=pair).count(), 2)
+		self.assertEqual(
+			pair.coverage.first().end, self.start + timedelta(minutes=21))
+
+	@override_settings(COVERAGE_MAX_GAP_PERIODS=5, COVERAGE_MAX_GAPS={'FXDD': 60 * 60 * 72})
+	def test_coverage_by_data_source(self):
+		# Markets trading around the clock have gaps of a few hours
+		pair = self.create_pair(self.btc, self.usd, Decimal(4000))
+		pair.data_source = 'Coinbase'
+		MovementData.objects.create(
+			pair=pair, timestamp=self.start + timedelta(hours=3),
+			open=1, high=1, low=1, close=1, volume=1,
+		)
+		pair.update_timespan()
+		self.assertEqual(pair.coverage.count(), 2)
+		self.assertIsNone(pair.price_at(self.start + timedelta(hours=1)))
+		# While forex markets close for the weekend
+		pair = self.create_pair(self.aud, self.usd, Decimal('0.8'))
+		pair.data_source = 'FXDD'
+		MovementData.objects.create(
+			pair=pair, timestamp=self.start + timedelta(hours=60),
+			open=1, high=1, low=1, close=1, volume=1,
+		)
+		pair.update_timespan()
+		self.assertEqual(pair.coverage.count(), 1)
+		self.assertEqual(
+			pair.price_at(self.start + timedelta(hours=1)), Decimal('0.8'))
+
+
+def write_hst_file(path, start, prices, granularity=60):
+	"""
+	Write an HST file with a candle for each of the provided prices, every
+	`granularity` seconds from the `start` datetime.
+	"""
+	records = numpy.zeros(len(prices), dtype=CANDLE_DTYPE)
+	records['timestamp'] = int(start.timestamp()) + numpy.arange(len(prices)) * granularity
+	for name in ('open', 'high', 'low', 'close'):
+		records[name] = prices
+	records['volume'] = 1
+	with open(path, 'wb') as f:
+		f.write(bytes(HEADER_SIZE))
+		f.write(records.tobytes())
+
+
+class HSTImportTestCase(TestCase):
+	"""
+	Tests for importing movement data from HST files, such as FXDD's.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = directory.name
+		self.path = os.path.join(self.directory, 'AUDUSD.hst')
+		self.start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		write_hst_file(self.path, self.start, numpy.arange(10) + 1)
+
+	def import_file(self, *args, **options):
+		stdout = StringIO()
+		call_command('parse_fxdd_historic_data', 'aud', 'usd', self.path,
+			*args, stdout=stdout, **options)
+		return stdout.getvalue()
+
+	def test_bulk_import(self):
+		output = self.import_file(bulk=True, batch_size=4)
+		# One progress report per batch
+		self.assertEqual(output.count('records/sec)...'), 3)
+		self.assertIn('10 records parsed, 10 new records added', output)
+		pair = Pair.objects.get(data_source='FXDD', rollup_of__isnull=True)
+		self.assertEqual(
+			list(pair.records.order_by('timestamp').values_list('close', flat=True)),
+			list(range(1, 11)),
+		)
+		self.assertEqual(
+			(pair.earliest_data, pair.latest_data),
+			(self.start, self.start + timedelta(minutes=9)),
+		)
+		# Existing records are left alone, in either mode
+		pair.records.filter(timestamp=self.start).update(close=100)
+		self.assertIn('0 new records added', self.import_file(bulk=True, batch_size=4))
+		self.assertIn('0 new records added', self.import_file())
+		self.assertEqual(pair.records.get(timestamp=self.start).close, 100)
+
+	def test_hst_file(self):
+		hst_file = HSTFile(self.path)
+		self.assertIsInstance(hst_file.records, numpy.memmap)
+		self.assertEqual(len(hst_file), 10)
+		self.assertEqual(hst_file.records['close'].tolist(), list(range(1, 11)))
+		# Batches are masked to the date range, inclusive
+		batches = list(hst_file.batches(4,
+			from_date=self.start + timedelta(minutes=2),
+			to_date=self.start + timedelta(minutes=6),
+		))
+		self.assertEqual(
+			[batch['close'].tolist() for batch in batches], [[3, 4], [5, 6, 7]])
+		self.assertEqual(
+			[len(batch) for batch in hst_file.batches(4, start=3)], [4, 3])
+		# A trailing partial record is ignored
+		with open(self.path, 'ab') as f:
+			f.write(bytes(10))
+		self.assertEqual(len(HSTFile(self.path)), 10)
+		# Files without records can be read too
+		write_hst_file(self.path, self.start, [])
+		self.assertEqual(list(HSTFile(self.path).batches(4)), [])
+
+	def test_incremental_import(self):
+		hst_file = HSTFile(self.path)
+		self.assertEqual(hst_file.index_after(self.start - timedelta(minutes=1)), 0)
+		self.assertEqual(hst_file.index_after(self.start + timedelta(minutes=4)), 5)
+		self.assertEqual(hst_file.index_after(self.start + timedelta(hours=1)), 10)
+		self.import_file(bulk=True)
+		# The file gains records later on
+		write_hst_file(self.path, self.start, numpy.arange(15) + 1)
+		output = self.import_file(bulk=True, incremental=True)
+		self.assertIn(
+			f'Skipping 10 records up to {self.start + timedelta(minutes=9)}', output)
+		self.assertIn('5 records parsed, 5 new records added', output)
+		pair = Pair.objects.get(data_source='FXDD', rollup_of__isnull=True)
+		self.assertEqual(pair.latest_data, self.start + timedelta(minutes=14))
+		self.assertIn('0 records parsed', self.import_file(incremental=True))
+
+	def test_import_candles_duplicates(self):
+		pair = Pair.objects.create(
+			source=Currency.objects.get(slug='fiat-aud'),
+			target=Currency.objects.get(slug='fiat-usd'),
+			granularity=60,
+		)
+		batch = numpy.zeros(3, dtype=CANDLE_DTYPE)
+		batch['timestamp'] = [0, 60, 60]
+		progress = []
+		self.assertEqual(
+			import_candles(pair, [batch, batch[:1]], lambda *counts: progress.append(counts)),
+			(4, 2),
+		)
+		self.assertEqual(progress, [(3, 2), (4, 2)])
+
+
+class ParallelImportTestCase(TransactionTestCase):
+	"""
+	Tests for importing multiple HST files concurrently, in a pool of worker
+	processes. Workers close their database connections when done, so
+	these don't run in a transaction.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = directory.name
+		self.start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		# Two files for AUD/USD, one listed in a manifest, and one for USD/AUD
+		write_hst_file(
+			os.path.join(self.directory, 'AUDUSD.hst'), self.start, [1] * 10)
+		write_hst_file(
+			os.path.join(self.directory, 'USDAUD.hst'), self.start, [2] * 5)
+		self.later = os.path.join(self.directory, 'later.hst')
+		write_hst_file(self.later, self.start + timedelta(hours=1), [3] * 5)
+		self.manifest = os.path.join(self.directory, 'manifest')
+		with open(self.manifest, 'w') as f:
+			f.write(f'# Later data\naud usd {self.later}\n')
+
+	def test_import_pair(self):
+		pair = Pair.objects.create(
+			source=Currency.objects.get(slug='fiat-aud'),
+			target=Currency.objects.get(slug='fiat-usd'),
+			granularity=60,
+		)
+		import_fxdd_files._progress = queue.Queue()
+		self.addCleanup(setattr, import_fxdd_files, '_progress', None)
+		results = import_fxdd_files._import_pair(pair.pk, [
+			os.path.join(self.directory, 'AUDUSD.hst'), self.later,
+		], {'batch_size': 4, 'from_date': None, 'to_date': None, 'incremental': False})
+		self.assertEqual(
+			[result[1:3] for result in results], [(10, 10), (5, 5)])
+		self.assertEqual(pair.records.count(), 15)
+		# Progress is reported per batch
+		self.assertEqual(import_fxdd_files._progress.qsize(), 3 + 2)
+
+	def test_get_entries(self):
+		command = import_fxdd_files.Command()
+		self.assertEqual(command.get_entries({
+			'manifest': self.manifest,
+			'patterns': [os.path.join(self.directory, '*D.hst')],
+		}), [
+			('aud', 'usd', self.later),
+			('AUD', 'USD', os.path.join(self.directory, 'AUDUSD.hst')),
+			('USD', 'AUD', os.path.join(self.directory, 'USDAUD.hst')),
+		])
+		with open(self.manifest, 'a') as f:
+			f.write('aud\n')
+		with self.assertRaises(CommandError):
+			command.get_entries({'manifest': self.manifest, 'patterns': []})
+
+	def test_import_fxdd_files(self):
+		if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+			self.skipTest('Worker processes can\'t share an in-memory database')
+		stdout = StringIO()
+		call_command('import_fxdd_files', os.path.join(self.directory, '*D.hst'),
+			manifest=self.manifest, processes=2, stdout=stdout)
+		self.assertIn('Done. 20 records parsed, 20 new records added.', stdout.getvalue())
+		pairs = Pair.objects.filter(data_source='FXDD', rollup_of__isnull=True)
+		self.assertEqual(
+			sorted((str(pair.source_id), pair.records.count()) for pair in pairs),
+			[('fiat-aud', 15), ('fiat-usd', 5)],
+		)
+
+
+class CandleStoreTestCase(TestCase):
+	"""
+	Tests for the memory-mapped, on-disk store of the candles of a pair.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		settings = override_settings(CANDLE_STORE_DIR=directory.name)
+		settings.enable()
+		self.addCleanup(settings.disable)
+		self.addCleanup(candlestore._stores.clear)
+		self.start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		self.pair = Pair.objects.create(
+			source=Currency.objects.get(slug='fiat-aud'),
+			target=Currency.objects.get(slug='fiat-usd'),
+			granularity=60,
+		)
+		self.add_records(range(10))
+
+	def add_records(self, minutes):
+		MovementData.objects.bulk_create([
+			MovementData(
+				pair=self.pair,
+				timestamp=self.start + timedelta(minutes=minute),
+				open=minute, high=minute + Decimal('0.5'), low=minute,
+				close=minute + Decimal('0.25'), volume=1,
+			)
+			for minute in minutes
+		])
+		self.pair.update_timespan()
+
+	def test_build(self):
+		self.assertIsNone(candlestore.CandleStore.for_pair(self.pair))
+		store = candlestore.build(self.pair)
+		self.assertIs(candlestore.CandleStore.for_pair(self.pair), store)
+		self.assertEqual(len(store), 10)
+		self.assertEqual(store.latest_timestamp, self.start + timedelta(minutes=9))
+		self.assertIsNone(store.candles_around(self.start - timedelta(seconds=1)))
+		rows = store.candles_around(self.start + timedelta(minutes=4, seconds=30), 1)
+		self.assertEqual(
+			[row[0] for row in rows],
+			[self.start + timedelta(minutes=minutes) for minutes in (3, 4, 5)],
+		)
+		# Prices come out as the exact Decimals that were stored
+		self.assertEqual(
+			[row[4] for row in rows], [Decimal('3.25'), Decimal('4.25'), Decimal('5.25')])
+		self.assertEqual(
+			[row[2] for row in rows], [Decimal('3.5'), Decimal('4.5'), Decimal('5.5')])
+		# The edges of the data have fewer candles of context
+		self.assertEqual(len(store.candles_around(self.start, 1)), 2)
+		self.assertEqual(len(store.candles_around(self.start + timedelta(days=1), 1)), 2)
+
+	def test_sync(self):
+		store = candlestore.build(self.pair)
+		# Stores opened by other processes see appended candles
+		other = candlestore.CandleStore(store.path)
+		self.assertEqual(len(other), 10)
+		self.add_records(range(10, 15))
+		self.assertEqual(candlestore.sync(self.pair), 5)
+		self.assertEqual(len(other), 15)
+		self.assertEqual(candlestore.sync(self.pair), 0)
+		# Older data can't be appended, so the store is rebuilt, in a new
+		# directory that replaces the old one at once
+		directory = os.path.realpath(store.path)
+		self.add_records(range(-5, 0))
+		self.assertEqual(candlestore.sync(self.pair), 20)
+		self.assertEqual(
+			candlestore.CandleStore.for_pair(self.pair).candles_around(
+				self.start - timedelta(minutes=5))[0][4],
+			Decimal('-4.75'),
+		)
+		# Only the link and the new directory are left
+		self.assertFalse(os.path.exists(directory))
+		self.assertEqual(len(os.listdir(os.path.dirname(store.path))), 2)
+		# Other stores pick up the change
+		self.assertEqual(len(other), 20)
+
+	def test_price_at(self):
+		price = self.pair.price_at(self.start + timedelta(minutes=4))
+		candlestore.build(self.pair)
+		with self.assertNumQueries(0):
+			self.assertEqual(self.pair.price_at(self.start + timedelta(minutes=4)), price)
+
+
+@override_settings(ROLLUP_GRANULARITIES=[3600, 86400])
+class RollupTestCase(TestCase):
+	"""
+	Tests for aggregating the movement data of a pair into coarser rollups.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		self.start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		self.pair = Pair.objects.create(
+			source=Currency.objects.get(slug='fiat-aud'),
+			target=Currency.objects.get(slug='fiat-usd'),
+			granularity=60,
+		)
+
+	def add_records(self, minutes):
+		# Prices rise a unit a minute, with the high and low either side
+		MovementData.objects.bulk_create([
+			MovementData(
+				pair=self.pair,
+				timestamp=self.start + timedelta(minutes=minute),
+				open=minute, high=minute + 1, low=minute - 1, close=minute,
+				volume=2,
+			)
+			for minute in minutes
+		])
+		self.pair.update_timespan()
+
+	def candles(self, pair):
+		return list(pair.records.order_by('timestamp').values_list(
+			'timestamp', 'open', 'high', 'low', 'close', 'volume'))
+
+	def test_refresh_rollups(self):
+		self.add_records(range(90))
+		hourly, daily = refresh_rollups(self.pair)
+		self.assertEqual((hourly.granularity, daily.granularity), (3600, 86400))
+		self.assertEqual(self.candles(hourly), [
+			(self.start, 0, 60, -1, 59, 120),
+			(self.start + timedelta(hours=1), 60, 90, 59, 89, 60),
+		])
+		self.assertEqual(self.candles(daily), [(self.start, 0, 90, -1, 89, 180)])
+		self.assertEqual(
+			(hourly.earliest_data, hourly.latest_data),
+			(self.start, self.start + timedelta(hours=1)),
+		)
+		# Rollups aren't rolled up themselves
+		self.assertEqual(refresh_rollups(hourly), [])
+
+	def test_incremental_refresh(self):
+		self.add_records(range(90))
+		hourly, daily = refresh_rollups(self.pair)
+		first = hourly.records.get(timestamp=self.start).pk
+		# The incomplete latest candle is recalculated, earlier ones kept
+		self.add_records(range(90, 150))
+		self.assertEqual(refresh_rollups(self.pair), [hourly, daily])
+		self.assertEqual(hourly.records.get(timestamp=self.start).pk, first)
+		self.assertEqual(self.candles(hourly)[1:], [
+			(self.start + timedelta(hours=1), 60, 120, 59, 119, 120),
+			(self.start + timedelta(hours=2), 120, 150, 119, 149, 60),
+		])
+		# Earlier data recalculates all of them
+		self.add_records(range(-60, 0))
+		refresh_rollups(self.pair)
+		self.assertEqual(self.candles(hourly)[0],
+			(self.start - timedelta(hours=1), -60, 0, -61, -1, 120))
+		self.assertNotEqual(hourly.records.get(timestamp=self.start).pk, first)
+		self.assertEqual(hourly.records.count(), 4)
+
+	def test_backfill(self):
+		self.add_records(list(range(30)) + list(range(120, 180)))
+		hourly, _ = refresh_rollups(self.pair)
+		# Filling a gap in the middle adds the candle missing from it
+		self.add_records(range(60, 120))
+		refresh_rollups(self.pair)
+		self.assertEqual(self.candles(hourly), [
+			(self.start, 0, 30, -1, 29, 60),
+			(self.start + timedelta(hours=1), 60, 120, 59, 119, 120),
+			(self.start + timedelta(hours=2), 120, 180, 119, 179, 120),
+		])
+		# Filling one within the first candle recalculates it
+		self.add_records(range(30, 60))
+		refresh_rollups(self.pair)
+		self.assertEqual(self.candles(hourly)[0], (self.start, 0, 60, -1, 59, 120))
+		self.assertEqual(
+			list(hourly.records.order_by('timestamp').values_list('count', flat=True)),
+			[60, 60, 60],
+		)
+
+	def test_granularities(self):
+		# Only granularities that are multiples of the pair's are rolled up
+		self.pair.granularity = 7 * 60
+		self.pair.save()
+		self.assertEqual(refresh_rollups(self.pair), [])
+		self.pair.granularity = 3600
+		self.pair.save()
+		self.assertEqual(
+			[rollup.granularity for rollup in refresh_rollups(self.pair)], [86400])
+
+
+class CurrencyRegistryTestCase(TestCase):
+	"""
+	Tests for looking up currencies without querying the database each time.
+	"""
+
+	fixtures = ['initial']
+
+	def test_lookups(self):
+		registry.invalidate()
+		with self.assertNumQueries(1):
+			self.assertEqual(registry.get(slug='fiat-usd').ticker, 'USD')
+			self.assertEqual(registry.get(ticker='BTC', fiat=False).slug, 'bitcoin')
+			self.assertEqual(registry.get(ticker='AUD').slug, 'fiat-aud')
+			with self.assertRaises(Currency.DoesNotExist):
+				registry.get(ticker='BTC', fiat=True)
+		# Changes to currencies are picked up
+		Currency.objects.create(slug='fiat-btc', ticker='BTC', name='Fake', fiat=True)
+		with self.assertRaises(Currency.MultipleObjectsReturned):
+			registry.get(ticker='BTC')
+		Currency.objects.filter(slug='fiat-btc').delete()
+		self.assertEqual(registry.get(ticker='BTC').slug, 'bitcoin')
+
+
+class CoinbaseCandlesHandler(BaseHTTPRequestHandler):
+	"""
+	Responds to requests for candles like the Coinbase API, with a candle for
+	every period from the start to the end inclusive (newest first), priced
+	at the number of minutes since the epoch.
+	"""
+
+	def do_GET(self):
+		url = urlsplit(self.path)
+		params = {key: value[0] for key, value in parse_qs(url.query).items()}
+		self.server.requests += [url.path]
+		start, end = (
+			int(datetime.fromisoformat(params[key]).timestamp())
+			for key in ('start', 'end')
+		)
+		granularity = int(params['granularity'])
+		body = json.dumps([
+			[time, time // 60, time // 60, time // 60, time // 60, 1]
+			for time in range(end, start - 1, -granularity)
+		]).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class CoinbaseImportTestCase(TestCase):
+	"""
+	Tests for importing movement data from the Coinbase API, against a local
+	stub server.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		self.server = start_stub_server(self, CoinbaseCandlesHandler, requests=[])
+		settings = override_settings(COINBASE_API_URL=self.server.url)
+		settings.enable()
+		self.addCleanup(settings.disable)
+		graph.invalidate()
+
+	def test_import(self):
+		call_command('import_coinbase_candles', 'btc-usd',
+			from_date='2019-01-01', to_date='2019-01-02', stdout=StringIO())
+		# A day of minutes takes five requests of up to 300 candles
+		self.assertEqual(len(self.server.requests), 5)
+		self.assertEqual(
+			self.server.requests[0], '/products/BTC-USD/candles')
+		pair = Pair.objects.get(data_source='Coinbase', granularity=60)
+		self.assertEqual(pair.records.count(), 60 * 24 + 1)
+		start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		self.assertEqual(pair.earliest_data, start)
+		self.assertEqual(pair.latest_data, start + timedelta(days=1))
+		# Prices are available locally without further requests
+		timestamp = start + timedelta(hours=1)
+		self.assertEqual(
+			convert(pair.source, pair.target, Decimal(2), timestamp),
+			Decimal(timestamp.timestamp() // 60 * 2),
+		)
+		# Incremental imports only request data from the latest onwards, which
+		# here is just the latest candle
+		call_command('import_coinbase_candles', incremental=True,
+			to_date='2019-01-02', stdout=StringIO())
+		self.assertEqual(len(self.server.requests), 6)
+		self.assertEqual(pair.records.count(), 60 * 24 + 1)
+		# Importing hourly candles doesn't import into the hourly rollup
+		call_command('import_coinbase_candles', granularity=60 * 60,
+			from_date='2019-01-01', to_date='2019-01-02', stdout=StringIO())
+		hourly = Pair.objects.get(
+			data_source='Coinbase', granularity=60 * 60, rollup_of__isnull=True)
+		self.assertEqual(hourly.records.count(), 25)
+		self.assertEqual(
+			Pair.objects.get(rollup_of=pair, granularity=60 * 60).records.count(), 25)
+
+	def test_exact_windows(self):
+		# Five hours of minutes span exactly one request, plus the candle at
+		# the end
+		start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+		end = start + timedelta(hours=5)
+		candles = numpy.concatenate(list(fetch_coinbase_candles('BTC-USD', start, end)))
+		self.assertEqual(len(self.server.requests), 2)
+		self.assertEqual(len(candles), 5 * 60 + 1)
+		self.assertEqual(candles['timestamp'][-1], end.timestamp())
+		# An end between candles doesn't request any past it
+		candles = numpy.concatenate(list(fetch_coinbase_candles(
+			'BTC-USD', start, end - timedelta(seconds=30))))
+		self.assertEqual(len(self.server.requests), 3)
+		self.assertEqual(len(candles), 5 * 60)
+
+
+class PriceStrategyTestCase(SimpleTestCase):
+	"""
+	Tests for the vectorised price estimation strategies.
+	"""
+
+	def setUp(self):
+		# Ten one-minute candles rising by one each minute, with an outlier
+		self.candles = numpy.zeros(10, dtype=CANDLE_ARRAY_DTYPE)
+		self.candles['timestamp'] = numpy.arange(10) * 60
+		self.candles['open'] = numpy.arange(10)
+		self.candles['close'] = numpy.arange(10) + 1
+		self.candles['low'] = numpy.arange(10)
+		self.candles['high'] = numpy.arange(10) + 1
+		self.candles['high'][5] = 100
+		self.lookups = numpy.array([-1, 0, 90, 300, 600, 6000])
+
+	def test_mid(self):
+		numpy.testing.assert_array_equal(
+			strategies['mid'](self.candles, 60, self.lookups),
+			[numpy.nan, 0.5, 1.5, 52.5, 9.5, 9.5],
+		)
+
+	def test_interpolated(self):
+		numpy.testing.assert_array_equal(
+			strategies['interpolated'](self.candles, 60, self.lookups),
+			[numpy.nan, 0, 1.5, 5, 10, 10],
+		)
+
+	def test_median(self):
+		# The outlier is replaced by the median of the candles around it
+		numpy.testing.assert_array_equal(
+			strategies['median'](self.candles, 60, self.lookups),
+			[numpy.nan, 0.5, 1.5, 6.5, 9.5, 9.5],
+		)
+
+	def test_exact(self):
+		# Each strategy's exact counterpart agrees with it on Decimal rows
+		rows = [
+			(datetime.fromtimestamp(candle['timestamp'], tz=timezone.utc),)
+			+ tuple(Decimal(candle[name]) for name in ('open', 'high', 'low', 'close'))
+			for candle in self.candles
+		]
+		for name, strategy in strategies.items():
+			prices = strategy(self.candles, 60, self.lookups)
+			self.assertEqual(
+				[
+					exact_price(strategy, rows, 60,
+						datetime.fromtimestamp(lookup, tz=timezone.utc))
+					for lookup in self.lookups
+				],
+				[None if numpy.isnan(price) else Decimal(price) for price in prices],
+				name,
+			)
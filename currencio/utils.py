@@ -1,87 +1,90 @@
 from collections import defaultdict
 from decimal import Decimal
-from functools import reduce
 
-from django.db import models
+from .graph import graph
+from .oracle import oracle
 
-from .models import MovementData, Pair
 
-
-MAX_SEARCH_DEPTH = 5
-
-def _find_paths(source, target, timestamp, depth=0, seen=[], path=[]):
-	"""
-	Recursive iterator that yields lists of trading pairs that provide a path 
-	from the source to target currency, where movement data is available for 
-	the given timestamp. Favours pairs with lower granularity if multiple pairs
-	between two given currencies are available. Does not search for paths
-	longer than `MAX_SEARCH_DEPTH` hops.
+def convert(source, target, amount, timestamp, tolerance=None):
 	"""
-	if depth > MAX_SEARCH_DEPTH:
-		return
-	# Make sure we don't loop back to the starting currency
-	if not seen:
-		seen = [source]
-	links = defaultdict(list)
-	# Find pairs that have source currency as either the source or the target
-	# curency, excluding ones where the other currency is one we've hopped from
-	# before, and excluding pairs that have no movement data for the timestamp.
-	for pair in Pair.objects.filter(
-		source=source,
-		earliest_data__lte=timestamp
-	).exclude(target__in=seen):
-		if pair.latest_data.timestamp() >= timestamp.timestamp() - pair.granularity:
-			links[pair.target] += [pair]
-	for pair in Pair.objects.filter(
-		target=source,
-		earliest_data__lte=timestamp
-	).exclude(source__in=seen):
-		if pair.latest_data.timestamp() >= timestamp.timestamp() - pair.granularity:
-			links[pair.source] += [pair]
-	# In case of multiple pairs to target currency found, use the first one 
-	# with lowest granularity.
-	if target in links:
-		finest = sorted(links[target], key=lambda x: x.granularity)[0]
-		yield path + [finest]
-	else:
-		for new_source, pairs in links.items():
-			# Use pair with lowest granularity to construct path found so far
-			finest = sorted(pairs, key=lambda x: x.granularity)[0]
-			for new_path in _find_paths(
-				new_source, target, timestamp,
-				depth=depth + 1,
-				seen=seen + list(links.keys()),
-				path=path + [finest]
-			):
-				yield new_path
+	Convert `amount` from the source to the target currency at the given
+	timestamp, via the shortest path of trading pairs with available
+	movement data. Returns None if there is no such path.
 
-
-def convert(source, target, amount, timestamp):
+	By default the finest-grained pairs are used. If `tolerance` is provided,
+	the coarsest pairs with a granularity of no more than `tolerance` seconds
+	are used instead (e.g. daily rollups for a tolerance of a day), which
+	need to look through far less movement data.
+	"""
 	# Check for no-op
 	if source == target:
 		return amount
-	# Find paths from source to target currency via trading pairs with
-	# available movement data
-	paths = list(_find_paths(source, target, timestamp))
-	if not paths:
+	# Find the shortest path from source to target currency via trading
+	# pairs with available movement data
+	path = graph.find_path(source, target, timestamp, tolerance=tolerance)
+	if path is None:
 		return None
-	# Trim down results to the one(s) with fewest conversions
-	min_length = len(sorted(paths, key=len)[0])
-	paths = [path for path in paths if len(path) == min_length]
-	# Pick the first (for lack of better metrics) of the remaining paths with 
-	# the lowest cumulative granularity
-	path = sorted(paths,
-		key=lambda path: reduce(int.__add__, (pair.granularity for pair in path))
-	)[0]
 	# Hop through the pairs in the path, converting the amount until it's in 
 	# the target currency
 	for pair in path:
+		price = oracle.price_at(pair, timestamp)
+		if price is None:
+			return None
 		if source == pair.source:
-			amount = amount * pair.price_at(timestamp)
+			amount = amount * price
 			source = pair.target
 		else:
-			amount = amount / pair.price_at(timestamp)
+			amount = amount / price
 			source = pair.source
 		if source == target:
 			return amount
 
+
+
+def convert_many(conversions, tolerance=None):
+	"""
+	Convert a sequence of (source, target, amount, timestamp) tuples the same
+	way `convert` would, returning a list of the converted amounts (or None
+	where no path was found) in the same order.
+
+	Rather than looking up prices one at a time, the timestamps needed are
+	grouped by the pairs on the paths found, and the movement data for each
+	pair is fetched with a single range query.
+	"""
+	results = [None] * len(conversions)
+	paths = {}
+	timestamps = defaultdict(set)
+	pairs = {}
+	for index, (source, target, amount, timestamp) in enumerate(conversions):
+		# Check for no-op
+		if source == target:
+			results[index] = amount
+			continue
+		path = graph.find_path(source, target, timestamp, tolerance=tolerance)
+		if path is None:
+			continue
+		paths[index] = path
+		for pair in path:
+			pairs[pair.pk] = pair
+			timestamps[pair.pk].add(timestamp)
+	# Look up the prices needed for each pair in one go
+	prices = {}
+	for pk, pair in pairs.items():
+		pair_timestamps = sorted(timestamps[pk])
+		prices[pk] = dict(zip(pair_timestamps, pair.prices_at(pair_timestamps)))
+	# Hop through the pairs in each path, as `convert` does
+	for index, path in paths.items():
+		source, target, amount, timestamp = conversions[index]
+		for pair in path:
+			price = prices[pair.pk][timestamp]
+			if price is None:
+				amount = None
+				break
+			if source == pair.source:
+				amount = amount * price
+				source = pair.target
+			else:
+				amount = amount / price
+				source = pair.source
+		results[index] = amount
+	return results
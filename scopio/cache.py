@@ -0,0 +1,156 @@
+"""
+Persistent on-disk cache of explorer responses, so re-parsing addresses
+doesn't refetch pages of transactions that can't have changed.
+"""
+
+from hashlib import sha256
+import json
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+from .utils import SQLiteConnections
+
+
+# Number of seconds the recorded access time of a response may be behind by,
+# so that most hits don't need to write
+ACCESS_RESOLUTION = 60
+
+
+class ResponseCache:
+	"""
+	Stores parsed JSON responses in an SQLite database at `path`, keyed by a
+	hash of their cache key (normally the URL they were fetched from).
+
+	Responses are either immutable, and kept until evicted, or mutable, in
+	which case they're treated as missing once older than `max_age` seconds.
+	The least recently used responses are evicted once the size of all
+	stored responses exceeds `max_size` bytes, which is tracked as they're
+	stored and deleted rather than summed up on every write.
+
+	Keeps count of lookups answered from the cache (`hits`) and of lookups
+	that weren't (`misses`).
+	"""
+
+	def __init__(self, path=None, max_size=None, max_age=None):
+		# Resolved when used, so that the path can be changed in settings
+		self._path = path
+		self.max_size = max_size or settings.EXPLORER_CACHE_MAX_SIZE
+		self.max_age = max_age or settings.EXPLORER_CACHE_MAX_AGE
+		self._connections = SQLiteConnections(self._setup)
+		self._lock = threading.Lock()
+		self.hits = self.misses = 0
+
+	@property
+	def path(self):
+		return self._path or settings.EXPLORER_CACHE_PATH
+
+	@property
+	def _connection(self):
+		return self._connections.get(self.path)
+
+	def _setup(self, connection):
+		connection.execute('''
+			CREATE TABLE IF NOT EXISTS responses (
+				key TEXT PRIMARY KEY,
+				body BLOB NOT NULL,
+				size INTEGER NOT NULL,
+				immutable INTEGER NOT NULL,
+				fetched REAL NOT NULL,
+				accessed REAL NOT NULL
+			)
+		''')
+		connection.execute(
+			'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+		# The total size of the responses, kept up to date by triggers
+		connection.execute(
+			'CREATE TABLE IF NOT EXISTS totals (size INTEGER NOT NULL)')
+		with connection:
+			connection.execute('''
+				INSERT INTO totals SELECT COALESCE(SUM(size), 0) FROM responses
+				WHERE NOT EXISTS (SELECT * FROM totals)
+			''')
+		connection.execute('''
+			CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses
+			BEGIN UPDATE totals SET size = size + new.size; END
+		''')
+		connection.execute('''
+			CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses
+			BEGIN UPDATE totals SET size = size - old.size; END
+		''')
+		# Rows replaced by INSERT OR REPLACE only fire delete triggers
+		# with recursive triggers on
+		connection.execute('PRAGMA recursive_triggers = ON')
+
+	def _hash(self, key):
+		return sha256(key.encode('utf-8')).hexdigest()
+
+	def get(self, key):
+		"""
+		Return the response stored under `key`, or None if there is none or
+		it's mutable and has expired.
+		"""
+		key = self._hash(key)
+		now = time.time()
+		with self._connection as connection:
+			row = connection.execute(
+				'SELECT body, accessed FROM responses WHERE key = ? AND (immutable OR fetched > ?)',
+				(key, now - self.max_age),
+			).fetchone()
+			if row is not None and now - row[1] > ACCESS_RESOLUTION:
+				connection.execute(
+					'UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+		with self._lock:
+			if row is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+		if row is None:
+			return None
+		return json.loads(zlib.decompress(row[0]))
+
+	def set(self, key, data, immutable=False):
+		"""
+		Store the response `data` under `key`, evicting the least recently
+		used responses if the cache has grown too large.
+		"""
+		body = zlib.compress(json.dumps(data).encode('utf-8'))
+		now = time.time()
+		with self._connection as connection:
+			connection.execute(
+				'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+				(self._hash(key), body, len(body), immutable, now, now),
+			)
+			size, = connection.execute('SELECT size FROM totals').fetchone()
+			if size > self.max_size:
+				evicted = []
+				for key, entry_size in connection.execute(
+					'SELECT key, size FROM responses ORDER BY accessed'):
+					if size <= self.max_size:
+						break
+					evicted += [(key,)]
+					size -= entry_size
+				connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+	def clear(self):
+		with self._connection as connection:
+			connection.execute('DELETE FROM responses')
+
+	def stats(self):
+		"""
+		Return the numbers of hits and misses of this process, and the number
+		and total size of the stored responses.
+		"""
+		lookups = self.hits + self.misses
+		entries, = self._connection.execute(
+			'SELECT COUNT(*) FROM responses').fetchone()
+		size, = self._connection.execute('SELECT size FROM totals').fetchone()
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'hit_rate': self.hits / lookups if lookups else None,
+			'entries': entries,
+			'size': size,
+		}
@@ -0,0 +1,175 @@
+"""
+Clusters of addresses likely to belong to the same wallet, deduced from
+addresses being spent from together as inputs of the same transaction
+(common-input ownership), and crawling of the addresses in a cluster that
+haven't been parsed yet.
+"""
+
+from django.db import transaction
+
+from .models import AddressSync, ClusteredAddress
+
+
+class ClusterIndex:
+	"""
+	A union-find forest of the addresses of `currency`, stored as a parent
+	pointer on each address (see `ClusteredAddress`), so that finding the
+	cluster of an address takes amortised near-constant time using union by
+	rank and path compression.
+
+	Only the addresses looked up (and their ancestors) are loaded, a level
+	of the forest per query, which path compression keeps to one or two.
+	Changes are kept in memory until saved.
+	"""
+
+	def __init__(self, currency):
+		self.currency = currency
+		self._parent = {}
+		self._rank = {}
+		# Addresses with no stored row, and stored ones with changes
+		self._new = set()
+		self._changed = set()
+
+	def _load(self, addresses):
+		"""
+		Load the provided addresses and all their ancestors, adding any not
+		stored yet as clusters of their own.
+		"""
+		missing = set(addresses) - self._parent.keys()
+		new = set(missing)
+		while missing:
+			for address, parent, rank in ClusteredAddress.objects.filter(
+				currency=self.currency, address__in=missing,
+			).values_list('address', 'parent', 'rank'):
+				self._parent[address] = parent
+				self._rank[address] = rank
+				new.discard(address)
+			missing = {
+				self._parent[address] for address in missing if address in self._parent
+			} - self._parent.keys()
+		for address in new:
+			self._parent[address] = address
+			self._rank[address] = 0
+		self._new |= new
+
+	def _set_parent(self, address, parent):
+		if self._parent[address] != parent:
+			self._parent[address] = parent
+			self._changed.add(address)
+
+	def find(self, address):
+		"""
+		Return the address representing the cluster of the provided address.
+		"""
+		self._load([address])
+		root = address
+		while self._parent[root] != root:
+			root = self._parent[root]
+		# Point every address on the way directly at the root
+		while address != root:
+			parent = self._parent[address]
+			self._set_parent(address, root)
+			address = parent
+		return root
+
+	def union(self, addresses):
+		"""
+		Merge the clusters of all of the provided addresses, and return the
+		address representing the merged cluster.
+		"""
+		addresses = list(addresses)
+		self._load(addresses)
+		roots = {self.find(address) for address in addresses}
+		# Attach the other roots to the one of highest rank, which only
+		# grows if another one was as high (sorting for determinism)
+		root = max(sorted(roots), key=self._rank.get)
+		for other in roots - {root}:
+			if self._rank[other] == self._rank[root]:
+				self._rank[root] += 1
+				self._changed.add(root)
+			self._set_parent(other, root)
+		for address in addresses:
+			self._set_parent(address, root)
+		return root
+
+	def members(self, address):
+		"""
+		Return the set of stored addresses in the same cluster as the provided
+		address (including itself), walking the forest down from its root a
+		level per query.
+		"""
+		self.save()
+		root = self.find(address)
+		members = {root}
+		level = {root}
+		while level:
+			level = set(ClusteredAddress.objects.filter(
+				currency=self.currency, parent__in=level,
+			).values_list('address', flat=True)) - members
+			members |= level
+		return members | {address}
+
+	def save(self):
+		"""
+		Store the addresses added and changed since the last save.
+		"""
+		if not self._new and not self._changed:
+			return
+		with transaction.atomic():
+			ClusteredAddress.objects.bulk_create([
+				ClusteredAddress(
+					currency=self.currency,
+					address=address,
+					parent=self._parent[address],
+					rank=self._rank[address],
+				)
+				for address in self._new
+			])
+			changed = list(
+				ClusteredAddress.objects.filter(
+					currency=self.currency, address__in=self._changed - self._new)
+			)
+			for row in changed:
+				row.parent = self._parent[row.address]
+				row.rank = self._rank[row.address]
+			ClusteredAddress.objects.bulk_update(changed, ['parent', 'rank'])
+		self._new = set()
+		self._changed = set()
+
+
+def crawl_cluster(explorer, address, depth=2, limit=100, workers=None):
+	"""
+	Parse the provided address, then the addresses in its cluster that
+	haven't been parsed yet, which may in turn grow the cluster, up to
+	`depth` times and `limit` addresses in total, fetching up to `workers`
+	addresses at a time (see `Explorer.fetch_addresses`).
+
+	Yields tuples of each address as it's parsed, the number of its
+	transactions parsed (or the exception raised fetching or parsing them),
+	and the depth it was found at.
+	"""
+	# Addresses parsed before are skipped with a lookup in this set
+	parsed = set(AddressSync.objects.filter(
+		currency=explorer.currency, synced__isnull=False,
+	).values_list('address', flat=True))
+	seen = {address}
+	pending = [address]
+	for level in range(depth + 1):
+		pending = [member for member in pending if member not in parsed][:limit]
+		for fetched, transactions, sync in explorer.fetch_addresses(
+			pending, incremental=True, workers=workers):
+			try:
+				if isinstance(transactions, Exception):
+					raise transactions
+				result = explorer.parse_address(fetched, transactions, sync)
+			except Exception as e:
+				result = e
+			parsed.add(fetched)
+			yield fetched, result, level
+		limit -= len(pending)
+		if not limit:
+			break
+		# Parsing may have grown the cluster, so look it up afresh
+		members = ClusterIndex(explorer.currency).members(address)
+		pending = sorted(members - seen)
+		seen |= members
@@ -0,0 +1,142 @@
+"""
+Index of local dumps of transactions, so the transactions of an address can
+be read from them without reading through (or loading) the whole dumps.
+
+Dumps are newline-delimited JSON files of transactions in the format of the
+blockchain.info API (see `scopio.explorers.bitcoin`), one per line, in any
+order.
+"""
+
+import json
+import os
+
+from django.conf import settings
+
+from .utils import SQLiteConnections
+
+
+# Number of index entries to insert at a time
+CHUNK_SIZE = 10000
+
+
+def transaction_addresses(transaction):
+	"""
+	Return the set of addresses appearing in the inputs or outputs of the
+	provided transaction.
+	"""
+	return {
+		input_['prev_out']['addr'] for input_ in transaction['inputs']
+		if 'addr' in input_.get('prev_out', {})
+	} | {output['addr'] for output in transaction['out'] if 'addr' in output}
+
+
+class DumpIndex:
+	"""
+	Stores the byte offsets of the transactions involving each address in the
+	indexed dumps, along with their times, in an SQLite database at `path`.
+
+	Dumps are reindexed when their size or modification time changes, and
+	only the lines added are read if they've only grown.
+	"""
+
+	def __init__(self, path=None):
+		self.path = path or settings.EXPLORER_DUMP_INDEX_PATH
+		self._connections = SQLiteConnections(self._setup)
+
+	@property
+	def _connection(self):
+		return self._connections.get(self.path)
+
+	def _setup(self, connection):
+		connection.execute('''
+			CREATE TABLE IF NOT EXISTS dumps (
+				id INTEGER PRIMARY KEY,
+				path TEXT UNIQUE NOT NULL,
+				size INTEGER NOT NULL,
+				modified REAL NOT NULL
+			)
+		''')
+		connection.execute('''
+			CREATE TABLE IF NOT EXISTS offsets (
+				address TEXT NOT NULL,
+				dump INTEGER NOT NULL,
+				offset INTEGER NOT NULL,
+				time INTEGER NOT NULL
+			)
+		''')
+		connection.execute(
+			'CREATE INDEX IF NOT EXISTS offsets_address ON offsets (address, time)')
+
+	def build(self, paths, rebuild=False):
+		"""
+		Index the dumps at the provided paths that are new or have changed
+		since they were last indexed (or all of them if `rebuild` is set),
+		yielding each path with the number of transactions indexed.
+		"""
+		for path in paths:
+			path = os.path.abspath(path)
+			stat = os.stat(path)
+			with self._connection as connection:
+				row = connection.execute(
+					'SELECT id, size, modified FROM dumps WHERE path = ?', (path,),
+				).fetchone()
+				start = 0
+				if row is None:
+					dump = connection.execute(
+						'INSERT INTO dumps (path, size, modified) VALUES (?, 0, 0)',
+						(path,),
+					).lastrowid
+				else:
+					dump, size, modified = row
+					if not rebuild and (size, modified) == (stat.st_size, stat.st_mtime):
+						yield path, 0
+						continue
+					if not rebuild and stat.st_size > size:
+						# Assume lines were appended
+						start = size
+					else:
+						connection.execute('DELETE FROM offsets WHERE dump = ?', (dump,))
+				indexed = self._index(connection, dump, path, start)
+				connection.execute(
+					'UPDATE dumps SET size = ?, modified = ? WHERE id = ?',
+					(stat.st_size, stat.st_mtime, dump),
+				)
+			yield path, indexed
+
+	def _index(self, connection, dump, path, start):
+		indexed = 0
+		entries = []
+		with open(path, 'rb') as file:
+			file.seek(start)
+			offset = start
+			for line in file:
+				if line.strip():
+					transaction = json.loads(line)
+					entries += [
+						(address, dump, offset, transaction['time'])
+						for address in transaction_addresses(transaction)
+					]
+					indexed += 1
+				offset += len(line)
+				if len(entries) >= CHUNK_SIZE:
+					connection.executemany(
+						'INSERT INTO offsets VALUES (?, ?, ?, ?)', entries)
+					entries = []
+		connection.executemany('INSERT INTO offsets VALUES (?, ?, ?, ?)', entries)
+		return indexed
+
+	def offsets(self, address):
+		"""
+		Return a list of the paths of the dumps and the byte offsets of the
+		transactions involving the provided address, newest first.
+		"""
+		return self._connection.execute('''
+			SELECT path, offset FROM offsets JOIN dumps ON dumps.id = offsets.dump
+			WHERE address = ? ORDER BY time DESC, dump DESC, offset DESC
+		''', (address,)).fetchall()
+
+	def stats(self):
+		dumps, = self._connection.execute('SELECT COUNT(*) FROM dumps').fetchone()
+		entries, addresses = self._connection.execute(
+			'SELECT COUNT(*), COUNT(DISTINCT address) FROM offsets').fetchone()
+		return {'dumps': dumps, 'entries': entries, 'addresses': addresses}
@@ -1,18 +1,144 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
 
-from currencio.models import Currency
+from django.conf import settings
+
+from cryptoscopio.http import client
+from currencio.registry import registry
+
+from ..cache import ResponseCache
+from ..models import AddressSync
+
+
+# Responses of all explorers are cached in the same store
+cache = ResponseCache()
+
+# Marks the end of the transactions of an address in its buffer
+_DONE = object()
+
+
+class _Buffer:
+	"""
+	A bounded queue of the transactions of an address, filled by the thread
+	fetching them and drained by the consumer, which abandons it when moving
+	on, so that the fetching thread stops rather than waiting for room.
+	"""
+
+	def __init__(self, size):
+		self.queue = queue.Queue(size)
+		self.abandoned = threading.Event()
+
+	def put(self, item):
+		"""
+		Add an item, waiting for room, and return whether it was added before
+		the buffer was abandoned.
+		"""
+		while not self.abandoned.is_set():
+			try:
+				self.queue.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def drain(self, item):
+		# Yields the provided first item and the rest, raising any exception
+		while item is not _DONE:
+			if isinstance(item, Exception):
+				raise item
+			yield item
+			item = self.queue.get()
 
 
 class Explorer:
-	def get_json(self, url):
-		# TODO: retry on failure
-		return requests.get(url).json()
+	def get_json(self, url, cache_key=None, immutable=False):
+		"""
+		Return the parsed JSON response from `url`, served from the response
+		cache (see `scopio.cache`) if possible, under `cache_key` if
+		provided, or the URL otherwise.
+
+		Immutable responses are kept until evicted, while others are
+		refetched once older than `settings.EXPLORER_CACHE_MAX_AGE` seconds.
+		`immutable` may also be a function taking the response and returning
+		whether it's immutable, e.g. depending on whether the transactions in
+		it are confirmed.
+		"""
+		cache_key = cache_key or url
+		data = cache.get(cache_key)
+		if data is None:
+			data = client.get_json(url)
+			cache.set(cache_key, data, immutable(data) if callable(immutable) else immutable)
+		return data
+
+	def sync_states(self, addresses):
+		"""
+		Return a mapping of the provided addresses to their sync states (see
+		`AddressSync`), new unsaved ones for addresses never parsed before.
+		"""
+		syncs = {
+			sync.address: sync for sync in AddressSync.objects.filter(
+				currency=self.currency, address__in=addresses)
+		}
+		return {
+			address: syncs.get(address) or AddressSync(currency=self.currency, address=address)
+			for address in addresses
+		}
+
+	def fetch_addresses(self, addresses, incremental=False, workers=None):
+		"""
+		Fetch the transactions for each of the provided addresses (see
+		`transactions_for_address`) concurrently, in up to `workers` threads
+		(`settings.EXPLORER_WORKERS` by default), and yield tuples of each
+		address, an iterator of its transactions (or the exception raised
+		fetching the first of them), and its sync state to pass on to
+		`parse_address`, in the order of `addresses`. If `incremental` is
+		set, only transactions newer than those last parsed are fetched.
+
+		Up to `settings.EXPLORER_BUFFER_SIZE` transactions of each address
+		are fetched ahead of the consumer, so memory use is bounded however
+		many transactions the addresses have. Iterators raise any exception
+		raised fetching later transactions, and are abandoned once the next
+		address is asked for.
+
+		Fetching only makes HTTP requests, so the caller is free to write to
+		the database while later addresses are still being fetched.
+		"""
+		syncs = self.sync_states(addresses)
+		if not incremental:
+			for sync in syncs.values():
+				sync.last_hash = ''
+		def fetch(address, buffer):
+			if buffer.abandoned.is_set():
+				return
+			transactions = self.transactions_for_address(address, syncs[address])
+			try:
+				for transaction in transactions:
+					if not buffer.put(transaction):
+						return
+				buffer.put(_DONE)
+			except Exception as e:
+				buffer.put(e)
+			finally:
+				transactions.close()
+		buffers = [_Buffer(settings.EXPLORER_BUFFER_SIZE) for _ in addresses]
+		with ThreadPoolExecutor(workers or settings.EXPLORER_WORKERS) as executor:
+			try:
+				for address, buffer in zip(addresses, buffers):
+					executor.submit(fetch, address, buffer)
+				for address, buffer in zip(addresses, buffers):
+					first = buffer.queue.get()
+					transactions = first if isinstance(first, Exception) \
+						else buffer.drain(first)
+					yield address, transactions, syncs[address]
+					buffer.abandoned.set()
+			finally:
+				for buffer in buffers:
+					buffer.abandoned.set()
 
 	@property
 	def currency(self):
-		if not hasattr(self, '_currency'):
-			self._currency = Currency.objects.get(slug=self.CURRENCY_SLUG)
-		return self._currency
+		return registry.get(slug=self.CURRENCY_SLUG)
 
 
 explorers = {}
@@ -25,4 +151,4 @@ def register_explorer(name):
 	return wrapped
 
 # Import all available explorers, so they register themselves
-from . import bitcoin
+from . import bitcoin, bitcoin_file
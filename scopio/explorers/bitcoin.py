@@ -1,20 +1,29 @@
-from datetime import datetime, timedelta, timezone
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from decimal import Decimal
 from functools import reduce
 from hashlib import sha256
+from itertools import islice
 
-import requests
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils.timezone import now
 
-from currencio.models import Currency
+from cryptoscopio.http import client
+from currencio.crossrates import to_reporting_currency
+from currencio.registry import registry
 from currencio.utils import convert
 
 from . import Explorer, register_explorer
+from ..clusters import ClusterIndex
 from ..models import Event, Record, RecordGroup
+from ..utils import RecordIndex, RecordWriter
 
 
 # TODO: No longer needed, remove
 def get_outgoing_amount(tx_hash, to_address):
-	tx = requests.get(f'https://blockchain.info/rawtx/{tx_hash}').json()
+	tx = client.get_json(f'https://blockchain.info/rawtx/{tx_hash}')
 	for outgoing in tx['out']:
 		if outgoing['addr'] == to_address:
 			return Decimal(outgoing['value']) / Decimal(10**8)
@@ -27,55 +36,29 @@ class BitcoinExplorer(Explorer):
 	CURRENCY_SLUG = 'bitcoin'
 	DISPLAY_NAME = 'Bitcoin'
 
-	# TODO: Move logic to data import command
 	def get_usd_price(self, timestamp):
 		"""
-		Returns the price of BTC in USD at given timestamp on Coinbase.
+		Returns the price of BTC in USD at given timestamp, from the movement
+		data in the database, e.g. loaded from Coinbase with the
+		`import_coinbase_candles` command, or None if there's none.
 
-		Note for future: Coinbase's BTC-USD data starts from 2015-01-08 01:24 UTC
-		>>> requests.get(
-			'https://api.pro.coinbase.com/products/BTC-USD/candles',
-			params={
-				'start':'2015-01-08T00:00:00Z',
-				'end':'2015-01-08T02:00:00Z',
-				'granularity':60
-			}
-		).json()
-		[...
-		[1420680420, 271.84, 276.34, 271.84, 276.34, 0.02],
-		[1420680240, 360, 360, 360, 360, 0.01]]
-		
-		>>> datetime.fromtimestamp(1420680240, tz=timezone.utc)
-		datetime.datetime(2015, 1, 8, 1, 24, tzinfo=datetime.timezone.utc)
-		
-		Some thoughts on how to calculate the price to return:
-		
-		The ideal value we want is the "last traded" price, which we don't have
-		enough precision to know exactly. Using the open price runs the risk of
-		it being an outlier it terms of being representative of the price.
-		Smoothing across multiple candles and discarding outliers is probably the
-		best approach. Also note that since this is for tax purposes, if we have
-		to err (which we do), we should err on the side that favours the taxman.
-		Would be interesting to make the chosen approach a setting, and compare
-		the final values across different approaches.
+		The ideal value we want is the "last traded" price, which we don't
+		have enough precision to know exactly. Also note that since this is
+		for tax purposes, if we have to err (which we do), we should err on
+		the side that favours the taxman. The approach is chosen by the
+		PRICE_STRATEGY setting, see `currencio.strategies`.
 		"""
-		minute_start = timestamp.replace(second=0, microsecond=0)
-		params = {
-			'start': minute_start.isoformat(),
-			'end': (minute_start + timedelta(seconds=60)).isoformat(),
-			'granularity': 60,
-		}
-		candles = requests.get(
-			'https://api.pro.coinbase.com/products/BTC-USD/candles',
-			params=params
-		)
-		time, low, high, open_, close, volume = candles.json(parse_float=Decimal)[0]
-		if time != minute_start.timestamp():
-			print(f'WARNING: candle start timestamp {time} doesn\'t match '
-				f'minute start timestamp {minute_start.timestamp()}')
-		return (low + high) / Decimal(2)
-		# Or maybe...?
-		return open_ + (Decimal(timestamp.timestamp()) - Decimal(minute_pice.timestamp())) / Decimal(60) * (close - open_)
+		return convert(self.currency, self.usd, Decimal(1), timestamp)
+
+	def get_price(self, timestamp):
+		"""
+		Returns the price of BTC in the reporting currency at given timestamp,
+		via its price in USD, or None if either isn't known.
+		"""
+		price = self.get_usd_price(timestamp)
+		if price is None:
+			return None
+		return to_reporting_currency(self.usd, price, timestamp)
 
 	def validate_address(self, address):
 		"""
@@ -109,238 +92,367 @@ class BitcoinExplorer(Explorer):
 			return 'Address failed integrity checks, may be mistyped'
 		return None
 
-	def transactions_for_address(self, address):
+	def get_page(self, address, offset, n_tx=None):
+		"""
+		Return the page of transactions for the provided address starting at
+		`offset`, as returned by the blockchain.info API.
+
+		Pages are numbered from the newest transaction, so the first page is
+		only cached briefly. Later pages are cached by the address's number
+		of transactions (`n_tx`, known from the first page) as well, since
+		they can't have changed unless it has, and kept for good once all
+		their transactions are confirmed.
+		"""
+		url = self.ADDRESS_API.format(
+			address=address,
+			limit=self.MAX_LIMIT,
+			offset=offset,
+		)
+		if not offset:
+			return self.get_json(url)
+		return self.get_json(
+			url,
+			cache_key=f'{url}#n_tx={n_tx}',
+			immutable=lambda data: all('block_height' in tx for tx in data['txs']),
+		)
+
+	def transactions_for_address(self, address, sync=None):
 		"""
 		An iterator of transaction dictionaries for the provided public
-		Bitcoin address.
+		Bitcoin address, newest first.
+
+		If the sync state of the address is provided (see `AddressSync`),
+		stops at the newest transaction parsed before, and updates the state
+		(without saving it) to the newest transaction and the current number
+		of transactions.
+
+		Once the first page is in, the number of transactions is known, so
+		up to `settings.EXPLORER_PREFETCH_PAGES` of the following pages are
+		fetched in the background while the consumer goes through earlier
+		ones. Transactions are yielded in the same order regardless.
 		"""
-		offset = 0
-		while True:
-			data = self.get_json(self.ADDRESS_API.format(
-				address=address,
-				limit=self.MAX_LIMIT,
-				offset=offset,
-			))
-			for transaction in data['txs']:
-				yield transaction
-			if len(data['txs']) < self.MAX_LIMIT:
+		transactions = self._transactions_for_address(address)
+		n_tx = next(transactions)
+		last_hash = sync.last_hash if sync is not None else None
+		for index, transaction in enumerate(transactions):
+			if last_hash and transaction['hash'] == last_hash:
+				# Stop fetching pages as well
+				transactions.close()
 				break
-			offset += self.MAX_LIMIT
+			if sync is not None and not index:
+				sync.last_hash = transaction['hash']
+			yield transaction
+		if sync is not None:
+			sync.n_tx = n_tx
+
+	def _transactions_for_address(self, address):
+		# Yields the number of transactions first, then the transactions
+		data = self.get_page(address, 0)
+		n_tx = data['n_tx']
+		yield n_tx
+		yield from data['txs']
+		if len(data['txs']) < self.MAX_LIMIT:
+			return
+		offsets = iter(range(self.MAX_LIMIT, n_tx, self.MAX_LIMIT))
+		with ThreadPoolExecutor(settings.EXPLORER_PREFETCH_PAGES) as executor:
+			pages = deque(
+				executor.submit(self.get_page, address, offset, n_tx)
+				for offset in islice(offsets, settings.EXPLORER_PREFETCH_PAGES)
+			)
+			while pages:
+				data = pages.popleft().result()
+				yield from data['txs']
+				if len(data['txs']) < self.MAX_LIMIT:
+					# Don't fetch any further pages
+					for page in pages:
+						page.cancel()
+					break
+				# Keep the same number of pages in flight
+				for offset in islice(offsets, 1):
+					pages.append(executor.submit(self.get_page, address, offset, n_tx))
 
-	def parse_address(self, address):
+	def parse_address(self, address, transactions=None, sync=None, incremental=False):
 		"""
 		Create Records for the transactions associated with the provided public
-		Bitcoin address.
+		Bitcoin address, fetching them unless already fetched ones are
+		provided along with the address's sync state (see `fetch_addresses`).
+		If `incremental` is set, only transactions newer than those last
+		parsed are fetched.
+
+		Transactions are matched against existing records a page at a time,
+		using an index of the records involving the page's transactions (see
+		`RecordIndex`), and the records created for each page are written
+		at once (see `RecordWriter`), so on backends that return primary keys
+		from bulk inserts, the number of queries made doesn't grow with the
+		number of records. Nothing is written if parsing fails.
+
+		Addresses spent from together with the address are added to its
+		cluster (see `scopio.clusters`). Returns the number of transactions
+		parsed.
 		"""
+		if sync is None:
+			sync = self.sync_states([address])[address]
+			if not incremental:
+				sync.last_hash = ''
+		if transactions is None:
+			transactions = self.transactions_for_address(address, sync)
 		# Other public addresses likely to represent the same private key, 
-		# deduced from transaction inputs
-		# TODO: Suggest importing these other addresses
+		# deduced from transaction inputs, to add to the address's cluster
 		other_addresses = set()
-		for transaction in self.transactions_for_address(address):
-			input_addresses = [
-				input_['prev_out']['addr'] \
-				for input_ in transaction['inputs'] if 'prev_out' in input_
-			]
-			total_input = sum(
-				input_['prev_out']['value'] \
-				for input_ in transaction['inputs'] if 'prev_out' in input_
-			)
-			total_output = sum(o['value'] for o in transaction['out'])
-			timestamp=datetime.fromtimestamp(transaction['time'], tz=timezone.utc)
-			# Try to find existing record group for this transaction
-			group = RecordGroup.objects.filter(
-				records__transaction=transaction['hash']).first()
-			# Create one if one wasn't found
-			group = group or RecordGroup.objects.create(timestamp=timestamp)
-			if address in input_addresses:
-				# If the transaction is drawing from an input that was sent to 
-				# this address, we consider it an outgoing transfer, because it
-				# indicates that the initiator of this transaction has access
-				# to the private key for that address (or similar authority).
-				for output in transaction['out']:
-					# Check if we've parsed this transaction output before as 
-					# an outgoing transfer
-					if Record.objects.filter(
-						transaction=transaction['hash'],
-						currency=self.currency,
-						outgoing=True,
-						identifier=output['n'],
-					).exists():
-						continue
-					amount = Decimal(output['value']) / Decimal(10 ** 8)
-					# Check for a matching incoming transfer on a parsed address
-					existing = group.records.filter(
-						transaction=transaction['hash'],
-						currency=self.currency,
-						outgoing=False,
-						identifier=output['n'],
+		transactions = iter(transactions)
+		parsed = 0
+		writer = RecordWriter()
+		# Parse the address as a whole or not at all
+		with db_transaction.atomic():
+			while True:
+				page = list(islice(transactions, self.MAX_LIMIT))
+				if not page:
+					break
+				index = RecordIndex(transaction['hash'] for transaction in page)
+				for transaction in page:
+					other_addresses |= self._parse_transaction(
+						address, transaction, index, writer)
+				writer.flush()
+				parsed += len(page)
+			if other_addresses:
+				clusters = ClusterIndex(self.currency)
+				clusters.union({address} | other_addresses)
+				clusters.save()
+			sync.synced = now()
+			sync.save()
+		return parsed
+
+	def _parse_transaction(self, address, transaction, index, writer):
+		"""
+		Create Records for a transaction associated with the provided public
+		Bitcoin address with `writer`, matching them against the records in
+		`index`, and return the other addresses appearing in its inputs.
+		"""
+		other_addresses = set()
+		currency = self.currency
+		input_addresses = [
+			input_['prev_out']['addr'] \
+			for input_ in transaction['inputs'] if 'prev_out' in input_
+		]
+		total_input = sum(
+			input_['prev_out']['value'] \
+			for input_ in transaction['inputs'] if 'prev_out' in input_
+		)
+		total_output = sum(o['value'] for o in transaction['out'])
+		timestamp=datetime.fromtimestamp(transaction['time'], tz=timezone.utc)
+		# Try to find existing record group for this transaction
+		group = index.group(transaction['hash'])
+		# Create one if one wasn't found
+		group = group or writer.add(RecordGroup(timestamp=timestamp))
+		# Records of this transaction in any group, and all records in its
+		# group, both kept up to date by the index as records are added
+		transaction_records = index.transaction_records(transaction['hash'])
+		group_records = index.records(group)
+		if address in input_addresses:
+			# If the transaction is drawing from an input that was sent to 
+			# this address, we consider it an outgoing transfer, because it
+			# indicates that the initiator of this transaction has access
+			# to the private key for that address (or similar authority).
+			for output in transaction['out']:
+				# Check if we've parsed this transaction output before as 
+				# an outgoing transfer
+				if any(
+					record.currency_id == currency.pk
+					and record.outgoing
+					and str(record.identifier) == str(output['n'])
+					for record in transaction_records
+				):
+					continue
+				amount = Decimal(output['value']) / Decimal(10 ** 8)
+				# Check for a matching incoming transfer on a parsed address
+				existing = [
+					record for record in group_records
+					if record.transaction == transaction['hash']
+					and record.currency_id == currency.pk
+					and not record.outgoing
+					and str(record.identifier) == str(output['n'])
+				]
+				if not existing:
+					# Check for a matching incoming transfer on an exchange.
+					# If the amounts don't match due to an incoming fee, 
+					# it's up to the user to match them, which is when a
+					# record for that fee will be created.
+					existing = [
+						record for record in group_records
+						if record.transaction == transaction['hash']
+						and record.currency_id == currency.pk
+						and record.amount == amount
+						and not record.outgoing
+						and record.platform
+					]
+				# Create a record for this transaction output
+				record = writer.add(Record(
+					timestamp=timestamp,
+					group=group,
+					currency=currency,
+					amount=amount,
+					outgoing=True,
+					transaction=transaction['hash'],
+					to_address=output['addr'],
+					identifier=output['n'],
+					needs_event=not existing,
+				))
+				index.add(record)
+				if existing:
+					# There's a rabbit hole of an edge case here when there
+					# are multiple outputs of the same amount going to an
+					# exchange. We gloss over it by marking the first
+					# unmatched possible match as a match.
+					existing = _first(
+						record for record in existing if record.needs_event)
+					if existing:
+						existing.needs_event = False
+						writer.update(existing, 'needs_event')
+			# Create a record and event for the transaction fee
+			tx_fee = Decimal(total_input - total_output) / Decimal(10 ** 8)
+			if tx_fee and not any(
+				record.currency_id == currency.pk
+				and record.amount == tx_fee
+				and record.is_fee
+				for record in group_records
+			):
+				record = writer.add(Record(
+					timestamp=timestamp,
+					group=group,
+					currency=currency,
+					amount=tx_fee,
+					outgoing=True,
+					transaction=transaction['hash'],
+					is_fee=True,
+					needs_event=False,
+				))
+				index.add(record)
+				event = writer.add(Event(
+					type=Event.DISPOSAL_FEE,
+					record=record,
+					currency=currency,
+					amount=tx_fee,
+					price=self.get_price(timestamp),
+				))
+			# Any other addresses appearing in the inputs are likely to be
+			# alternate keys from the same wallet, since the user 
+			# initiating this transaction was able to draw from them.
+			other_addresses |= set(input_addresses) - set([address])
+		# Go through the outputs again, this time looking for matching
+		# destination addresses, and parse those as incoming transfers.
+		# Not using an `else` here ensures that any transfers to the same 
+		# address as the sender are parsed both as outgoing and incoming.
+		for output in transaction['out']:
+			# Only the output sent to this address is relevant, there may
+			# be many others to other addresses. No address is specified
+			# for null data transactions.
+			if 'addr' in output and output['addr'] == address:
+				# Check if we've parsed this transaction output before as 
+				# an incoming transfer
+				if any(
+					record.currency_id == currency.pk
+					and not record.outgoing
+					and str(record.identifier) == str(output['n'])
+					for record in transaction_records
+				):
+					continue
+				amount = Decimal(output['value']) / Decimal(10 ** 8)
+				# Check for a matching outgoing transfer on a parsed address
+				existing = _first(
+					record for record in group_records
+					if record.transaction == transaction['hash']
+					and record.currency_id == currency.pk
+					and record.outgoing
+					and str(record.identifier) == str(output['n'])
+				)
+				if not existing:
+					# Check for a matching outgoing transfer on an exchange.
+					# It will be common for the amount to be larger on such
+					# a match, since exchanges include tranfer fees as part
+					# of the amount in an export.
+					existing = _first(
+						record for record in group_records
+						if record.transaction == transaction['hash']
+						and record.currency_id == currency.pk
+						and record.to_address == address
+						and record.outgoing
+						and record.platform
+						and record.amount >= amount
 					)
-					if not existing:
-						# Check for a matching incoming transfer on an exchange.
-						# If the amounts don't match due to an incoming fee, 
-						# it's up to the user to match them, which is when a
-						# record for that fee will be created.
-						existing = group.records.filter(
-							transaction=transaction['hash'],
-							currency=self.currency,
-							amount=amount,
-							outgoing=False,
-							platform__gt='',
-						)
-					# Create a record for this transaction output
-					record = Record.objects.create(
-						timestamp=timestamp,
-						group=group,
-						currency=self.currency,
+				# Create a record for this transaction output
+				record = writer.add(Record(
+					timestamp=timestamp,
+					group=group,
+					currency=currency,
+					amount=amount,
+					outgoing=False,
+					transaction=transaction['hash'],
+					to_address=address,
+					identifier=output['n'],
+					needs_event=bool(input_addresses) and not existing,
+				))
+				index.add(record)
+				# Check if this was a mining reward and create zero-cost 
+				# acquisition event if it is
+				if not input_addresses:
+					event = writer.add(Event(
+						type=Event.ACQUISITION,
+						record=record,
+						currency=currency,
 						amount=amount,
-						outgoing=True,
-						transaction=transaction['hash'],
-						to_address=output['addr'],
-						identifier=output['n'],
-						needs_event=not existing,
-					)
-					if existing:
-						# There's a rabbit hole of an edge case here when there
-						# are multiple outputs of the same amount going to an
-						# exchange. We gloss over it by marking the first
-						# unmatched possible match as a match.
-						existing = existing.filter(needs_event=True).first()
-						if existing:
-							existing.needs_event = False
-							existing.save()
-				# Create a record and event for the transaction fee
-				tx_fee = Decimal(total_input - total_output) / Decimal(10 ** 8)
-				if tx_fee and not group.records.filter(
-					currency=self.currency, amount=tx_fee, is_fee=True,
-				).exists():
-					record = Record.objects.create(
+						price=Decimal(0),
+					))
+				if existing and amount < existing.amount and not any(
+					record.currency_id == currency.pk
+					and record.amount == existing.amount - amount
+					and record.is_fee
+					for record in group_records
+				):
+					# If we found a matching outgoing transfer from an
+					# exchange, but its amount is larger, we consider the
+					# difference as the transfer fee and create a record.
+					record = writer.add(Record(
 						timestamp=timestamp,
 						group=group,
-						currency=self.currency,
-						amount=tx_fee,
+						currency=currency,
+						amount=existing.amount - amount,
 						outgoing=True,
 						transaction=transaction['hash'],
 						is_fee=True,
 						needs_event=False,
-					)
-					event = Event.objects.create(
+					))
+					index.add(record)
+					event = writer.add(Event(
 						type=Event.DISPOSAL_FEE,
 						record=record,
-						currency=self.currency,
-						amount=tx_fee,
-						# TODO: Move price calculation to a context with user currency access
-						price=convert(
-							Currency.objects.get(ticker='USD', fiat=True),
-							Currency.objects.get(ticker='AUD', fiat=True),
-							self.get_usd_price(timestamp),
-							timestamp,
-						)
-					)
-				# Any other addresses appearing in the inputs are likely to be
-				# alternate keys from the same wallet, since the user 
-				# initiating this transaction was able to draw from them.
-				# TODO: Filter out addresses we've already parsed
-				other_addresses |= set(input_addresses) - set([address])
-			# Go through the outputs again, this time looking for matching
-			# destination addresses, and parse those as incoming transfers.
-			# Not using an `else` here ensures that any transfers to the same 
-			# address as the sender are parsed both as outgoing and incoming.
-			for output in transaction['out']:
-				# Only the output sent to this address is relevant, there may
-				# be many others to other addresses. No address is specified
-				# for null data transactions.
-				if 'addr' in output and output['addr'] == address:
-					# Check if we've parsed this transaction output before as 
-					# an incoming transfer
-					if Record.objects.filter(
-						transaction=transaction['hash'],
-						currency=self.currency,
-						outgoing=False,
-						identifier=output['n'],
-					).exists():
-						continue
-					amount = Decimal(output['value']) / Decimal(10 ** 8)
-					# Check for a matching outgoing transfer on a parsed address
-					existing = group.records.filter(
-						transaction=transaction['hash'],
-						currency=self.currency,
-						outgoing=True,
-						identifier=output['n'],
-					).first()
-					if not existing:
-						# Check for a matching outgoing transfer on an exchange.
-						# It will be common for the amount to be larger on such
-						# a match, since exchanges include tranfer fees as part
-						# of the amount in an export.
-						existing = group.records.filter(
-							transaction=transaction['hash'],
-							currency=self.currency,
-							to_address=address,
-							outgoing=True,
-							platform__gt='',
-							amount__gte=amount,
-						).first()
-					# Create a record for this transaction output
-					record = Record.objects.create(
-						timestamp=timestamp,
-						group=group,
-						currency=self.currency,
-						amount=amount,
-						outgoing=False,
-						transaction=transaction['hash'],
-						to_address=address,
-						identifier=output['n'],
-						needs_event=bool(input_addresses) and not existing,
-					)
-					# Check if this was a mining reward and create zero-cost 
-					# acquisition event if it is
-					if not input_addresses:
-						event = Event.objects.create(
-							type=Event.ACQUISITION,
-							record=record,
-							currency=self.currency,
-							amount=amount,
-							price=Decimal(0),
-						)
-					if existing and amount < existing.amount \
-					and not group.records.filter(
-						currency=self.currency,
+						currency=currency,
 						amount=existing.amount - amount,
-						is_fee=True,
-					).exists():
-						# If we found a matching outgoing transfer from an
-						# exchange, but its amount is larger, we consider the
-						# difference as the transfer fee and create a record.
-						record = Record.objects.create(
-							timestamp=timestamp,
-							group=group,
-							currency=self.currency,
-							amount=existing.amount - amount,
-							outgoing=True,
-							transaction=transaction['hash'],
-							is_fee=True,
-							needs_event=False,
-						)
-						event = Event.objects.create(
-							type=Event.DISPOSAL_FEE,
-							record=record,
-							currency=self.currency,
-							amount=existing.amount - amount,
-							# TODO: Move price calculation to a context with user currency access
-							price=convert(
-								Currency.objects.get(ticker='USD', fiat=True),
-								Currency.objects.get(ticker='AUD', fiat=True),
-								self.get_usd_price(timestamp),
-								timestamp,
-							)
-						)
-					# TODO: Edge case where two outputs with the same amount
-					# are sent to an exchange and to own address, but own 
-					# address is parsed after the exchange. This can end up 
-					# matching the first output to both the exchange and own 
-					# wallet, leaving the second output unmatched.
-					if existing:
-						existing.needs_event = False
-						existing.save()
-			group.refresh_timestamp()
+						price=self.get_price(timestamp),
+					))
+				# TODO: Edge case where two outputs with the same amount
+				# are sent to an exchange and to own address, but own 
+				# address is parsed after the exchange. This can end up 
+				# matching the first output to both the exchange and own 
+				# wallet, leaving the second output unmatched.
+				if existing:
+					existing.needs_event = False
+					writer.update(existing, 'needs_event')
+		# Keep the group's timestamp that of its earliest record
+		earliest = min(record.timestamp for record in group_records)
+		if group.timestamp != earliest:
+			group.timestamp = earliest
+			writer.update(group, 'timestamp')
+		return other_addresses
+
+	@property
+	def usd(self):
+		return registry.get(ticker='USD', fiat=True)
+
 
+def _first(records):
+	"""
+	Return the earliest of the provided records, as `QuerySet.first()` would
+	for records ordered by time, or None if there are none. Of records with
+	the same time, the first one provided is returned.
+	"""
+	return min(records, key=lambda record: record.timestamp, default=None)
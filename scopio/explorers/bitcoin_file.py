@@ -0,0 +1,59 @@
+import json
+
+from . import register_explorer
+from .bitcoin import BitcoinExplorer
+from ..dumps import DumpIndex
+
+
+@register_explorer('bitcoin-file')
+class FileBitcoinExplorer(BitcoinExplorer):
+	"""
+	Reads the transactions of addresses from local dumps of transactions
+	(see `scopio.dumps`) instead of the blockchain.info API, e.g. to backfill
+	addresses in bulk or to benchmark parsing without the network.
+
+	Dumps have to be indexed first, with the `index_transaction_dumps`
+	command.
+	"""
+	DISPLAY_NAME = 'Bitcoin (local dumps)'
+
+	def __init__(self, index=None):
+		self.index = index or DumpIndex()
+
+	def get_page(self, address, offset, n_tx=None):
+		"""
+		Return the page of transactions for the provided address starting at
+		`offset`, in the same format as the blockchain.info API.
+		"""
+		offsets = self.index.offsets(address)
+		return {
+			'n_tx': len(offsets),
+			'txs': list(self._read(offsets[offset:offset + self.MAX_LIMIT])),
+		}
+
+	def _transactions_for_address(self, address):
+		# Yields the number of transactions first, then the transactions
+		offsets = self.index.offsets(address)
+		yield len(offsets)
+		for start in range(0, len(offsets), self.MAX_LIMIT):
+			yield from self._read(offsets[start:start + self.MAX_LIMIT])
+
+	def _read(self, offsets):
+		"""
+		Read the transactions at the provided dump paths and byte offsets, in
+		order of their offsets in each dump to keep seeks short, and yield
+		them in the order provided.
+		"""
+		transactions = {}
+		files = {}
+		try:
+			for path, offset in sorted(offsets):
+				if path not in files:
+					files[path] = open(path, 'rb')
+				files[path].seek(offset)
+				transactions[path, offset] = json.loads(files[path].readline())
+		finally:
+			for file in files.values():
+				file.close()
+		for path, offset in offsets:
+			yield transactions[path, offset]
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...clusters import ClusterIndex, crawl_cluster
+from ...explorers import explorers
+
+
+class Command(BaseCommand):
+	help = 'Parse an address, and the addresses likely to belong to the same ' \
+		'wallet (spent from together with it) that haven\'t been parsed yet.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('address')
+		parser.add_argument('--blockchain', default='bitcoin', choices=list(explorers),
+			help='Blockchain of the address (default: bitcoin)')
+		parser.add_argument('--depth', type=int, default=2,
+			help='Number of times to expand the cluster by parsing its new addresses')
+		parser.add_argument('--limit', type=int, default=100,
+			help='Maximum number of addresses to parse')
+		parser.add_argument('--workers', type=int,
+			help='Number of addresses to fetch concurrently')
+
+	def handle(self, *args, **options):
+		explorer = explorers[options['blockchain']]
+		error = explorer.validate_address(options['address'])
+		if error:
+			raise CommandError(error)
+		if options['depth'] < 0 or options['limit'] < 1:
+			raise CommandError('Depth and limit must be positive numbers')
+		if options['workers'] is not None and options['workers'] < 1:
+			raise CommandError('Number of workers must be a positive number')
+		for address, parsed, level in crawl_cluster(
+			explorer, options['address'], options['depth'], options['limit'],
+			options['workers'],
+		):
+			if isinstance(parsed, Exception):
+				self.stderr.write(f'Failed to parse {address}: {parsed}')
+				continue
+			self.stdout.write(
+				f'Parsed {address} (depth {level}): {parsed} new transactions.')
+		members = ClusterIndex(explorer.currency).members(options['address'])
+		self.stdout.write(f'Done. The cluster has {len(members)} addresses.')
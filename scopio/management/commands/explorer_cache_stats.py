@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ...cache import ResponseCache
+
+
+class Command(BaseCommand):
+	help = 'Show the number and total size of the explorer responses cached, ' \
+		'optionally clearing them.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--clear', action='store_true',
+			help='Delete all cached responses')
+
+	def handle(self, *args, **options):
+		cache = ResponseCache()
+		if options['clear']:
+			cache.clear()
+			self.stdout.write('Cleared the explorer cache.')
+		stats = cache.stats()
+		self.stdout.write(
+			f'{stats["entries"]} responses cached, taking '
+			f'{stats["size"] / 1024 ** 2:.1f} of {cache.max_size / 1024 ** 2:.1f} MiB.'
+		)
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...dumps import DumpIndex
+
+
+class Command(BaseCommand):
+	help = 'Index the transactions of each address in local dumps of ' \
+		'transactions, for the bitcoin-file explorer to read them from.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('paths', nargs='*', metavar='path',
+			help='Newline-delimited JSON dumps to index (default: EXPLORER_DUMP_PATHS)')
+		parser.add_argument('--rebuild', action='store_true',
+			help='Index dumps again even if they haven\'t changed')
+
+	def handle(self, *args, **options):
+		paths = options['paths'] or settings.EXPLORER_DUMP_PATHS
+		if not paths:
+			raise CommandError('No dumps provided or configured')
+		index = DumpIndex()
+		started = time.monotonic()
+		try:
+			for path, indexed in index.build(paths, rebuild=options['rebuild']):
+				self.stdout.write(f'Indexed {indexed} new transactions in {path}.')
+		except (OSError, ValueError) as e:
+			raise CommandError(f'Failed to index dumps: {e}')
+		stats = index.stats()
+		self.stdout.write(
+			f'Done in {time.monotonic() - started:.2f}s. {stats["dumps"]} dumps '
+			f'indexed, with {stats["entries"]} entries for {stats["addresses"]} addresses.'
+		)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from ...explorers import cache, explorers
+from ...models import AddressSync
+
+
+class Command(BaseCommand):
+	help = 'Parse the transactions of all previously parsed addresses that ' \
+		'are newer than the ones last parsed.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--older-than', type=int, metavar='SECONDS',
+			help='Only sync addresses last synced at least this long ago')
+		parser.add_argument('--full', action='store_true',
+			help='Fetch and check all transactions of each address again')
+		parser.add_argument('--blockchain', choices=list(explorers),
+			help='Explorer to sync addresses with (default: the first one '
+				'registered for each currency)')
+
+	def handle(self, *args, **options):
+		syncs = AddressSync.objects.all()
+		if options['older_than']:
+			syncs = syncs.filter(
+				synced__lte=now() - timedelta(seconds=options['older_than']))
+		selected = {}
+		if options['blockchain']:
+			explorer = explorers[options['blockchain']]
+			selected[explorer.currency] = explorer
+		else:
+			for explorer in explorers.values():
+				selected.setdefault(explorer.currency, explorer)
+		for explorer in selected.values():
+			addresses = list(syncs.filter(currency=explorer.currency)
+				.values_list('address', flat=True))
+			for address, transactions, sync in explorer.fetch_addresses(
+				addresses, incremental=not options['full']):
+				started = time.monotonic()
+				try:
+					if isinstance(transactions, Exception):
+						raise transactions
+					parsed = explorer.parse_address(address, transactions, sync)
+				except Exception as e:
+					self.stderr.write(f'Failed to sync {address}: {e}')
+					continue
+				self.stdout.write(
+					f'Synced {address}: {parsed} new transactions, fetched and '
+					f'parsed in {time.monotonic() - started:.2f}s.'
+				)
+		stats = cache.stats()
+		if stats['hit_rate'] is not None:
+			self.stdout.write(
+				f'{stats["hits"]} responses served from the explorer cache, '
+				f'{stats["misses"]} fetched ({stats["hit_rate"]:.0%} hit rate).'
+			)
@@ -36,6 +36,8 @@ class Record(models.Model):
 
 	class Meta:
 		ordering = ['timestamp']
+		# For checking which records of a platform were already parsed
+		index_together = ['platform', 'identifier']
 
 	def __str__(self):
 		if self.is_fee:
@@ -81,9 +83,8 @@ class Event(models.Model):
 		ordering = ['record__timestamp']
 
 	def __str__(self):
-		# TODO: replace this with a sane method of getting the price currency
-		from currencio.models import Currency
-		user_currency = Currency.objects.get(ticker='AUD', fiat=True)
+		from currencio.crossrates import reporting_currency
+		user_currency = reporting_currency()
 		return ''.join((
 			f'{self.get_type_display()}: {self.currency.format_amount(self.amount)}',
 			f' at {user_currency.format_amount(self.price)}' if self.price is not None else '',
@@ -100,3 +101,63 @@ class Event(models.Model):
 		if self.type in [Event.FIAT_FEE]:
 			return f'{self.amount:.2f}'
 		return f'{str(self.amount).rstrip("0")}'
+
+
+class ImportedFile(models.Model):
+	"""
+	A file of records parsed with a platform's parser, identified by a hash
+	of its contents, so that parsing the same file again can be skipped.
+	"""
+	platform = models.CharField(max_length=64)
+	fingerprint = models.CharField(max_length=64)
+	# Number of rows in the file, all of which are skipped if parsed again
+	rows = models.PositiveIntegerField()
+	imported = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		ordering = ['imported']
+		unique_together = ['platform', 'fingerprint']
+
+	def __str__(self):
+		return f'{self.platform} file {self.fingerprint[:12]} ({self.rows} rows)'
+
+
+class AddressSync(models.Model):
+	"""
+	How far the transactions of an address have been parsed, so that it can
+	be synced again incrementally.
+	"""
+	currency = models.ForeignKey('currencio.Currency', on_delete=models.CASCADE)
+	address = models.CharField(max_length=1024)
+	# Hash of the newest transaction parsed, and the number of transactions
+	# the explorer reported for the address at the time
+	last_hash = models.CharField(max_length=1024, blank=True)
+	n_tx = models.PositiveIntegerField(default=0)
+	synced = models.DateTimeField(null=True)
+
+	class Meta:
+		ordering = ['synced']
+		unique_together = ['currency', 'address']
+
+	def __str__(self):
+		return f'{self.address} ({self.n_tx} transactions)'
+
+
+class ClusteredAddress(models.Model):
+	"""
+	An address in a union-find forest of addresses likely to belong to the
+	same wallet (see `scopio.clusters`), pointing at its parent in the tree
+	of its cluster, or at itself if it represents the cluster.
+	"""
+	currency = models.ForeignKey('currencio.Currency', on_delete=models.CASCADE)
+	address = models.CharField(max_length=1024)
+	parent = models.CharField(max_length=1024)
+	# Upper bound of the height of the tree below the address
+	rank = models.PositiveSmallIntegerField(default=0)
+
+	class Meta:
+		unique_together = ['currency', 'address']
+		index_together = ['currency', 'parent']
+
+	def __str__(self):
+		return self.address
@@ -1,13 +1,20 @@
 import csv
 from datetime import datetime
 from decimal import Decimal
+from hashlib import sha256
+from itertools import islice
 
-from currencio.models import Currency
-from currencio.utils import convert
+from currencio.crossrates import to_reporting_currency
+from currencio.registry import registry
 
 from . import register_parser
 from ..explorers import explorers
-from ..models import Event, RecordGroup, Record
+from ..models import Event, ImportedFile, RecordGroup, Record
+
+
+# Number of rows to read, and identifiers to look up, at a time, keeping
+# well within the limit of query parameters of SQLite
+IDENTIFIER_CHUNK_SIZE = 500
 
 
 @register_parser('coinbase')
@@ -24,39 +31,50 @@ class CoinbaseParser:
 			[blank line]
 			[22 column headers]
 			[transactions]
+
+		`file_` is an iterable of the lines of the file, which is iterated
+		over twice: files parsed in full before are recognised by a hash of
+		their contents and skipped as a whole, and otherwise the rows are
+		read a chunk at a time, and the transactions in each chunk already
+		parsed (e.g. from an overlapping export) are looked up at once and
+		skipped.
 		"""
-		currency = None
-		# TODO: allow this to be set by user
-		user_currency = Currency.objects.get(ticker='AUD', fiat=True)
+		fingerprint = sha256()
+		for line in file_:
+			fingerprint.update(line.encode('utf-8'))
+		fingerprint = fingerprint.hexdigest()
+		imported = ImportedFile.objects.filter(
+			platform='coinbase', fingerprint=fingerprint).first()
+		if imported:
+			return 0, imported.rows, 0
 		transactions_parsed = 0
 		transactions_skipped = 0
 		transactions_failed = 0
 		reader = csv.reader(file_)
 		# Skip the first 5 lines that are of no use to us
 		[next(reader) for i in range(5)]
+		# Identifiers of the transactions in the file that were parsed before
+		parsed_identifiers = set()
 		# Parse the data rows
 		for timestamp, balance, amount, cryptocurrency, to_, notes, instant, \
 			transfer_amount, transfer_currency, transfer_fee, \
 			transfer_fee_currency, method, transfer_id, order_price, \
 			order_currency, order_btc, order_tracking, order_custom, \
 			order_paid, recurring, coinbase_id, blockchain_hash \
-		in reader:
+		in self._rows(reader, parsed_identifiers):
 			# Check if we've already parsed this transaction
-			if Record.objects.filter(
-				platform='coinbase', identifier=coinbase_id
-			).exists():
+			if coinbase_id in parsed_identifiers:
 				transactions_skipped += 1
 				continue
+			parsed_identifiers.add(coinbase_id)
 			timestamp = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S %z')
 			amount = Decimal(amount)
-			# Currency should stay the same, so don't re-fetch, but sanity check
-			if not currency or currency.ticker != cryptocurrency:
-				currency = Currency.objects.get(ticker=cryptocurrency, fiat=False)
-				explorer = explorers.get(currency.slug)
+			currency = registry.get(ticker=cryptocurrency, fiat=False)
+			explorer = explorers.get(currency.slug)
 			# Cryptocurrency purchase
 			if transfer_amount and amount > 0 and transfer_currency:
 				# TODO: Handle non-fiat transfer currencies (may be used in GDAX)
-				fiat = Currency.objects.get(ticker=transfer_currency, fiat=True)
+				fiat = registry.get(ticker=transfer_currency, fiat=True)
 				price = Decimal(transfer_amount) / amount
 				# Create a group to put all the records into
 				group = RecordGroup.objects.create(timestamp=timestamp)
@@ -76,7 +94,7 @@ class CoinbaseParser:
 					type=Event.ACQUISITION,
 					currency=currency,
 					amount=amount,
-					price=convert(fiat, user_currency, price, timestamp),
+					price=to_reporting_currency(fiat, price, timestamp),
 				)
 				# Create fiat expenditure record
 				record = Record.objects.create(
@@ -91,8 +109,7 @@ class CoinbaseParser:
 				)
 				# Create fee record
 				if transfer_fee and transfer_fee_currency:
-					fee_currency = Currency.objects.get(
-						ticker=transfer_currency, fiat=True)
+					fee_currency = registry.get(ticker=transfer_currency, fiat=True)
 					record = Record.objects.create(
 						group=group,
 						platform='coinbase',
@@ -195,13 +212,7 @@ class CoinbaseParser:
 						type=Event.DISPOSAL_FEE,
 						currency=currency,
 						amount=-amount - existing.amount,
-						# TODO: Let convert do the conversion to USD as well
-						price=convert(
-							Currency.objects.get(ticker='USD', fiat=True),
-							user_currency,
-							explorer.get_usd_price(timestamp),
-							timestamp,
-						)
+						price=explorer.get_price(timestamp),
 					)
 					existing.needs_event = False
 					existing.save()
@@ -213,6 +224,30 @@ class CoinbaseParser:
 			# Not a recognised type of transaction
 			else:
 				transactions_failed += 1
+				parsed_identifiers.discard(coinbase_id)
 				# TODO: log and notify
+		# Files with rows that failed to parse may be parsed again, e.g. once
+		# those are supported
+		if not transactions_failed:
+			ImportedFile.objects.create(
+				platform='coinbase',
+				fingerprint=fingerprint,
+				rows=transactions_parsed + transactions_skipped,
+			)
 		return transactions_parsed, transactions_skipped, transactions_failed
 
+	def _rows(self, reader, parsed_identifiers):
+		"""
+		Yield the rows read by `reader`, adding the identifiers of those that
+		were parsed before to `parsed_identifiers` a chunk at a time.
+		"""
+		while True:
+			rows = list(islice(reader, IDENTIFIER_CHUNK_SIZE))
+			if not rows:
+				return
+			parsed_identifiers.update(Record.objects.filter(
+				platform='coinbase',
+				identifier__in={row[20] for row in rows if len(row) > 20},
+			).values_list('identifier', flat=True))
+			yield from rows
+
@@ -1,10 +1,19 @@
 from decimal import Decimal
+from io import StringIO
+import os
+import tempfile
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-from .utils import TestBitcoinExplorer
+from currencio.registry import registry
+
+from .utils import TestBitcoinExplorer, generate_bitcoin_address
+from ..clusters import ClusterIndex
 from ..explorers import explorers
-from ..models import RecordGroup, Record, Event
+from ..models import AddressSync, RecordGroup, Record, Event
 
 
 class ParseBitcoinAddressTestCase(TestCase):
@@ -22,6 +31,13 @@ class ParseBitcoinAddressTestCase(TestCase):
 		# Replace the Bitcoin explorer with our emulated one
 		self.old_explorer = explorers['bitcoin']
 		explorers['bitcoin'] = TestBitcoinExplorer()
+		# Keep responses out of the real explorer cache
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		settings = override_settings(
+			EXPLORER_CACHE_PATH=os.path.join(directory.name, 'cache.sqlite3'))
+		settings.enable()
+		self.addCleanup(settings.disable)
 
 	def tearDown(self):
 		# Restore the original Bitcoin explorer
@@ -155,8 +171,10 @@ class ParseBitcoinAddressTestCase(TestCase):
 		# Send 7 BTC to address D, using both outputs from above, pay fee of 2
 		explorers['bitcoin'].send(outputs, [(7e8, 'd'),])
 		# Parse address B as own address
-		# TODO: Check that A is suggested as an own address
 		explorers['bitcoin'].parse_address('b')
+		# A is in the same cluster, having been spent from along with B
+		self.assertEqual(
+			ClusterIndex(explorers['bitcoin'].currency).members('b'), {'a', 'b'})
 		# Check that all expected records have been created
 		self.assertEqual(RecordGroup.objects.count(), 2)
 		self.assertEqual(Record.objects.count(), 3)
@@ -187,6 +205,72 @@ class ParseBitcoinAddressTestCase(TestCase):
 			event__price__isnull=True,
 		)
 
+	def test_parse_multiple_addresses(self):
+		# Mine 10 BTC to address A, and send 5 of it to address B
+		a = generate_bitcoin_address(None, 'a')
+		b = generate_bitcoin_address(None, 'b')
+		_, (mine_10_to_a,) = explorers['bitcoin'].send([], [(10e8, a)])
+		explorers['bitcoin'].send([mine_10_to_a], [(5e8, a), (5e8, b),])
+		# Parse both addresses at once, along with an invalid one
+		self.client.post(reverse('parse-address'), {
+			'blockchain': 'bitcoin',
+			'addresses': f'{a}\n1invalid\n{b}',
+		})
+		messages = self.client.session['results']['messages']
+		self.assertEqual([message['text'] for message in messages], [
+			'Failed to parse address 1invalid',
+			f'Parsed address {a}',
+			f'Parsed address {b}',
+		])
+		self.assertIn('Fetched and parsed 2 new transactions', messages[1]['notes'][0]['text'])
+		# The transfer to B is matched, as if the addresses were parsed in turn
+		self.assertEqual(Record.objects.count(), 5)
+		self.assertEqual(Record.objects.filter(needs_event=True).count(), 0)
+
+	def test_incremental_sync(self):
+		# Mine 10 BTC to address A twice, parsing it in between
+		mined, _ = explorers['bitcoin'].send([], [(10e8, 'a')])
+		explorers['bitcoin'].parse_address('a')
+		sync = AddressSync.objects.get(address='a')
+		self.assertEqual((sync.last_hash, sync.n_tx), (mined, 1))
+		mined, _ = explorers['bitcoin'].send([], [(10e8, 'a')])
+		# Only the new transaction is fetched when syncing incrementally
+		self.assertEqual(
+			[tx['hash'] for tx in explorers['bitcoin'].transactions_for_address('a', sync)],
+			[mined],
+		)
+		self.assertEqual((sync.last_hash, sync.n_tx), (mined, 2))
+		# Nothing new after that
+		self.assertEqual(
+			list(explorers['bitcoin'].transactions_for_address('a', sync)), [])
+		# Syncing all known addresses picks up the new transaction
+		call_command('resync_addresses', stdout=StringIO())
+		self.assertEqual(Record.objects.count(), 2)
+		self.assertEqual(AddressSync.objects.get(address='a').n_tx, 2)
+
+	def test_query_budget(self):
+		# Mine to address A 60 times, more than fits in a page
+		for _ in range(60):
+			explorers['bitcoin'].send([], [(10e8, 'a')])
+		# Currencies are looked up in the registry, once loaded
+		registry.get(slug='bitcoin')
+		# Each transaction mined gets a group, a record and an event, which
+		# are created with a query per page and model where the backend
+		# returns primary keys from bulk inserts, or one per object if not
+		if connection.features.can_return_ids_from_bulk_insert:
+			creates = 2 * 3
+		else:
+			creates = 60 * 3
+		# Loading the sync state, and saving it, in a transaction (two
+		# queries for the savepoint), and for each page, loading an index,
+		# and creating the objects in a nested transaction
+		with self.assertNumQueries(1 + 1 + 2 + 2 * (1 + 2) + creates):
+			explorers['bitcoin'].parse_address('a')
+		# Parsing again only needs to check the indexes
+		with self.assertNumQueries(1 + 1 + 2 + 2):
+			explorers['bitcoin'].parse_address('a')
+		self.assertEqual(Record.objects.count(), 60)
+
 
 """
 Parse incoming exchange transfer with tx "tx1" and amount "a1".
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from ..explorers.bitcoin import BitcoinExplorer
+
+
+class PagedBitcoinExplorer(BitcoinExplorer):
+	"""
+	Serves pages of numbered transactions for any address, slowly, keeping
+	track of the most pages being fetched at once.
+	"""
+
+	def __init__(self, n_tx):
+		self.n_tx = n_tx
+		self.fetching = self.most_fetching = 0
+		self.offsets = []
+		self._lock = threading.Lock()
+
+	def sync_states(self, addresses):
+		return {address: None for address in addresses}
+
+	def get_page(self, address, offset, n_tx=None):
+		with self._lock:
+			self.offsets += [offset]
+			self.fetching += 1
+			self.most_fetching = max(self.most_fetching, self.fetching)
+		time.sleep(0.01)
+		with self._lock:
+			self.fetching -= 1
+		return {
+			'n_tx': self.n_tx,
+			'txs': [
+				{'hash': index}
+				for index in range(offset, min(offset + self.MAX_LIMIT, self.n_tx))
+			],
+		}
+
+
+class BitcoinPaginationTestCase(SimpleTestCase):
+	"""
+	Tests for fetching the pages of an address's transactions ahead of time.
+	"""
+
+	@override_settings(EXPLORER_PREFETCH_PAGES=3)
+	def test_prefetching(self):
+		explorer = PagedBitcoinExplorer(n_tx=1020)
+		transactions = list(explorer.transactions_for_address('a'))
+		# Transactions are yielded in order, and each page is fetched once
+		self.assertEqual([tx['hash'] for tx in transactions], list(range(1020)))
+		self.assertEqual(sorted(explorer.offsets), list(range(0, 1020, 50)))
+		# Pages are fetched concurrently, but no more than asked for
+		self.assertGreater(explorer.most_fetching, 1)
+		self.assertLessEqual(explorer.most_fetching, 3)
+
+	def test_single_page(self):
+		explorer = PagedBitcoinExplorer(n_tx=10)
+		self.assertEqual(len(list(explorer.transactions_for_address('a'))), 10)
+		self.assertEqual(explorer.offsets, [0])
+
+	@override_settings(EXPLORER_PREFETCH_PAGES=1, EXPLORER_BUFFER_SIZE=10)
+	def test_bounded_buffer(self):
+		explorer = PagedBitcoinExplorer(n_tx=1020)
+		results = explorer.fetch_addresses(['a', 'b'], incremental=True, workers=2)
+		address, transactions, _ = next(results)
+		self.assertEqual(address, 'a')
+		self.assertEqual(next(transactions)['hash'], 0)
+		time.sleep(0.2)
+		# Fetching stops once the buffers are full, rather than loading the
+		# whole history of either address
+		self.assertLess(len(explorer.offsets), 10)
+		address, transactions, _ = next(results)
+		self.assertEqual(address, 'b')
+		self.assertEqual([tx['hash'] for tx in transactions], list(range(1020)))
+		self.assertRaises(StopIteration, next, results)
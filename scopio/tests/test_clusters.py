@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from currencio.models import Currency
+
+from .utils import TestBitcoinExplorer, generate_bitcoin_address
+from ..clusters import ClusterIndex
+from ..explorers import explorers
+from ..models import AddressSync, ClusteredAddress
+
+
+class ClusterTestCase(TestCase):
+	"""
+	Tests for clustering addresses spent from together, and crawling the
+	unparsed addresses of a cluster.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		# Replace the Bitcoin explorer with our emulated one
+		self.old_explorer = explorers['bitcoin']
+		explorers['bitcoin'] = TestBitcoinExplorer()
+		self.btc = Currency.objects.get(slug='bitcoin')
+
+	def tearDown(self):
+		# Restore the original Bitcoin explorer
+		explorers['bitcoin'] = self.old_explorer
+
+	def test_union_find(self):
+		clusters = ClusterIndex(self.btc)
+		clusters.union(['a', 'b'])
+		clusters.union(['c', 'd', 'e'])
+		self.assertNotEqual(clusters.find('a'), clusters.find('c'))
+		clusters.save()
+		# Merging clusters attaches the lower ranked root to the other
+		clusters = ClusterIndex(self.btc)
+		root = clusters.union(['b', 'f', 'e'])
+		self.assertEqual(root, clusters.find('c'))
+		clusters.save()
+		self.assertEqual(
+			ClusterIndex(self.btc).members('a'), {'a', 'b', 'c', 'd', 'e', 'f'})
+		# Finding an address loads it and its ancestors a level at a time,
+		# and points it directly at its root
+		clusters = ClusterIndex(self.btc)
+		with self.assertNumQueries(3):
+			self.assertEqual(clusters.find('d'), root)
+		with self.assertNumQueries(0):
+			clusters.find('d')
+		clusters.save()
+		self.assertEqual(
+			ClusteredAddress.objects.get(currency=self.btc, address='d').parent, root)
+		with self.assertNumQueries(2):
+			ClusterIndex(self.btc).find('d')
+		# Addresses never clustered are clusters of their own
+		self.assertEqual(ClusterIndex(self.btc).members('g'), {'g'})
+
+	def test_crawl(self):
+		a, b, c, d, e = (
+			generate_bitcoin_address(None, key) for key in 'abcde')
+		mined = {}
+		for address in (a, b, c):
+			_, (mined[address],) = explorers['bitcoin'].send([], [(10e8, address)])
+		# A and B are spent from together, then B's change along with C
+		_, (_, change) = explorers['bitcoin'].send(
+			[mined[a], mined[b]], [(15e8, d), (5e8, b)])
+		explorers['bitcoin'].send([change, mined[c]], [(15e8, e)])
+		# Crawling from A only reaches B at depth one
+		stdout = StringIO()
+		call_command('crawl_cluster', a, depth=1, stdout=stdout)
+		self.assertEqual(
+			set(AddressSync.objects.values_list('address', flat=True)), {a, b})
+		self.assertIn('The cluster has 3 addresses', stdout.getvalue())
+		# Crawling further skips the addresses already parsed
+		stdout = StringIO()
+		call_command('crawl_cluster', a, depth=2, stdout=stdout)
+		self.assertEqual(stdout.getvalue().count('Parsed'), 1)
+		self.assertIn(f'Parsed {c} (depth 1)', stdout.getvalue())
+		self.assertEqual(
+			ClusterIndex(self.btc).members(c), {a, b, c})
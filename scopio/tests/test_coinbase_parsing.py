@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from currencio.registry import registry
+
+from ..models import Event, ImportedFile, Record
+from ..parsers import coinbase, parsers
+
+
+HEADER = [
+	'Transactions\n',
+	'User,user@example.com,wallet\n',
+	'Account,BTC Wallet,wallet\n',
+	'\n',
+	'Timestamp,Balance,Amount,Currency,To,Notes,Instantly Exchanged,'
+	'Transfer Total,Transfer Total Currency,Transfer Fee,Transfer Fee Currency,'
+	'Transfer Payment Method,Transfer ID,Order Price,Order Currency,Order BTC,'
+	'Order Tracking Code,Order Custom Parameter,Order Paid Out,'
+	'Recurring Payment ID,Coinbase ID (visit https://www.coinbase.com/transactions/[ID] in your browser),'
+	'Bitcoin Hash (visit https://www.coinbase.com/tx/[HASH] in your browser for more info)\n',
+]
+
+
+def purchase(identifier, amount, total, fee):
+	"""
+	Return a CSV row of a purchase of `amount` BTC for `total` AUD, including
+	a fee of `fee` AUD.
+	"""
+	return (
+		f'2018-01-01 00:00:00 +0000,{amount},{amount},BTC,,,false,{total},AUD,'
+		f'{fee},AUD,Bank,transfer-{identifier},,,,,,,,{identifier},\n'
+	)
+
+
+class ParseCoinbaseFileTestCase(TestCase):
+	"""
+	Tests for the Coinbase CSV parser, checking that records are created for
+	purchases, and that transactions and files parsed before are skipped.
+	"""
+
+	fixtures = ['initial']
+
+	def test_purchases(self):
+		lines = HEADER + [purchase('a', 1, 1000, 10), purchase('b', 2, 2000, 20)]
+		registry.get(slug='bitcoin')
+		# Looking up the file and the identifiers parsed before in the only
+		# chunk of rows, creating a group, records, and an event for each
+		# purchase, and recording the file, with currencies looked up in the
+		# registry
+		with self.assertNumQueries(1 + 1 + 2 * 5 + 1):
+			self.assertEqual(parsers['coinbase'].parse_file(lines), (2, 0, 0))
+		self.assertEqual(Record.objects.count(), 6)
+		Record.objects.get(
+			identifier='b',
+			amount=Decimal(2),
+			outgoing=False,
+			event__type=Event.ACQUISITION,
+			event__price=Decimal(1000),
+		)
+		event = Event.objects.select_related('currency').first()
+		with self.assertNumQueries(0):
+			self.assertEqual(str(event), 'Acquisition: BTC 1 at A$1,000.00')
+		# The same file is skipped as a whole with a single query
+		with self.assertNumQueries(1):
+			self.assertEqual(parsers['coinbase'].parse_file(lines), (0, 2, 0))
+		# Transactions parsed before are skipped in overlapping files
+		lines += [purchase('c', 1, 1000, 10)]
+		self.assertEqual(parsers['coinbase'].parse_file(lines), (1, 2, 0))
+		self.assertEqual(Record.objects.count(), 9)
+		self.assertEqual(ImportedFile.objects.count(), 2)
+
+	def test_failed_rows(self):
+		# A transfer with neither a payment nor a blockchain hash
+		lines = HEADER + [
+			purchase('a', 1, 1000, 10),
+			'2018-01-01 00:00:00 +0000,1,1,BTC,,,false,,,,,,,,,,,,,,b,\n',
+		]
+		self.assertEqual(parsers['coinbase'].parse_file(lines), (1, 0, 1))
+		# Files aren't recorded until all their rows have been parsed
+		self.assertFalse(ImportedFile.objects.exists())
+		self.assertEqual(parsers['coinbase'].parse_file(lines), (0, 1, 1))
+		self.assertEqual(Record.objects.count(), 3)
+
+	def test_chunks(self):
+		lines = HEADER + [purchase(index, 1, 1000, 10) for index in range(3)]
+		self.addCleanup(
+			setattr, coinbase, 'IDENTIFIER_CHUNK_SIZE', coinbase.IDENTIFIER_CHUNK_SIZE)
+		coinbase.IDENTIFIER_CHUNK_SIZE = 2
+		self.assertEqual(parsers['coinbase'].parse_file(lines), (3, 0, 0))
+		ImportedFile.objects.all().delete()
+		# Identifiers parsed before are looked up a chunk of rows at a time
+		with self.assertNumQueries(1 + 2 + 1):
+			self.assertEqual(parsers['coinbase'].parse_file(lines), (0, 3, 0))
@@ -0,0 +1,88 @@
+from io import StringIO
+import os
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from ..cache import ResponseCache
+
+
+class ResponseCacheTestCase(SimpleTestCase):
+	"""
+	Tests for the on-disk cache of explorer responses.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.cache = ResponseCache(
+			path=os.path.join(directory.name, 'cache.sqlite3'),
+			max_size=10 ** 6,
+			max_age=60,
+		)
+
+	def test_hits_and_misses(self):
+		self.assertIsNone(self.cache.get('a'))
+		self.cache.set('a', {'txs': [1, 2, 3]})
+		self.assertEqual(self.cache.get('a'), {'txs': [1, 2, 3]})
+		stats = self.cache.stats()
+		self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+		self.assertEqual(stats['hit_rate'], 0.5)
+		# Reads don't wait for writes by other threads
+		self.assertEqual(
+			self.cache._connection.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+
+	def test_expiry(self):
+		self.cache.set('mutable', 1)
+		self.cache.set('immutable', 2, immutable=True)
+		# Pretend the responses were fetched a while ago
+		self.cache._connection.execute(
+			'UPDATE responses SET fetched = ?', (time.time() - 61,))
+		self.assertIsNone(self.cache.get('mutable'))
+		self.assertEqual(self.cache.get('immutable'), 2)
+
+	def test_eviction(self):
+		self.cache.set('a', list(range(1000)), immutable=True)
+		self.cache.set('b', list(range(1000)), immutable=True)
+		# Access times are only recorded once they're a while out of date
+		self.cache._connection.execute(
+			'UPDATE responses SET accessed = ?', (time.time() - 61,))
+		self.cache.get('a')
+		# Only room for two responses, so the least recently used one goes
+		self.cache.max_size = self.cache.stats()['size'] * 5 // 4
+		self.cache.set('c', list(range(1000)), immutable=True)
+		self.assertIsNone(self.cache.get('b'))
+		self.assertIsNotNone(self.cache.get('a'))
+		self.assertIsNotNone(self.cache.get('c'))
+
+	def test_size(self):
+		def size():
+			# The size summed up, which the running total should match
+			size, = self.cache._connection.execute(
+				'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+			self.assertEqual(self.cache.stats()['size'], size)
+			return size
+		self.cache.set('a', list(range(1000)))
+		self.assertGreater(size(), 0)
+		# Replacing a response counts its old size out
+		self.cache.set('a', [1])
+		self.cache.set('b', list(range(1000)))
+		self.cache.max_size = size() - 1
+		self.cache.set('c', [2])
+		self.assertIsNone(self.cache.get('a'))
+		size()
+		# Totals of existing caches are counted up when first opened
+		self.assertEqual(ResponseCache(path=self.cache.path).stats()['size'], size())
+		self.cache.clear()
+		self.assertEqual(size(), 0)
+
+	def test_command(self):
+		self.cache.set('a', [1])
+		stdout = StringIO()
+		with override_settings(EXPLORER_CACHE_PATH=self.cache.path):
+			call_command('explorer_cache_stats', stdout=stdout)
+			self.assertIn('1 responses', stdout.getvalue())
+			call_command('explorer_cache_stats', clear=True, stdout=stdout)
+		self.assertEqual(self.cache.stats()['entries'], 0)
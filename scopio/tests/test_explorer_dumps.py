@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+
+from django.test import TestCase
+
+from .utils import TestBitcoinExplorer
+from ..dumps import DumpIndex
+from ..explorers.bitcoin_file import FileBitcoinExplorer
+from ..models import Record
+
+
+class FileBitcoinExplorerTestCase(TestCase):
+	"""
+	Tests for reading transactions from local dumps through their index,
+	compared against the emulated blockchain they were dumped from.
+	"""
+
+	fixtures = ['initial']
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'transactions.ndjson')
+		self.index = DumpIndex(os.path.join(directory.name, 'index.sqlite3'))
+		self.explorer = FileBitcoinExplorer(self.index)
+		self.blockchain = TestBitcoinExplorer()
+		self.dumped = set()
+
+	def dump(self):
+		"""
+		Append the transactions of the emulated blockchain that haven't been
+		dumped yet to the dump, oldest first, and index it.
+		"""
+		transactions = {}
+		for address_transactions in self.blockchain._addresses.values():
+			for transaction in reversed(address_transactions):
+				if transaction['hash'] not in self.dumped:
+					transactions[transaction['hash']] = transaction
+		with open(self.path, 'a') as file:
+			for transaction in transactions.values():
+				file.write(json.dumps(transaction) + '\n')
+		self.dumped |= transactions.keys()
+		return dict(self.index.build([self.path]))[self.path]
+
+	def test_transactions_for_address(self):
+		_, (mined,) = self.blockchain.send([], [(10e8, 'a')])
+		for _ in range(self.explorer.MAX_LIMIT):
+			_, (_, mined) = self.blockchain.send(
+				[mined], [(1e8, 'b'), (mined['value'] - 1e8, 'a')])
+		self.assertEqual(self.dump(), self.explorer.MAX_LIMIT + 1)
+		for address in ('a', 'b'):
+			self.assertEqual(
+				list(self.explorer.transactions_for_address(address)),
+				list(self.blockchain.transactions_for_address(address)),
+			)
+		self.assertEqual(
+			self.explorer.get_page('b', 10),
+			self.blockchain.get_page('b', 10),
+		)
+		# Only appended transactions are indexed again
+		self.blockchain.send([mined], [(1e8, 'c')])
+		self.assertEqual(self.dump(), 1)
+		self.assertEqual(self.dump(), 0)
+		self.assertEqual(
+			self.explorer.get_page('a', 0)['n_tx'], self.explorer.MAX_LIMIT + 2)
+		self.assertEqual(self.index.stats()['addresses'], 3)
+
+	def test_parse_address(self):
+		_, (mined,) = self.blockchain.send([], [(10e8, 'a')])
+		self.blockchain.send([mined], [(4e8, 'a'), (5e8, 'b')])
+		self.dump()
+		self.explorer.parse_address('a')
+		self.assertEqual(Record.objects.count(), 5)
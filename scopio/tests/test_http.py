@@ -0,0 +1,72 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import time
+
+from django.test import SimpleTestCase
+import requests
+
+from cryptoscopio.http import HTTPClient
+from cryptoscopio.testing import start_stub_server
+
+
+class StubHandler(BaseHTTPRequestHandler):
+	"""
+	Responds to GET requests with the JSON-encoded path, after failing with a
+	503 as many times as the server's `failures` says, and records the
+	client port of each request to tell connections apart.
+	"""
+
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		self.server.ports += [self.client_address[1]]
+		if self.server.failures > 0:
+			self.server.failures -= 1
+			self.send_response(503)
+			self.send_header('Content-Length', '0')
+			self.end_headers()
+			return
+		body = json.dumps({'path': self.path}).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class HTTPClientTestCase(SimpleTestCase):
+	"""
+	Tests for the shared HTTP client, against a local stub server.
+	"""
+
+	def setUp(self):
+		self.server = start_stub_server(self, StubHandler, ports=[], failures=0)
+		self.url = self.server.url
+
+	def test_connection_pooling(self):
+		client = HTTPClient(rate_limits={})
+		for index in range(5):
+			self.assertEqual(
+				client.get_json(f'{self.url}/{index}'), {'path': f'/{index}'})
+		# All requests went through the same connection
+		self.assertEqual(len(set(self.server.ports)), 1)
+
+	def test_retries(self):
+		client = HTTPClient(retries=2, backoff=0.01, rate_limits={})
+		self.server.failures = 2
+		self.assertEqual(client.get_json(f'{self.url}/a'), {'path': '/a'})
+		self.assertEqual(len(self.server.ports), 3)
+		self.server.failures = 3
+		with self.assertRaises(requests.exceptions.RetryError):
+			client.get_json(f'{self.url}/a')
+
+	def test_rate_limit(self):
+		# Bursts of two requests, then one every 50ms
+		client = HTTPClient(rate_limits={'127.0.0.1': (20, 2)})
+		started = time.monotonic()
+		for _ in range(6):
+			client.get(self.url)
+		self.assertGreaterEqual(time.monotonic() - started, 0.2)
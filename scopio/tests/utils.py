@@ -24,7 +24,7 @@ def generate_bitcoin_address(self, key):
 	SHA-256 hash instead.
 	"""
 	# Get a 20-byte hash of the key and append the version byte
-	address = b'\x00' + sha256(key.encode('utf-8').digest()[:20]
+	address = b'\x00' + sha256(key.encode('utf-8')).digest()[:20]
 	# Calculate and append the checksum
 	address += sha256(sha256(address).digest()).digest()[:4]
 	# Count leading zeroes
@@ -45,9 +45,9 @@ def generate_bitcoin_address(self, key):
 class TestBitcoinExplorer(BitcoinExplorer):
 	"""
 	Provides an emulated Bitcoin blockchain where arbitrary transactions can
-	be added for testing purposes. Overrides `transactions_for_address` method
-	to return those transactions in the same manner as `BitcoinExplorer` would,
-	i.e. using the same key names as the blockchain.info API JSON dicts.
+	be added for testing purposes. Overrides `get_page` method to return pages
+	of those transactions in the same manner as the blockchain.info API would,
+	i.e. using the same key names as its JSON dicts.
 	"""
 
 	def __init__(self):
@@ -62,8 +62,6 @@ class TestBitcoinExplorer(BitcoinExplorer):
 		and creates a transaction spending the input to generate the outputs.
 		Returns the transaction hash and a list of generated outputs.
 		"""
-		# Pretend it's yesterday so real-time price look-ups don't fail.
-		# TODO: Remove this once we're no longer using real-time lookups
 		timestamp = (now() - timedelta(1)).timestamp()
 		# We rely on transaction being mutable, since we continue modifying it
 		# after adding it to the transaction lists for the addresses involved
@@ -87,6 +85,10 @@ class TestBitcoinExplorer(BitcoinExplorer):
 			sha256(json.dumps(transaction).encode('utf-8')).hexdigest()
 		return transaction['hash'], transaction['out']
 
-	def transactions_for_address(self, address):
-		return self._addresses[address]
+	def get_page(self, address, offset, n_tx=None):
+		transactions = self._addresses[address]
+		return {
+			'n_tx': len(transactions),
+			'txs': transactions[offset:offset + self.MAX_LIMIT],
+		}
 
@@ -1,9 +1,164 @@
+from collections import defaultdict
 import codecs
 import io
+import sqlite3
+import threading
 
+from django.db import connection, transaction
 
-def wrap_uploaded_file(file_):
-	for chunk in file_.chunks():
-		for line in codecs.getreader('utf-8')(io.BytesIO(chunk)):
-			yield line
+from .models import Event, Record, RecordGroup
 
+
+class SQLiteConnections:
+	"""
+	Connections to SQLite databases, one per thread and path, since SQLite
+	connections can't be shared between threads. `setup` is called with
+	each new connection, e.g. to create tables that don't exist yet.
+
+	Databases are put in write-ahead log mode, so that reads don't wait for
+	writes by other threads or processes.
+	"""
+
+	def __init__(self, setup):
+		self.setup = setup
+		self._local = threading.local()
+
+	def get(self, path):
+		connections = self._local.__dict__.setdefault('connections', {})
+		if path not in connections:
+			connection = sqlite3.connect(path, timeout=30)
+			connection.execute('PRAGMA journal_mode = WAL')
+			self.setup(connection)
+			connections[path] = connection
+		return connections[path]
+
+
+class UploadedFileLines:
+	"""
+	The lines of an uploaded file, decoded as UTF-8, which can be iterated
+	over more than once without reading the whole file into memory.
+	"""
+
+	def __init__(self, file_):
+		self.file = file_
+
+	def __iter__(self):
+		# Chunks are read from the start of the file each time
+		for chunk in self.file.chunks():
+			for line in codecs.getreader('utf-8')(io.BytesIO(chunk)):
+				yield line
+
+
+class RecordIndex:
+	"""
+	In-memory index of the record groups involving any of the provided
+	transaction hashes and all of their records, loaded with a single query,
+	so that transactions can be matched against existing records without
+	querying for each one. Records created while matching need to be added
+	with `add` to be taken into account.
+	"""
+
+	def __init__(self, hashes):
+		self._groups = {}
+		# Records by group, keyed by the identity of the group instance, since
+		# groups yet to be written to the database have no primary key
+		self._records = {}
+		self._transactions = defaultdict(list)
+		loaded = {}
+		for record in Record.objects.filter(
+			group__in=RecordGroup.objects.filter(records__transaction__in=set(hashes)),
+		).select_related('group').order_by('timestamp', 'pk'):
+			# Share a single instance per group
+			record.group = loaded.setdefault(record.group_id, record.group)
+			self.add(record)
+		# A transaction belongs to the earliest group with a record of it
+		for records in self._transactions.values():
+			for record in records:
+				group = self._groups.get(record.transaction)
+				if not group or (record.group.timestamp, record.group.pk) \
+				< (group.timestamp, group.pk):
+					self._groups[record.transaction] = record.group
+
+	def add(self, record):
+		self.records(record.group).append(record)
+		if record.transaction:
+			self._transactions[record.transaction] += [record]
+			self._groups.setdefault(record.transaction, record.group)
+
+	def group(self, transaction):
+		"""
+		Return the record group of the transaction with provided hash, or
+		None if there are no records of it.
+		"""
+		return self._groups.get(transaction)
+
+	def records(self, group):
+		"""
+		Return the records in the provided group, ordered by time.
+		"""
+		return self._records.setdefault(id(group), (group, []))[1]
+
+	def transaction_records(self, transaction):
+		"""
+		Return the records of the transaction with provided hash in any
+		group, ordered by time.
+		"""
+		return self._transactions[transaction]
+
+
+class RecordWriter:
+	"""
+	Unit of work collecting new record groups, records and events, and
+	changes to existing ones, to write them all at once with bulk queries in
+	a single transaction when flushed.
+
+	New objects only get primary keys when flushed, but may reference each
+	other before then.
+	"""
+
+	def __init__(self):
+		self._created = {RecordGroup: [], Record: [], Event: []}
+		self._updated = defaultdict(dict)
+
+	def add(self, obj):
+		"""
+		Add a new group, record or event to be created, and return it.
+		"""
+		self._created[type(obj)].append(obj)
+		return obj
+
+	def update(self, obj, *fields):
+		"""
+		Mark the provided fields of an object as changed, to be saved. New
+		objects are created with their latest values anyway.
+		"""
+		if obj.pk is not None:
+			self._updated[(type(obj), fields)][obj.pk] = obj
+
+	def flush(self):
+		if not any(self._created.values()) and not self._updated:
+			return
+		with transaction.atomic():
+			self._create(RecordGroup)
+			for record in self._created[Record]:
+				record.group_id = record.group.pk
+			self._create(Record)
+			for event in self._created[Event]:
+				event.record_id = event.record.pk
+			self._create(Event)
+			for (model, fields), objects in self._updated.items():
+				model.objects.bulk_update(objects.values(), fields)
+		self.__init__()
+
+	def _create(self, model):
+		objects = self._created[model]
+		if not objects:
+			return
+		if not connection.features.can_return_ids_from_bulk_insert:
+			# The primary keys are needed for the objects referencing these,
+			# but bulk inserts don't set them on this backend, so insert the
+			# objects one at a time instead.
+			for obj in objects:
+				obj.save(force_insert=True)
+			return
+		model.objects.bulk_create(objects)
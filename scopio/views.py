@@ -1,3 +1,5 @@
+import time
+
 from django import forms
 from django.http import HttpResponseNotAllowed
 from django.shortcuts import redirect
@@ -9,7 +11,7 @@ from currencio.models import Currency
 from .explorers import explorers
 from .models import RecordGroup
 from .parsers import parsers
-from .utils import wrap_uploaded_file
+from .utils import UploadedFileLines
 
 
 class ParseAddressForm(forms.Form):
@@ -35,6 +37,7 @@ class ParseAddressView(FormView):
 			explorer = explorers[form.cleaned_data['blockchain']]
 			# Separate multiple addresses and discard whitespace
 			addresses = filter(bool, form.cleaned_data['addresses'].split())
+			valid = []
 			for address in addresses:
 				error = explorer.validate_address(address)
 				if error:
@@ -47,8 +50,35 @@ class ParseAddressView(FormView):
 						}]
 					}]
 					continue
-				# TODO: Wrap in transaction control
-				explorer.parse_address(address)
+				valid += [address]
+			# Transactions are fetched concurrently, but parsed one address at
+			# a time in the order provided, so matching is deterministic
+			for address, transactions, sync \
+			in explorer.fetch_addresses(valid, incremental=True):
+				started = time.monotonic()
+				try:
+					if isinstance(transactions, Exception):
+						raise transactions
+					parsed = explorer.parse_address(address, transactions, sync)
+				except Exception as e:
+					results['messages'] += [{
+						'type': 'error',
+						'text': f'Failed to parse address {address}',
+						'notes': [{
+							'type': 'info',
+							'text': f'Fetching transactions failed: {e}',
+						}]
+					}]
+					continue
+				results['messages'] += [{
+					'type': 'info',
+					'text': f'Parsed address {address}',
+					'notes': [{
+						'type': 'success',
+						'text': f'Fetched and parsed {parsed} new transactions '
+							f'in {time.monotonic() - started:.2f}s',
+					}]
+				}]
 		else:
 			# Since we know what the possible errors are, show a more 
 			# user-friendly message instead of what's in `form.errors`.
@@ -89,7 +119,7 @@ class UploadRecordsView(FormView):
 					# Parse the file using the selected platform parser
 					# TODO: Wrap in transaction control
 					parsed, skipped, failed = \
-						parser.parse_file(wrap_uploaded_file(record))
+						parser.parse_file(UploadedFileLines(record))
 					# Construct message to show the user about the outcome
 					message = {
 						'type': 'info',